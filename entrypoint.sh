@@ -1,7 +1,8 @@
 #!/bin/sh
 
 # Apply database migrations
-python manage.py migrate
+# (--fake-initial: tables that already exist from before 0001_initial are marked applied, not recreated)
+python manage.py migrate --fake-initial
 
 # Start Gunicorn server
 gunicorn project4.wsgi:application --bind 0.0.0.0:8000
@@ -1,2 +1,34 @@
+import os
+import shutil
+
 bind = "0.0.0.0:8000"
-workers = 3
\ No newline at end of file
+workers = int(os.getenv("GUNICORN_WORKERS", "3"))
+
+# ASYNC_MODE=1 → uvicorn 워커 + project4.asgi
+# (async 뷰가 GPU 응답을 기다리는 동안 한 프로세스가 수백 개의 요청을 동시에 붙잡을 수 있음)
+if os.getenv("ASYNC_MODE", "0") == "1":
+    wsgi_app = "project4.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+    timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))
+else:
+    wsgi_app = "project4.wsgi:application"
+
+# /metrics: 워커마다 다른 프로세스라 prometheus_client multiprocess 모드로 합산한다
+# (워커가 prometheus_client 를 import 하기 전에 환경 변수가 있어야 하므로 마스터에서 설정)
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/llmproxy-metrics")
+
+
+def on_starting(server):
+    # 이전 실행의 워커 파일이 남아 있으면 카운터가 이어 붙으므로 비우고 시작
+    # (web 전용 디렉터리만. run_jobs 컨테이너의 디렉터리는 METRICS_EXTRA_DIRS 로 읽기만 한다)
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+    except ImportError:
+        pass
@@ -5,3 +5,12 @@ class LlmproxyConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "llm_integration.llmproxy"
     label = "llmproxy"
+
+    def ready(self):
+        # 요청별 DB 시간/쿼리 수 집계 (ServerTimingMiddleware)
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+        from .utils.timing import install_db_wrapper
+        connection_created.connect(install_db_wrapper, dispatch_uid="llmproxy_timing_db")
+        for conn in connections.all(initialized_only=True):
+            install_db_wrapper(None, conn)
@@ -0,0 +1,144 @@
+# 04_project/llm_integration/llmproxy/idempotency.py
+"""
+chat_send / chat_send_stream 멱등 키 (Idempotency-Key 헤더 또는 idempotency_key 폼 필드).
+- 처음 요청: IdempotencyKey 행(pending)을 만들고 턴을 진행, 끝나면 응답 JSON을 저장(done)
+  (스트림은 done 이벤트 내용을 저장, 재전송 시 meta/token/done 으로 다시 흘려 보낸다)
+- 진행 중인 중복: DB를 폴링하며 첫 요청의 결과를 기다린다(gunicorn 워커가 달라도 같은 행을 봄) → LLM 재호출 없음
+- 끝난 중복: IDEMPOTENCY_TTL 동안 저장된 응답을 그대로 재전송 (Idempotent-Replayed: true)
+- 같은 키로 다른 내용을 보내면 IdempotencyConflict("key_reused") → 422
+- 첫 요청이 실패(429/503/예외, LLM 호출 실패로 끝난 턴)하면 행을 지워 클라이언트가 같은 키로 재시도할 수 있게 한다
+- 만료된 행은 purge_expired() 가 주기적으로(run_jobs) 지운다. 요청 경로에서는 같은 키의 만료 행만 지운다
+"""
+import asyncio
+import hashlib
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 128
+
+
+class IdempotencyConflict(Exception):
+    """key_reused: 같은 키, 다른 요청 / in_progress: 첫 요청이 IDEMPOTENCY_WAIT 안에 끝나지 않음."""
+    def __init__(self, reason: str, retry_after: int = 0):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def request_key(request):
+    """헤더 우선, 없으면 폼 필드. 없거나 너무 길면 None (멱등 처리 없이 진행)."""
+    key = (request.headers.get(HEADER) or request.POST.get("idempotency_key") or "").strip()
+    return key if 0 < len(key) <= MAX_KEY_LENGTH else None
+
+
+def fingerprint(conv_id, content: str) -> str:
+    return hashlib.sha256(f"{conv_id or ''}\n{content}".encode("utf-8")).hexdigest()
+
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, "IDEMPOTENCY_TTL", 24 * 3600)))
+
+
+def _try_create(user_id, key: str, fp: str):
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user_id=user_id, key=key, fingerprint=fp, expires_at=now + _ttl())
+    except IntegrityError:
+        return None
+
+
+def _claim_steps(user_id, key: str, fp: str):
+    """
+    sync/async 공용 절차: 기다릴 초를 yield, 끝나면 (record, None) 또는 (None, 저장된 응답)을 return.
+    record 를 받은 쪽이 턴을 진행하고 finish()/release() 해야 한다.
+    """
+    wait = float(getattr(settings, "IDEMPOTENCY_WAIT", 150))
+    stale = float(getattr(settings, "IDEMPOTENCY_PENDING_TIMEOUT", 300))
+    deadline = time.monotonic() + wait
+    delay = 0.05
+    while True:
+        rec = _try_create(user_id, key, fp)
+        if rec is not None:
+            return rec, None
+        rec = IdempotencyKey.objects.filter(user_id=user_id, key=key).first()
+        if rec is None:
+            continue  # 방금 만료/해제됨 → 다시 잡아 본다
+        now = timezone.now()
+        if rec.expires_at <= now:
+            IdempotencyKey.objects.filter(pk=rec.pk, expires_at__lte=now).delete()
+            continue  # 만료된 키는 새 요청으로
+        if rec.fingerprint != fp:
+            raise IdempotencyConflict("key_reused")
+        if rec.status == "done":
+            return None, rec.response
+        if rec.updated_at < now - timedelta(seconds=stale):
+            # 처리하던 워커가 죽은 것으로 보고 넘겨받는다(compare-and-set)
+            if IdempotencyKey.objects.filter(pk=rec.pk, status="pending", updated_at=rec.updated_at).update(updated_at=now):
+                rec.updated_at = now
+                return rec, None
+            continue
+        if time.monotonic() > deadline:
+            raise IdempotencyConflict("in_progress", retry_after=5)
+        yield delay
+        delay = min(1.0, delay * 2)
+
+
+def _advance(steps):
+    """(기다릴 초, None) 또는 (None, 결과). StopIteration 은 sync_to_async 경계를 넘지 못하므로 여기서 푼다."""
+    try:
+        return next(steps), None
+    except StopIteration as stop:
+        return None, stop.value
+
+
+def claim(user_id, key: str, fp: str):
+    steps = _claim_steps(user_id, key, fp)
+    while True:
+        delay, result = _advance(steps)
+        if delay is None:
+            return result
+        time.sleep(delay)
+
+
+async def aclaim(user_id, key: str, fp: str):
+    steps = _claim_steps(user_id, key, fp)
+    while True:
+        delay, result = await sync_to_async(_advance)(steps)
+        if delay is None:
+            return result
+        await asyncio.sleep(delay)
+
+
+def finish(rec, status_code: int, body: dict, outcome: str = "ok"):
+    """
+    성공한 턴이면 응답을 저장(done), 아니면 행을 지워 같은 키로 다시 시도할 수 있게.
+    outcome="error": 200 이어도 "LLM error: ..." 로 끝난 턴 → 저장해서 24시간 재전송하면 안 된다.
+    """
+    if rec is None:
+        return
+    if status_code == 200 and outcome != "error":
+        IdempotencyKey.objects.filter(pk=rec.pk).update(
+            status="done", response=body, updated_at=timezone.now(), expires_at=timezone.now() + _ttl(),
+        )
+    else:
+        release(rec)
+
+
+def release(rec):
+    if rec is not None:
+        IdempotencyKey.objects.filter(pk=rec.pk, status="pending").delete()
+
+
+def purge_expired() -> int:
+    """만료된 키 삭제 (run_jobs 가 JOB_PURGE_INTERVAL 마다 호출)."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
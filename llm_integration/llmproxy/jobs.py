@@ -0,0 +1,250 @@
+# 04_project/llm_integration/llmproxy/jobs.py
+"""
+BackgroundJob 큐 API.
+- enqueue(): 뷰에서 작업 등록
+- claim_next() / run_job(): run_jobs 매니지먼트 커맨드(워커)가 호출
+- 실패 시 지수 백오프로 max_attempts 까지 재시도
+"""
+import os
+import random
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BackgroundJob, Conversation, Message, PdfDocument, PdfExtraction, PdfIndex
+from .utils import metrics
+from .utils.admission import AdmissionRejected, get_admission
+from .utils.endpoints import configured_bases
+from .utils.llm_client import LLMClient, extract_answer
+from .utils.pdf_to_md import pdf_bytes_to_markdown
+from .utils.storage import download_to_tempfile
+from .utils.timing import span
+
+
+class RetryableJobError(Exception):
+    """재시도하면 성공할 수 있는 실패(네트워크/업스트림 오류 등)."""
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(kind: str, conversation=None, payload=None, *, max_attempts: int = None) -> BackgroundJob:
+    return BackgroundJob.objects.create(
+        kind=kind,
+        conversation=conversation,
+        payload=payload or {},
+        max_attempts=max_attempts or int(getattr(settings, "JOB_MAX_ATTEMPTS", 3)),
+    )
+
+
+def claim_next(worker: str, kinds=None):
+    """
+    실행할 작업 하나를 잡는다. 여러 워커가 동시에 돌아도 같은 작업을 잡지 않도록
+    SELECT ... FOR UPDATE SKIP LOCKED 로 행을 잠근 뒤 running 으로 바꾼다.
+    lock_timeout 이 지난 running 작업(워커가 죽은 경우)도 다시 가져온다.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=int(getattr(settings, "JOB_LOCK_TIMEOUT", 600)))
+    with transaction.atomic():
+        qs = BackgroundJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status="queued", run_after__lte=now) | Q(status="running", locked_at__lt=stale)
+        )
+        if kinds:
+            qs = qs.filter(kind__in=kinds)
+        job = qs.order_by("run_after", "id").first()
+        if job is None:
+            return None
+        job.status = "running"
+        job.attempts += 1
+        job.locked_by = worker
+        job.locked_at = now
+        job.save(update_fields=["status", "attempts", "locked_by", "locked_at", "updated_at"])
+    return job
+
+
+def run_inline(job: BackgroundJob) -> BackgroundJob:
+    """워커 없이 현재 스레드에서 바로 실행(JOBS_RUN_INLINE=1, 로컬 개발용). 재시도는 워커 몫."""
+    job.status = "running"
+    job.attempts += 1
+    job.locked_by = worker_id()
+    job.locked_at = timezone.now()
+    job.save(update_fields=["status", "attempts", "locked_by", "locked_at", "updated_at"])
+    return run_job(job)
+
+
+def _backoff_seconds(attempts: int) -> float:
+    base = float(getattr(settings, "JOB_RETRY_BASE_SECONDS", 5))
+    return min(300.0, base * (2 ** (attempts - 1))) * random.uniform(0.8, 1.2)
+
+
+def run_job(job: BackgroundJob) -> BackgroundJob:
+    handler = HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"unknown job kind: {job.kind}")
+        if job.attempts > job.max_attempts:
+            # 워커가 죽어 lock_timeout 으로 회수된 작업이 한도를 넘긴 경우
+            raise RuntimeError("max attempts exceeded")
+        job.result = handler(job) or {}
+        job.status = "done"
+        job.last_error = ""
+    except Exception as e:
+        job.last_error = f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}"[:4000]
+        if isinstance(e, RetryableJobError) and job.attempts < job.max_attempts:
+            job.status = "queued"
+            job.run_after = timezone.now() + timedelta(seconds=_backoff_seconds(job.attempts))
+        else:
+            job.status = "failed"
+    job.locked_by = ""
+    job.locked_at = None
+    job.save(update_fields=["status", "result", "last_error", "run_after", "locked_by", "locked_at", "updated_at"])
+    return job
+
+
+# ---------------------------
+# handlers
+# ---------------------------
+def _open_upload(key: str):
+    try:
+        return download_to_tempfile(key)
+    except Exception as e:
+        raise RetryableJobError(f"s3 read failed: {e}") from e
+
+
+def process_pdf_upload(job: BackgroundJob) -> dict:
+    """
+    업로드된 PDF 후처리: S3 원본 → Markdown 추출(PdfDocument) → 로컬 BM25 인덱스(PdfIndex) → RunPod /v1/ingest.
+    원본은 임시 파일로 한 번만 스트리밍 다운로드하고, 추출(경로)과 인덱싱(파일 객체)이 같은 사본을 읽는다.
+    재시도 시 이미 끝난 추출은 건너뛴다.
+    """
+    p = job.payload
+    conv = Conversation.objects.get(pk=job.conversation_id)
+    need_extract = not conv.document_id
+    need_ingest = bool(configured_bases())  # RUNPOD_API_BASES 만 설정한 배포도 포함
+    if not need_extract:
+        # 추출 캐시 적중/재시도: 인덱스도 문서 단위라 보통 이미 있다
+        PdfIndex.build(conv.document)
+    if not (need_extract or need_ingest):
+        return {"document_id": conv.document_id, "ingest_ok": False}
+
+    ingest_ok = False
+    with _open_upload(p["s3_key"]) as src:
+        if need_extract:
+            with span("pdf_extract"), metrics.time_extract():
+                markdown = pdf_bytes_to_markdown(src.name)
+            conv.document = PdfDocument.store(markdown)
+            conv.save(update_fields=["document", "updated_at"])
+            if p.get("source_sha256"):
+                # 다음 번 같은 PDF 업로드는 추출을 건너뛰도록 캐시에 기록
+                PdfExtraction.objects.get_or_create(
+                    source_sha256=p["source_sha256"],
+                    defaults={
+                        "document": conv.document,
+                        "s3_key": p["s3_key"],
+                        "owner_id": p.get("owner_id"),
+                        "source_size": p.get("source_size") or os.fstat(src.fileno()).st_size,
+                    },
+                )
+            # 원격 인덱싱이 실패해도 질문별 청크를 고를 수 있도록 ingest 전에 만든다
+            with span("bm25_index"):
+                PdfIndex.build(conv.document)
+
+        if need_ingest:
+            src.seek(0)
+            try:
+                j = LLMClient().ingest(p.get("file_name") or "upload.pdf", src,
+                                       user_id=p["user_id"], session_id=str(conv.id))
+            except Exception as e:
+                raise RetryableJobError(f"ingest failed: {e}") from e
+            ingest_ok = bool(j.get("ok"))
+
+    # 인덱싱이 성공했으면 system 첨부는 안 해도 되니 True로
+    if ingest_ok:
+        Conversation.objects.filter(pk=conv.pk).update(pdf_context_attached=True, updated_at=timezone.now())
+    return {"document_id": conv.document_id, "ingest_ok": ingest_ok}
+
+
+SUMMARY_PROMPT = (
+    "너는 대화 요약기다. 기존 요약과 이어지는 대화를 합쳐 하나의 요약으로 갱신하라. "
+    "사용자의 목표, 확정된 사실/결정, 아직 답하지 않은 질문을 한국어 불릿으로 간결하게 남기고, "
+    "인사말이나 중복은 버린다."
+)
+
+
+def summary_keep() -> int:
+    """요약하지 않고 원문 그대로 보낼 최근 메시지 수."""
+    return int(getattr(settings, "CONVERSATION_SUMMARY_KEEP", 6))
+
+
+def maybe_enqueue_summary(conv: Conversation):
+    """
+    요약 이후 쌓인 메시지가 KEEP + EVERY 개를 넘으면 summarize 작업을 건다(대화당 대기 작업 1개).
+    _finish_turn 에서 매 턴 호출 — 조건 확인은 (conversation, id) 인덱스 범위 카운트 한 번.
+    """
+    every = int(getattr(settings, "CONVERSATION_SUMMARY_EVERY", 6))
+    if every <= 0:
+        return None
+    pending = Message.objects.filter(conversation=conv, id__gt=conv.summary_upto_id).count()
+    if pending < summary_keep() + every:
+        return None
+    if BackgroundJob.objects.filter(conversation=conv, kind="summarize", status__in=("queued", "running")).exists():
+        return None
+    return enqueue("summarize", conv, {})
+
+
+def summarize_conversation(job: BackgroundJob) -> dict:
+    """
+    최근 KEEP 개를 뺀, 아직 요약에 없는 메시지를 기존 요약에 접어 넣는다.
+    갱신은 summary_upto_id 가 읽은 값 그대로일 때만(동시에 돈 작업과 덮어쓰기 방지).
+    """
+    conv = Conversation.objects.get(pk=job.conversation_id)
+    recent = list(conv.messages.order_by("-id").values_list("id", flat=True)[:summary_keep()])
+    if len(recent) < summary_keep():
+        return {"summarized": 0}
+    limit = int(getattr(settings, "CONVERSATION_SUMMARY_MAX_MESSAGES", 40))
+    new = list(conv.messages.filter(id__gt=conv.summary_upto_id, id__lt=min(recent)).order_by("id")[:limit])
+    if not new:
+        return {"summarized": 0}
+
+    # 긴 답변(코드/문서 인용)은 앞부분만 — 요약 프롬프트 크기를 묶어 둔다
+    lines = "\n".join(f"[{m.role}] {m.content[:1500]}" for m in new)
+    prompt = [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"기존 요약:\n{conv.summary or '(없음)'}\n\n이어지는 대화:\n{lines}"},
+    ]
+    # 채팅 턴과 같은 GPU → 같은 admission 을 거친다. 작업 전체가 키 하나(JOB_ADMISSION_KEY)라
+    # ADMISSION_PER_USER 개까지만 동시에 돌고, 자리가 없으면 기다리지 않고 나중에 다시 (대화형 요청 우선)
+    try:
+        with get_admission().admit(getattr(settings, "JOB_ADMISSION_KEY", "jobs"), wait=False):
+            result = LLMClient().chat(
+                prompt,
+                user_id=str(conv.user_id or "anon"),
+                session_id=f"summary-{conv.id}",  # 채팅 세션의 RunPod 인덱스/메모리와 섞이지 않도록
+                max_tokens=int(getattr(settings, "CONVERSATION_SUMMARY_MAX_TOKENS", 400)),
+                temperature=0.2,
+                k_internal=0,
+            )
+    except AdmissionRejected as e:
+        raise RetryableJobError(f"gpu busy: {e.reason}") from e
+    except Exception as e:
+        raise RetryableJobError(f"summary failed: {e}") from e
+    summary = extract_answer(result).strip()
+    if not summary:
+        raise RetryableJobError("empty summary")
+
+    updated = Conversation.objects.filter(pk=conv.pk, summary_upto_id=conv.summary_upto_id).update(
+        summary=summary, summary_upto_id=new[-1].id
+    )
+    return {"summarized": len(new), "summary_upto_id": new[-1].id, "updated": bool(updated)}
+
+
+HANDLERS = {
+    "pdf_upload": process_pdf_upload,
+    "summarize": summarize_conversation,
+}
@@ -0,0 +1,127 @@
+import json
+import os
+import subprocess
+from contextlib import ExitStack
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from llm_integration.llmproxy.management.commands.bench_pdf_extract import make_synthetic_pdf
+from llm_integration.llmproxy.utils import fake_runpod, loadtest, resilience
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test chat_send / chat_history / conversations_list / file_upload against a local RunPod stand-in; "
+        "reports p50/p95/p99 latency and throughput per concurrency level and saves JSON for regression checks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+        parser.add_argument("--duration", type=float, default=20.0, help="Seconds per concurrency level.")
+        parser.add_argument("--requests", type=int, default=None, help="Total requests per level (overrides --duration).")
+        parser.add_argument("--mix", default="", help="e.g. chat_send=4,chat_history=3,conversations_list=2,file_upload=1")
+        parser.add_argument("--users", type=int, default=None, help="Distinct accounts (default: max concurrency).")
+        parser.add_argument("--pdf-pages", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--target", default="", help="Drive a running server over HTTP instead of in-process.")
+        parser.add_argument("--cookie", default="", help="With --target: 'sessionid=...; csrftoken=...' of a logged-in user.")
+        parser.add_argument("--runpod-base", default="", help="Use this upstream instead of starting the stand-in.")
+        parser.add_argument("--label", default="")
+        parser.add_argument("--out", default="bench_results", help="Directory for result JSON.")
+        parser.add_argument("--compare", default="", help="Baseline result JSON to compare against.")
+        parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent.")
+        parser.add_argument("--fail-on-regression", action="store_true")
+        fake_runpod.add_arguments(parser)
+
+    def handle(self, *args, **opts):
+        try:
+            mix = loadtest.parse_mix(opts["mix"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if opts["target"] and not opts["cookie"]:
+            raise CommandError("--target needs --cookie of a logged-in session")
+        pdf = make_synthetic_pdf(opts["pdf_pages"]) if "file_upload" in mix else b""
+
+        with ExitStack() as stack:
+            fake = None
+            if not opts["runpod_base"] and not opts["target"]:
+                fake = stack.enter_context(fake_runpod.FakeRunPod(fake_runpod.config_from_options(opts)))
+            upstream = opts["runpod_base"] or (fake.base_url if fake else "(server config)")
+            if opts["target"]:
+                make_driver = self._http_drivers(opts)
+            else:
+                make_driver = self._in_process_drivers(stack, opts, upstream)
+            self.stdout.write(f"upstream={upstream} mix={mix} target={opts['target'] or 'in-process'}")
+
+            levels = []
+            for concurrency in opts["concurrency"]:
+                resilience.reset_all()
+                level = loadtest.run_level(make_driver, mix, concurrency, duration=opts["duration"],
+                                           requests=opts["requests"], pdf_bytes=pdf, seed=opts["seed"])
+                levels.append(level)
+                self._print_level(level)
+            fake_requests = dict(fake.requests) if fake else None
+
+        result = {
+            "label": opts["label"],
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "git_rev": _git_rev(),
+            "config": {
+                "mix": mix, "duration": opts["duration"], "requests": opts["requests"],
+                "target": opts["target"] or "in-process", "upstream": upstream,
+                "fake_runpod": fake.config.to_dict() if fake else None, "fake_requests": fake_requests,
+            },
+            "levels": levels,
+        }
+        path = self._save(result, opts["out"], opts["label"])
+        self.stdout.write(self.style.SUCCESS(f"saved {path}"))
+
+        if opts["compare"]:
+            with open(opts["compare"], encoding="utf-8") as fh:
+                baseline = json.load(fh)
+            rows = loadtest.compare(result, baseline, opts["threshold"])
+            regressions = [r for r in rows if r["regression"]]
+            for r in rows:
+                line = (f"c={r['concurrency']:<3} {r['scenario']:<19} {r['metric']:<6} "
+                        f"{r['baseline']:>9} → {r['current']:>9} ({r['change_pct']:+.1f}%)")
+                self.stdout.write(self.style.ERROR(line + "  REGRESSION") if r["regression"] else line)
+            if regressions and opts["fail_on_regression"]:
+                raise CommandError(f"{len(regressions)} regression(s) over {opts['threshold']}%")
+
+    def _in_process_drivers(self, stack, opts, upstream):
+        users = loadtest.setup_in_process(stack, upstream, opts["users"] or max(opts["concurrency"]))
+        return lambda i: loadtest.InProcessDriver(users[i % len(users)])
+
+    def _http_drivers(self, opts):
+        return lambda i: loadtest.HttpDriver(opts["target"], opts["cookie"])
+
+    def _print_level(self, level):
+        total = level["summary"].get("all", {})
+        self.stdout.write(
+            f"\nconcurrency={level['concurrency']} wall={level['wall_s']}s requests={total.get('count', 0)} "
+            f"rps={total.get('rps', 0)} errors={total.get('errors', 0)}"
+        )
+        self.stdout.write(f"  {'scenario':<19} {'count':>6} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>7}")
+        for name, s in sorted(level["summary"].items(), key=lambda kv: kv[0] == "all"):
+            self.stdout.write(
+                f"  {name:<19} {s['count']:>6} {s['errors']:>4} {s['p50_ms']:>6.0f}ms {s['p95_ms']:>6.0f}ms "
+                f"{s['p99_ms']:>6.0f}ms {s['rps']:>7.2f}"
+            )
+
+    def _save(self, result, out_dir, label):
+        os.makedirs(out_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(out_dir, f"{stamp}{'-' + label if label else ''}.json")
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, ensure_ascii=False, indent=2)
+        return path
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, timeout=5).stdout.strip()
+    except Exception:
+        return ""
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from llm_integration.llmproxy.utils.pdf_to_md import ExtractionLimits, iter_pages_markdown
+
+
+def make_synthetic_pdf(pages: int, lines_per_page: int = 40) -> bytes:
+    """벤치마크용 합성 PDF (제목 + 본문 줄 반복)."""
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 60), f"Chapter {n + 1}: Synthetic benchmark page", fontsize=16)
+        y = 90
+        for i in range(lines_per_page):
+            page.insert_text((72, y), f"Line {i:02d} of page {n + 1} - lorem ipsum dolor sit amet, consectetur.", fontsize=9)
+            y += 17
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class Command(BaseCommand):
+    help = "Benchmark PDF→Markdown extraction (serial vs. process pool) on a synthetic PDF; reports pages/sec."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=300)
+        parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+        parser.add_argument("--chunk-pages", type=int, default=16)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **opts):
+        data = make_synthetic_pdf(opts["pages"])
+        self.stdout.write(f"synthetic PDF: {opts['pages']} pages, {len(data) / 1024:.0f} KiB")
+        for workers in opts["workers"]:
+            best = None
+            for _ in range(opts["repeat"]):
+                limits = ExtractionLimits(max_pages=opts["pages"], time_budget=600)
+                started = time.perf_counter()
+                n = sum(1 for _ in iter_pages_markdown(data, workers=workers, chunk_pages=opts["chunk_pages"], limits=limits))
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(f"workers={workers:<2} pages={n} best={best * 1000:.0f}ms  {n / best:.1f} pages/s")
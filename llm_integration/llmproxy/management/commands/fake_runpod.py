@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from llm_integration.llmproxy.utils import fake_runpod
+
+
+class Command(BaseCommand):
+    help = "Run a local RunPod stand-in (/healthz, /v1/chat, /v1/ingest) with configurable latency and token rate."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=9000)
+        fake_runpod.add_arguments(parser)
+
+    def handle(self, *args, **opts):
+        server = fake_runpod.FakeRunPod(fake_runpod.config_from_options(opts), opts["host"], opts["port"])
+        self.stdout.write(f"fake RunPod on {server.base_url} {server.config.to_dict()}")
+        self.stdout.write(f"point the app at it: RUNPOD_API_BASES={server.base_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"requests: {server.requests}")
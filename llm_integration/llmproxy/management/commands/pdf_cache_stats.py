@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from llm_integration.llmproxy.models import PdfExtraction
+
+
+class Command(BaseCommand):
+    help = "Show PDF extraction cache hit ratio and bytes saved."
+
+    def handle(self, *args, **kwargs):
+        st = PdfExtraction.stats()
+        self.stdout.write(
+            f"entries={st['entries']} hits={st['hits']} misses={st['misses']} "
+            f"hit_ratio={st['hit_ratio']:.2%} bytes_saved={st['bytes_saved'] / 1024 / 1024:.1f} MiB"
+        )
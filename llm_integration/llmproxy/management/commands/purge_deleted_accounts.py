@@ -2,7 +2,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from uauth.models import UserDeletionStatus
-from llm_integration.llmproxy.models import Conversation
+from llm_integration.llmproxy.models import Conversation, PdfDocument, PdfExtraction
 
 User = get_user_model()
 
@@ -16,7 +16,12 @@ class Command(BaseCommand):
         for uds in qs.select_related("user"):
             u = uds.user
             Conversation.objects.filter(user=u).delete()  # messages cascade
+            # 탈퇴 사용자가 처음 올린 PDF 의 추출 캐시도 지운다 (owner 는 SET_NULL 이라 그냥 두면 본문이 남음)
+            PdfExtraction.objects.filter(owner=u).delete()
             u.delete()
             uds.delete()
             count += 1
+        # 어느 대화도, 남은 추출 캐시도 참조하지 않는 문서만 정리
+        # (다른 사용자의 캐시 항목이 가리키는 문서는 재업로드 때 재사용되므로 남긴다)
+        PdfDocument.objects.filter(conversations__isnull=True, extractions__isnull=True).delete()
         self.stdout.write(self.style.SUCCESS(f"Purged {count} accounts"))
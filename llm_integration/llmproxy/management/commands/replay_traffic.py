@@ -0,0 +1,132 @@
+import json
+import os
+from contextlib import ExitStack
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from llm_integration.llmproxy.management.commands.bench_load import _git_rev
+from llm_integration.llmproxy.management.commands.bench_pdf_extract import make_synthetic_pdf
+from llm_integration.llmproxy.utils import fake_runpod, loadtest, replay, resilience
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay recorded traffic (JSONL from TrafficCaptureMiddleware, or .http files like test.http) against the app "
+        "and/or the RunPod stand-in at original or scaled speed; reports per-endpoint latency, status and "
+        "response-shape mismatches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("logs", nargs="+", help="Request logs: *.jsonl (captured) or *.http.")
+        parser.add_argument("--speed", type=float, default=1.0,
+                            help="Time scale: 1 = recorded pacing, 4 = four times faster, 0 = no pacing.")
+        parser.add_argument("--concurrency", type=int, default=16, help="Max requests in flight.")
+        parser.add_argument("--limit", type=int, default=None, help="Replay only the first N requests.")
+        parser.add_argument("--target", default="", help="App base URL to replay against instead of in-process.")
+        parser.add_argument("--cookie", default="", help="With --target: 'sessionid=...; csrftoken=...' of a logged-in user.")
+        parser.add_argument("--runpod-base", default="", help="Send /v1/* and /healthz here instead of the stand-in.")
+        parser.add_argument("--pdf-pages", type=int, default=1, help="Synthetic PDF for captured uploads (padded to size).")
+        parser.add_argument("--show-diffs", type=int, default=10, help="Print up to N status/shape mismatches.")
+        parser.add_argument("--label", default="")
+        parser.add_argument("--out", default="bench_results", help="Directory for result JSON ('' to skip).")
+        parser.add_argument("--fail-on-mismatch", action="store_true")
+        fake_runpod.add_arguments(parser)
+
+    def handle(self, *args, **opts):
+        records = []
+        for path in opts["logs"]:
+            if not os.path.isfile(path):
+                raise CommandError(f"no such file: {path}")
+            recs, skipped = replay.load(path)
+            if skipped:
+                self.stdout.write(self.style.WARNING(
+                    f"{path}: skipped {skipped} line(s) without method/path (not a request log)"
+                ))
+            records += recs
+        if not records:
+            raise CommandError("nothing to replay")
+        records.sort(key=lambda r: r.get("ts") if isinstance(r.get("ts"), (int, float)) else float("-inf"))
+        records = records[:opts["limit"]] if opts["limit"] else records
+
+        app_keys = sorted({r.get("user") or "-" for r in records if not replay.is_runpod_path(r["path"])})
+        if app_keys and opts["target"] and not opts["cookie"]:
+            raise CommandError("--target needs --cookie of a logged-in session")
+        pdf = make_synthetic_pdf(opts["pdf_pages"]) if any(r.get("files") for r in records) else b""
+
+        with ExitStack() as stack:
+            fake = None
+            if not opts["runpod_base"]:
+                fake = stack.enter_context(fake_runpod.FakeRunPod(fake_runpod.config_from_options(opts)))
+            upstream = opts["runpod_base"] or fake.base_url
+            runpod = loadtest.HttpDriver(upstream, "")
+            stack.callback(runpod.close)
+            drivers = self._app_drivers(stack, opts, upstream, app_keys)
+            self.stdout.write(
+                f"replaying {len(records)} request(s) speed={opts['speed']} concurrency={opts['concurrency']} "
+                f"app={opts['target'] or ('in-process' if app_keys else '-')} runpod={upstream}"
+            )
+
+            def driver_for(rec):
+                return runpod if replay.is_runpod_path(rec["path"]) else drivers[rec.get("user") or "-"]
+
+            resilience.reset_all()
+            run = replay.replay(records, driver_for, speed=opts["speed"], concurrency=opts["concurrency"],
+                                pdf_bytes=pdf)
+
+        self._print(run, opts["show_diffs"])
+        if opts["out"]:
+            path = self._save(run, opts)
+            self.stdout.write(self.style.SUCCESS(f"saved {path}"))
+        total = run["summary"]["all"]
+        if opts["fail_on_mismatch"] and (total["status_mismatch"] or total["shape_mismatch"]):
+            raise CommandError(f"{total['status_mismatch']} status / {total['shape_mismatch']} shape mismatch(es)")
+
+    def _app_drivers(self, stack, opts, upstream, keys):
+        """캡처의 사용자(user 해시)마다 드라이버 하나. 메인 스레드에서 미리 만든다(로그인은 측정 밖)."""
+        if not keys:
+            return {}
+        if opts["target"]:
+            drivers = {k: loadtest.HttpDriver(opts["target"], opts["cookie"]) for k in keys}
+        else:
+            users = loadtest.setup_in_process(stack, upstream, len(keys))
+            drivers = {k: loadtest.InProcessDriver(u) for k, u in zip(keys, users)}
+        for d in drivers.values():
+            stack.callback(d.close)
+        return drivers
+
+    def _print(self, run, show_diffs):
+        self.stdout.write(f"\nwall={run['wall_s']}s")
+        self.stdout.write(
+            f"  {'endpoint':<36} {'count':>6} {'err':>4} {'status':>6} {'shape':>6} "
+            f"{'p50':>8} {'p95':>8} {'orig p95':>9} {'late':>7}"
+        )
+        for name, s in sorted(run["summary"].items(), key=lambda kv: kv[0] == "all"):
+            orig = f"{s['orig_p95_ms']:>7.0f}ms" if s["orig_p95_ms"] is not None else f"{'-':>9}"
+            self.stdout.write(
+                f"  {name:<36} {s['count']:>6} {s['errors']:>4} {s['status_mismatch']:>6} {s['shape_mismatch']:>6} "
+                f"{s['p50_ms']:>6.0f}ms {s['p95_ms']:>6.0f}ms {orig} {s['max_late_ms']:>5.0f}ms"
+            )
+        bad = [r for r in run["results"] if not r["ok"] or r["shape_diff"]]
+        for r in bad[:show_diffs]:
+            detail = r["error"] or "; ".join(r["shape_diff"]) or f"status {r['status']} (recorded {r['expected_status']})"
+            self.stdout.write(self.style.WARNING(f"  {r['source']} {r['endpoint']}: {detail}"))
+        if len(bad) > show_diffs:
+            self.stdout.write(f"  ... {len(bad) - show_diffs} more")
+
+    def _save(self, run, opts):
+        os.makedirs(opts["out"], exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        label = opts["label"]
+        path = os.path.join(opts["out"], f"replay-{stamp}{'-' + label if label else ''}.json")
+        result = {
+            "label": label,
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "git_rev": _git_rev(),
+            "config": {"logs": opts["logs"], "speed": opts["speed"], "concurrency": opts["concurrency"],
+                       "target": opts["target"] or "in-process", "runpod_base": opts["runpod_base"] or "stand-in"},
+            **run,
+        }
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, ensure_ascii=False, indent=2)
+        return path
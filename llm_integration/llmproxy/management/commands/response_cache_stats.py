@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from llm_integration.llmproxy.models import ResponseCacheEntry
+
+
+class Command(BaseCommand):
+    help = "Show LLM response cache hit ratio and GPU seconds saved."
+
+    def handle(self, *args, **kwargs):
+        st = ResponseCacheEntry.stats()
+        self.stdout.write(
+            f"entries={st['entries']} hits={st['hits']} misses={st['misses']} "
+            f"hit_ratio={st['hit_ratio']:.2%} gpu_seconds_saved={st['gpu_seconds_saved']:.1f}s"
+        )
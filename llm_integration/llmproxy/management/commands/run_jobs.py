@@ -0,0 +1,53 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from llm_integration.llmproxy import idempotency, response_cache
+from llm_integration.llmproxy.jobs import claim_next, run_job, worker_id
+
+
+class Command(BaseCommand):
+    help = "Process queued BackgroundJobs (PDF extraction / RunPod ingest). Run as a long-lived worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Process available jobs and exit.")
+        parser.add_argument("--sleep", type=float, default=1.0, help="Idle poll interval in seconds.")
+        parser.add_argument("--kind", action="append", dest="kinds", help="Only process these job kinds.")
+
+    def handle(self, *args, **opts):
+        self._stop = False
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        me = worker_id()
+        processed = 0
+        self.stdout.write(f"job worker {me} started")
+        next_purge = 0.0
+        while not self._stop:
+            close_old_connections()
+            if time.monotonic() >= next_purge:
+                self._purge()
+                next_purge = time.monotonic() + float(getattr(settings, "JOB_PURGE_INTERVAL", 600))
+            job = claim_next(me, opts["kinds"])
+            if job is None:
+                if opts["once"]:
+                    break
+                time.sleep(opts["sleep"])
+                continue
+            started = time.time()
+            job = run_job(job)
+            processed += 1
+            self.stdout.write(f"{job} attempt={job.attempts} {int((time.time() - started) * 1000)}ms")
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} jobs"))
+
+    def _purge(self):
+        # 요청 경로(chat_send)에서 테이블 전체를 지우지 않도록 만료 행 정리는 여기서
+        keys = idempotency.purge_expired()
+        cached = response_cache.purge()
+        if keys or cached:
+            self.stdout.write(f"purged {keys} idempotency keys, {cached} response cache entries")
+
+    def _request_stop(self, *args):
+        self._stop = True
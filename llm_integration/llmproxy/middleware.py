@@ -0,0 +1,127 @@
+# 04_project/llm_integration/llmproxy/middleware.py
+"""
+ServerTimingMiddleware: 요청마다 utils.timing.RequestTimer 를 열어
+뷰/유틸의 span(db, queue, context, cache, runpod, presign, s3_*, pdf_extract, serialize)을 모으고
+- 응답 헤더 Server-Timing (SERVER_TIMING_HEADER=1 일 때)
+- 로그 한 줄 "request timing ..." (llm_integration.llmproxy.timing)
+- Prometheus 요청 지연 히스토그램 (URL name 단위, utils/metrics.py)
+스트리밍 응답은 본문을 보내기 전까지(첫 바이트 전)만 담긴다.
+
+TrafficCaptureMiddleware: TRAFFIC_CAPTURE_PATH 가 있으면 요청을 JSONL 로 남긴다 (replay_traffic 입력, utils/replay.py).
+"""
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.crypto import salted_hmac
+
+from .utils import metrics, replay, timing
+
+logger = logging.getLogger("llm_integration.llmproxy.timing")
+
+
+class ServerTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timer, token = timing.begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.end(token)
+        self._finish(request, response, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer, token = timing.begin()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.end(token)
+        self._finish(request, response, timer)
+        return response
+
+    def _finish(self, request, response, timer):
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else None
+        metrics.observe_request(view, request.method, response.status_code, timer.total_ms() / 1000)
+        if getattr(settings, "SERVER_TIMING_HEADER", True):
+            response["Server-Timing"] = timer.server_timing()
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        spans = timer.summary()
+        total = spans.pop("total")["ms"]
+        db = spans.pop("db", {"ms": 0.0, "count": 0})
+        logger.info(
+            "request timing method=%s view=%s status=%s total_ms=%.1f db_ms=%.1f queries=%d spans=%s",
+            request.method, view or "-", response.status_code,
+            total, db["ms"], db["count"], json.dumps(spans, separators=(",", ":")),
+        )
+
+
+class TrafficCaptureMiddleware:
+    """
+    TRAFFIC_CAPTURE_PREFIX 아래 요청을 TRAFFIC_CAPTURE_SAMPLE 비율로 TRAFFIC_CAPTURE_PATH 에 한 줄씩.
+    - 사용자는 SECRET_KEY 로 만든 해시(재생 때 같은 사용자끼리 묶는 용도), 메시지/제목은 글자 수만 (TRAFFIC_CAPTURE_BODIES=1 이면 원문)
+    - 업로드 파일은 이름/크기만, 응답은 JSON 구조와 id 만
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.path = getattr(settings, "TRAFFIC_CAPTURE_PATH", "")
+        if not self.path:
+            raise MiddlewareNotUsed
+        self.prefix = getattr(settings, "TRAFFIC_CAPTURE_PREFIX", "/llm/api/")
+        self.sample = getattr(settings, "TRAFFIC_CAPTURE_SAMPLE", 1.0)
+        self.keep_text = getattr(settings, "TRAFFIC_CAPTURE_BODIES", False)
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _wanted(self, request) -> bool:
+        return request.path.startswith(self.prefix) and random.random() < self.sample
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self._wanted(request):
+            return self.get_response(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._write(request, response, start, getattr(request, "user", None))
+        return response
+
+    async def __acall__(self, request):
+        if not self._wanted(request):
+            return await self.get_response(request)
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        user = await request.auser() if hasattr(request, "auser") else None
+        self._write(request, response, start, user)
+        return response
+
+    def _write(self, request, response, start, user):
+        ms = (time.perf_counter() - start) * 1000
+        key = None
+        if user is not None and user.is_authenticated:
+            key = salted_hmac("llmproxy.traffic_capture", str(user.pk)).hexdigest()[:12]
+        try:
+            replay.append_record(self.path, replay.capture_record(request, response, ms, key, self.keep_text))
+        except Exception:
+            # 캡처 실패로 요청이 깨지면 안 된다
+            logging.getLogger(__name__).warning("traffic capture failed", exc_info=True)
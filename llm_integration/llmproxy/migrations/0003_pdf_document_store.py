@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:16
+
+import hashlib
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_pdf_context_to_documents(apps, schema_editor):
+    Conversation = apps.get_model("llmproxy", "Conversation")
+    PdfDocument = apps.get_model("llmproxy", "PdfDocument")
+    qs = Conversation.objects.exclude(pdf_context_md="").only("id", "pdf_context_md")
+    for conv in qs.iterator(chunk_size=100):
+        raw = conv.pdf_context_md.encode("utf-8")
+        doc, _ = PdfDocument.objects.get_or_create(
+            sha256=hashlib.sha256(raw).hexdigest(),
+            defaults={"content_z": zlib.compress(raw, 6), "size": len(raw)},
+        )
+        Conversation.objects.filter(pk=conv.pk).update(document=doc)
+
+
+def restore_pdf_context(apps, schema_editor):
+    Conversation = apps.get_model("llmproxy", "Conversation")
+    for conv in Conversation.objects.exclude(document=None).select_related("document").iterator(chunk_size=100):
+        md = zlib.decompress(bytes(conv.document.content_z)).decode("utf-8")
+        Conversation.objects.filter(pk=conv.pk).update(pdf_context_md=md)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('llmproxy', '0002_conversation_message_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PdfDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('content_z', models.BinaryField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='document',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='conversations', to='llmproxy.pdfdocument'),
+        ),
+        migrations.RunPython(move_pdf_context_to_documents, restore_pdf_context),
+        migrations.RemoveField(
+            model_name='conversation',
+            name='pdf_context_md',
+        ),
+    ]
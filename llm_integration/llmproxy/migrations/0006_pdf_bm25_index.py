@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('llmproxy', '0005_pdf_extraction_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PdfIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_z', models.BinaryField()),
+                ('chunks', models.PositiveIntegerField(default=0)),
+                ('terms', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='index', to='llmproxy.pdfdocument')),
+            ],
+        ),
+    ]
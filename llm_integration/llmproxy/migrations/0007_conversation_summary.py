@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('llmproxy', '0006_pdf_bm25_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary_upto_id',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
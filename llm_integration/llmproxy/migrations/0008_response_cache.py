@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:38
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('llmproxy', '0007_conversation_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResponseCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('scope', models.CharField(max_length=64)),
+                ('question', models.TextField()),
+                ('response', models.TextField()),
+                ('gen_seconds', models.FloatField(default=0.0)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['scope', 'last_hit_at'], name='llm_rcache_scope_hit_idx'), models.Index(fields=['last_hit_at'], name='llm_rcache_lru_idx')],
+            },
+        ),
+    ]
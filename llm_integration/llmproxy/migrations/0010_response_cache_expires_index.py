@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('llmproxy', '0009_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='responsecacheentry',
+            index=models.Index(fields=['expires_at'], name='llm_rcache_expires_idx'),
+        ),
+    ]
@@ -1,9 +1,172 @@
+import hashlib
+import zlib
+from functools import lru_cache
+
 from django.conf import settings
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from .utils.bm25 import BM25Index
 
 User = get_user_model()
 
+
+class PdfDocument(models.Model):
+    """
+    업로드 PDF에서 추출한 마크다운 본문.
+    Conversation 행에서 분리해 필요할 때(첨부 전송 시)만 읽고,
+    내용 해시(sha256)로 중복 제거 + zlib 압축해서 보관한다.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    content_z = models.BinaryField()
+    size = models.PositiveIntegerField(default=0)  # 압축 전 바이트 수
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def markdown(self) -> str:
+        return zlib.decompress(bytes(self.content_z)).decode("utf-8")
+
+    @classmethod
+    def store(cls, markdown: str) -> "PdfDocument":
+        raw = (markdown or "").encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        doc, _ = cls.objects.get_or_create(
+            sha256=digest,
+            defaults={"content_z": zlib.compress(raw, 6), "size": len(raw)},
+        )
+        return doc
+
+    def __str__(self) -> str:
+        return f"PdfDocument {self.sha256[:12]} ({self.size}B)"
+
+
+class PdfIndex(models.Model):
+    """
+    PdfDocument 마크다운 위의 로컬 BM25 인덱스(utils/bm25.py, zlib JSON).
+    업로드 작업(pdf_upload)에서 만들고, 문서 단위라 같은 PDF를 쓰는 대화끼리 공유한다.
+    """
+    document = models.OneToOneField(PdfDocument, on_delete=models.CASCADE, related_name="index")
+    data_z = models.BinaryField()
+    chunks = models.PositiveIntegerField(default=0)
+    terms = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def build(cls, document: PdfDocument) -> "PdfIndex":
+        """없으면 만들고 있으면 그대로(재시도/캐시 적중에도 안전)."""
+        existing = cls.objects.filter(document=document).first()
+        if existing:
+            return existing
+        idx = BM25Index.build(document.markdown)
+        obj, _ = cls.objects.get_or_create(
+            document=document,
+            defaults={"data_z": idx.to_bytes(), "chunks": len(idx.chunks), "terms": len(idx.postings)},
+        )
+        return obj
+
+    @classmethod
+    def load(cls, document: PdfDocument) -> BM25Index:
+        """프로세스 LRU 캐시 → DB → (예전 문서라 없으면) 즉석 생성."""
+        return _load_index(document.pk, document.sha256)
+
+    def __str__(self) -> str:
+        return f"PdfIndex doc={self.document_id} ({self.chunks} chunks)"
+
+
+@lru_cache(maxsize=64)
+def _load_index(document_id: int, sha256: str) -> BM25Index:
+    # 문서 내용은 불변(sha256)이라 키에 해시를 넣어 두면 무효화가 필요 없다
+    row = PdfIndex.objects.filter(document_id=document_id).only("data_z").first()
+    if row is None:
+        row = PdfIndex.build(PdfDocument.objects.get(pk=document_id))
+    return BM25Index.from_bytes(row.data_z)
+
+class PdfExtraction(models.Model):
+    """
+    업로드 원본(PDF bytes) sha256 → 추출 결과 캐시.
+    같은 PDF가 다시 올라오면(다른 대화/다른 사용자라도) PyMuPDF 추출을 건너뛰고 document를 재사용한다.
+    S3 객체는 최초 업로더 본인이거나 PDF_CACHE_SHARE_S3 가 켜진 경우에만 재사용.
+    """
+    source_sha256 = models.CharField(max_length=64, unique=True)
+    document = models.ForeignKey(PdfDocument, on_delete=models.CASCADE, related_name="extractions")
+    s3_key = models.CharField(max_length=512, blank=True, default="")
+    owner = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    source_size = models.PositiveIntegerField(default=0)
+    hits = models.PositiveIntegerField(default=0)
+    bytes_saved = models.BigIntegerField(default=0)  # 재사용으로 건너뛴 추출/업로드 원본 바이트 합
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def stats(cls) -> dict:
+        agg = cls.objects.aggregate(
+            entries=models.Count("id"),
+            hits=models.Sum("hits"),
+            bytes_saved=models.Sum("bytes_saved"),
+        )
+        entries, hits = agg["entries"] or 0, agg["hits"] or 0
+        # 캐시 항목 하나 = 미스 한 번(최초 추출)
+        lookups = entries + hits
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": entries,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "bytes_saved": agg["bytes_saved"] or 0,
+        }
+
+    def __str__(self) -> str:
+        return f"PdfExtraction {self.source_sha256[:12]} hits={self.hits}"
+
+
+class ResponseCacheEntry(models.Model):
+    """
+    LLM 응답 캐시 (opt-in: RESPONSE_CACHE_ENABLED, response_cache.py).
+    scope = 문서 해시 + 앞선 대화 + 샘플링 파라미터, key = scope + 정규화한 질문.
+    TTL(expires_at) 지나면 무효, 개수가 넘치면 last_hit_at 오래된 것부터 지운다(LRU).
+    """
+    key = models.CharField(max_length=64, unique=True)
+    scope = models.CharField(max_length=64)
+    question = models.TextField()                 # 정규화한 질문 (유사 질문 매칭용)
+    response = models.TextField()
+    gen_seconds = models.FloatField(default=0.0)  # 최초 생성에 걸린 시간 = 적중 1회당 아낀 GPU 시간
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # 유사 질문 후보: WHERE scope=? AND expires_at>? ORDER BY last_hit_at DESC
+            models.Index(fields=["scope", "last_hit_at"], name="llm_rcache_scope_hit_idx"),
+            models.Index(fields=["last_hit_at"], name="llm_rcache_lru_idx"),
+            # 주기 정리(purge): WHERE expires_at <= now
+            models.Index(fields=["expires_at"], name="llm_rcache_expires_idx"),
+        ]
+
+    @classmethod
+    def stats(cls) -> dict:
+        agg = cls.objects.aggregate(
+            entries=models.Count("id"),
+            total_hits=models.Sum("hits"),
+            saved=models.Sum(models.F("hits") * models.F("gen_seconds"), output_field=models.FloatField()),
+        )
+        entries, hits = agg["entries"] or 0, agg["total_hits"] or 0
+        # 캐시 항목 하나 = 미스 한 번(최초 생성). 축출된 항목의 기록은 빠진다
+        lookups = entries + hits
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": entries,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "gpu_seconds_saved": round(agg["saved"] or 0.0, 1),
+        }
+
+    def __str__(self) -> str:
+        return f"ResponseCacheEntry {self.key[:12]} hits={self.hits}"
+
+
 class Conversation(models.Model):
     user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
     session_key = models.CharField(max_length=64, db_index=True, blank=True, default="")
@@ -15,10 +178,20 @@ class Conversation(models.Model):
     uploaded_pdf_url = models.URLField(blank=True, default="")   # 최근 발급한 presigned URL
     s3_key = models.CharField(max_length=512, blank=True, default="")  # 실제 S3 객체 키
 
-    # 업로드된 PDF를 텍스트 컨텍스트로 보관
-    pdf_context_md = models.TextField(blank=True, default="")
+    # 업로드된 PDF의 텍스트 컨텍스트 (본문은 PdfDocument에 따로 보관 → 대화 조회 시 읽지 않음)
+    document = models.ForeignKey(PdfDocument, null=True, blank=True, on_delete=models.SET_NULL, related_name="conversations")
     pdf_context_attached = models.BooleanField(default=False)
 
+    # 오래된 대화의 누적 요약 (summarize 작업이 갱신). summary_upto_id 까지의 메시지를 포함한다
+    summary = models.TextField(blank=True, default="")
+    summary_upto_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # 사이드바/최근 대화: WHERE user_id=? ORDER BY updated_at DESC, id DESC
+            models.Index(fields=["user", "updated_at", "id"], name="llm_conv_user_upd_id_idx"),
+        ]
+
     def __str__(self) -> str:
         return self.title or f"Conversation #{self.pk}"
 
@@ -36,6 +209,76 @@ class Message(models.Model):
 
     class Meta:
         ordering = ["id"]
+        indexes = [
+            # 히스토리/컨텍스트: WHERE conversation_id=? ORDER BY id (DESC) LIMIT n, keyset(id < / > ?)
+            models.Index(fields=["conversation", "id"], name="llm_msg_conv_id_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"[{self.role}] {self.content[:32]}"
+
+
+class BackgroundJob(models.Model):
+    """
+    DB 기반 로컬 작업 큐 (run_jobs 매니지먼트 커맨드가 처리).
+    업로드 후 PDF 추출 / RunPod 인덱싱처럼 오래 걸리는 일을 요청 스레드 밖으로 뺀다.
+    """
+    STATUS_CHOICES = (
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    )
+    kind = models.CharField(max_length=32)
+    conversation = models.ForeignKey(Conversation, null=True, blank=True, on_delete=models.CASCADE, related_name="jobs")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="queued")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # 워커 폴링: WHERE status='queued' AND run_after <= now ORDER BY run_after
+            models.Index(fields=["status", "run_after"], name="llm_job_status_run_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"[{self.kind}#{self.pk}] {self.status}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    chat_send 중복 요청 방지 (Idempotency-Key 헤더, idempotency.py).
+    처음 요청이 pending 으로 행을 잡고, 같은 키의 중복 요청은 (워커가 달라도) 이 행이 done 이 될 때까지 기다렸다가
+    저장된 응답을 그대로 돌려받는다. expires_at 이 지나면 같은 키를 새 요청으로 쓸 수 있다.
+    """
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("done", "Done"),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    key = models.CharField(max_length=128)
+    fingerprint = models.CharField(max_length=64)   # sha256(conversation_id, message) — 같은 키로 다른 요청이면 거절
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="pending")
+    response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="llm_idem_user_key_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"], name="llm_idem_expires_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"IdempotencyKey {self.key} {self.status}"
@@ -0,0 +1,153 @@
+# 04_project/llm_integration/llmproxy/response_cache.py
+"""
+반복 질문용 LLM 응답 캐시 (RESPONSE_CACHE_ENABLED=1 일 때만).
+- 정확히 일치: (문서 sha256, 앞선 대화, 샘플링 파라미터, 정규화한 질문) 해시
+- 유사 질문(RESPONSE_CACHE_NEAR_DUP=1): 같은 scope 안에서 질문 글자 3-gram Jaccard ≥ 임계값
+- TTL(RESPONSE_CACHE_TTL) + 개수 상한(RESPONSE_CACHE_MAX_ENTRIES, LRU)
+  → 정리는 요청 경로가 아니라 run_jobs 가 주기적으로 purge() (store 는 쓰기만)
+- 프로세스 카운터(stats) + DB 집계(ResponseCacheEntry.stats)
+"""
+import hashlib
+import json
+import re
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from .models import PdfDocument, ResponseCacheEntry
+
+# 캐시 키에 넣는 파라미터 (session_id 는 대화마다 달라 제외, user_id 는 공유 여부에 따라)
+_KEY_PARAMS = ("max_tokens", "temperature", "top_p", "repetition_penalty", "k_internal", "k_external")
+_PUNCT_RE = re.compile(r"[\s\.,!?~…·\"'`]+")
+
+_lock = threading.Lock()
+_counters = {"lookups": 0, "hits": 0, "near_hits": 0, "stores": 0, "gpu_seconds_saved": 0.0}
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "RESPONSE_CACHE_ENABLED", False))
+
+
+def normalize_question(text: str) -> str:
+    """대소문자/공백/문장부호 차이는 같은 질문으로."""
+    return _PUNCT_RE.sub(" ", (text or "").lower()).strip()
+
+
+def _shingles(text: str) -> set:
+    t = text.replace(" ", "")
+    return {t[i:i + 3] for i in range(max(1, len(t) - 2))}
+
+
+def similarity(a: str, b: str) -> float:
+    sa, sb = _shingles(a), _shingles(b)
+    return len(sa & sb) / len(sa | sb) if sa and sb else 0.0
+
+
+class CacheKey:
+    def __init__(self, scope: str, question: str):
+        self.scope = scope
+        self.question = question
+        self.key = hashlib.sha256(f"{scope}\n{question}".encode("utf-8")).hexdigest()
+
+
+def make_key(user, conv, messages, params: dict):
+    """
+    LLM에 보낼 최종 messages(토큰 예산 적용 후) 기준 키. 마지막 user 메시지가 질문, 그 앞이 대화 맥락.
+    문서 첨부 청크는 질문 + 문서로 정해지므로 문서 해시만 넣는다. 캐시가 꺼져 있으면 None.
+    """
+    if not enabled() or not messages or messages[-1].get("role") != "user":
+        return None
+    doc_sha = ""
+    if conv.document_id:
+        doc_sha = PdfDocument.objects.filter(pk=conv.document_id).values_list("sha256", flat=True).first() or ""
+    scope = {
+        "doc": doc_sha,
+        "history": [[m.get("role"), m.get("content")] for m in messages[:-1]],
+        "params": {k: params.get(k) for k in _KEY_PARAMS},
+        "user": None if getattr(settings, "RESPONSE_CACHE_SHARED", False) else user.pk,
+    }
+    scope_hash = hashlib.sha256(json.dumps(scope, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+    return CacheKey(scope_hash, normalize_question(messages[-1].get("content")))
+
+
+def _count(**inc):
+    with _lock:
+        for k, v in inc.items():
+            _counters[k] += v
+
+
+def lookup(ck: CacheKey):
+    """적중하면 (response, "exact"|"near"), 아니면 (None, None)."""
+    if ck is None:
+        return None, None
+    _count(lookups=1)
+    now = timezone.now()
+    live = ResponseCacheEntry.objects.filter(expires_at__gt=now)
+    mode = "exact"
+    entry = live.filter(key=ck.key).only("id", "response", "gen_seconds").first()
+    if entry is None and getattr(settings, "RESPONSE_CACHE_NEAR_DUP", False):
+        threshold = float(getattr(settings, "RESPONSE_CACHE_NEAR_DUP_THRESHOLD", 0.85))
+        candidates = live.filter(scope=ck.scope).only("id", "question", "response", "gen_seconds").order_by("-last_hit_at")[:50]
+        best = max(candidates, key=lambda c: similarity(ck.question, c.question), default=None)
+        if best is not None and similarity(ck.question, best.question) >= threshold:
+            entry, mode = best, "near"
+    if entry is None:
+        return None, None
+    ResponseCacheEntry.objects.filter(pk=entry.pk).update(hits=F("hits") + 1, last_hit_at=now)
+    _count(hits=1, near_hits=1 if mode == "near" else 0, gpu_seconds_saved=entry.gen_seconds)
+    return entry.response, mode
+
+
+def store(ck: CacheKey, response: str, gen_seconds: float):
+    if ck is None or not response:
+        return
+    now = timezone.now()
+    ttl = int(getattr(settings, "RESPONSE_CACHE_TTL", 24 * 3600))
+    try:
+        ResponseCacheEntry.objects.update_or_create(
+            key=ck.key,
+            defaults={"scope": ck.scope, "question": ck.question, "response": response,
+                      "gen_seconds": gen_seconds, "last_hit_at": now, "expires_at": now + timedelta(seconds=ttl)},
+        )
+    except IntegrityError:
+        return  # 동시에 같은 키를 저장한 요청이 있었음
+    _count(stores=1)
+
+
+_PURGE_BATCH = 500
+
+
+def purge() -> int:
+    """
+    만료된 항목 + 상한을 넘는 오래된 항목(LRU) 삭제 (run_jobs 가 JOB_PURGE_INTERVAL 마다 호출).
+    한 번에 최대 500개씩 나눠 지워 DELETE 하나가 테이블을 오래 잡지 않게 한다.
+    """
+    now = timezone.now()
+    deleted = 0
+    while True:
+        expired = list(ResponseCacheEntry.objects.filter(expires_at__lte=now)
+                       .values_list("id", flat=True)[:_PURGE_BATCH])
+        if not expired:
+            break
+        deleted += ResponseCacheEntry.objects.filter(id__in=expired).delete()[0]
+    max_entries = int(getattr(settings, "RESPONSE_CACHE_MAX_ENTRIES", 5000))
+    while True:
+        stale = list(ResponseCacheEntry.objects.order_by("-last_hit_at", "-id")
+                     .values_list("id", flat=True)[max_entries:max_entries + _PURGE_BATCH])
+        if not stale:
+            break
+        deleted += ResponseCacheEntry.objects.filter(id__in=stale).delete()[0]
+    return deleted
+
+
+def stats() -> dict:
+    """이 프로세스의 조회 카운터 + DB 전체 집계."""
+    with _lock:
+        proc = dict(_counters)
+    proc["hit_ratio"] = round(proc["hits"] / proc["lookups"], 4) if proc["lookups"] else 0.0
+    proc["gpu_seconds_saved"] = round(proc["gpu_seconds_saved"], 1)
+    return {"process": proc, "db": ResponseCacheEntry.stats()}
@@ -0,0 +1,1535 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+import httpx
+import requests
+from urllib3.exceptions import ProtocolError
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from llm_integration.llmproxy.utils.http_session import get_session, pool_stats
+from llm_integration.llmproxy import idempotency, jobs, response_cache
+from llm_integration.llmproxy.models import (
+    BackgroundJob, Conversation, IdempotencyKey, Message, PdfDocument, PdfExtraction, PdfIndex, ResponseCacheEntry,
+)
+from llm_integration.llmproxy.management.commands.bench_pdf_extract import make_synthetic_pdf
+from llm_integration.llmproxy.utils import loadtest, metrics, replay, resilience, storage, timing
+from llm_integration.llmproxy.utils.admission import Admission, AdmissionRejected
+from llm_integration.llmproxy.utils.endpoints import EndpointPool
+from llm_integration.llmproxy.utils.fake_runpod import FakeRunPod, FakeRunPodConfig
+from llm_integration.llmproxy.utils.bm25 import BM25Index
+from llm_integration.llmproxy.utils.context import build_context, count_tokens
+from llm_integration.llmproxy.utils import pdf_to_md
+from llm_integration.llmproxy.utils.pdf_to_md import ExtractionLimits, iter_pages_markdown, pdf_bytes_to_markdown
+from llm_integration.llmproxy.utils.llm_client import AsyncLLMClient, LLMClient, parse_stream_line
+
+
+class _FakeStreamResponse:
+    def __init__(self, lines, content_type="text/event-stream"):
+        self._lines = lines
+        self.headers = {"Content-Type": content_type}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self._lines)
+
+    def json(self):
+        return {"answer": "전체 답변"}
+
+
+def _refused():
+    """requests 가 연결 단계(요청 전송 전)에서 실패할 때 던지는 모양 그대로."""
+    from urllib3.exceptions import MaxRetryError, NewConnectionError
+    return requests.ConnectionError(MaxRetryError(None, "/v1/chat", NewConnectionError(None, "Connection refused")))
+
+
+# 스트리밍 파서 / 클라이언트 단위 테스트
+@override_settings(RUNPOD_API_BASE="http://runpod.local")
+class ChatStreamTest(SimpleTestCase):
+    def test_parse_stream_line_formats(self):
+        self.assertIsNone(parse_stream_line(""))
+        self.assertIsNone(parse_stream_line(": keep-alive"))
+        self.assertIs(parse_stream_line("data: [DONE]"), StopIteration)
+        self.assertEqual(parse_stream_line('data: {"token": "안"}'), "안")
+        self.assertEqual(parse_stream_line('{"choices": [{"delta": {"content": "녕"}}]}'), "녕")
+
+    def test_chat_stream_yields_tokens_in_order(self):
+        lines = ['data: {"token": "a"}', "", 'data: {"token": "b"}', "data: [DONE]", 'data: {"token": "c"}']
+        with mock.patch("requests.Session.post", return_value=_FakeStreamResponse(lines)):
+            self.assertEqual(list(LLMClient().chat_stream([{"role": "user", "content": "hi"}])), ["a", "b"])
+
+    def test_chat_stream_falls_back_to_json(self):
+        with mock.patch("requests.Session.post", return_value=_FakeStreamResponse([], "application/json")):
+            self.assertEqual(list(LLMClient().chat_stream([{"role": "user", "content": "hi"}])), ["전체 답변"])
+
+
+class HttpSessionTest(SimpleTestCase):
+    def test_session_is_shared_and_reset_on_pid_change(self):
+        s1 = get_session()
+        self.assertIs(s1, get_session())
+        with mock.patch("os.getpid", return_value=-1):
+            self.assertIsNot(s1, get_session())
+
+    def test_pool_stats_counts_reuse(self):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"ok")
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            before = pool_stats()
+            for _ in range(3):
+                get_session().get(f"http://127.0.0.1:{server.server_port}/", timeout=5)
+            after = pool_stats()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(after["requests"] - before["requests"], 3)
+        self.assertGreaterEqual(after["reused"] - before["reused"], 2)
+
+
+@override_settings(RUNPOD_API_BASE="http://runpod.local")
+class AsyncLLMClientTest(SimpleTestCase):
+    def _run(self, handler, coro_fn):
+        async def main():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            with mock.patch("llm_integration.llmproxy.utils.llm_client.get_async_client", return_value=client):
+                return await coro_fn()
+        return asyncio.run(main())
+
+    def test_chat_posts_payload(self):
+        seen = {}
+
+        def handler(request):
+            seen["url"] = str(request.url)
+            return httpx.Response(200, json={"answer": "비동기"})
+
+        result = self._run(handler, lambda: AsyncLLMClient().chat([{"role": "user", "content": "hi"}], session_id="7"))
+        self.assertEqual(result["answer"], "비동기")
+        self.assertEqual(seen["url"], "http://runpod.local/v1/chat")
+
+    def test_chat_stream(self):
+        def handler(request):
+            body = b'data: {"token": "x"}\n\ndata: {"token": "y"}\n\ndata: [DONE]\n\n'
+            return httpx.Response(200, content=body, headers={"Content-Type": "text/event-stream"})
+
+        async def collect():
+            return [t async for t in AsyncLLMClient().chat_stream([{"role": "user", "content": "hi"}])]
+
+        self.assertEqual(self._run(handler, collect), ["x", "y"])
+
+    def test_chat_retries_503_then_succeeds(self):
+        resilience.reset_all()
+        self.addCleanup(resilience.reset_all)
+        statuses = [503, 200]
+
+        def handler(request):
+            return httpx.Response(statuses.pop(0), json={"answer": "재시도 성공"})
+
+        with mock.patch("llm_integration.llmproxy.utils.llm_client.retry_delay", return_value=0):
+            result = self._run(handler, lambda: AsyncLLMClient().chat([{"role": "user", "content": "hi"}]))
+        self.assertEqual((result["answer"], statuses), ("재시도 성공", []))
+
+
+def _http_resp(status=200, body=None):
+    resp = mock.Mock(status_code=status)
+    resp.json.return_value = body or {"answer": "ok"}
+    if status >= 400:
+        resp.raise_for_status.side_effect = requests.HTTPError(f"{status}", response=resp)
+    return resp
+
+
+@override_settings(RUNPOD_API_BASE="http://runpod.local", RUNPOD_RETRIES=2, RUNPOD_BREAKER_FAILURES=3)
+class ResilienceTest(TestCase):
+    def setUp(self):
+        resilience.reset_all()
+        self.addCleanup(resilience.reset_all)
+        patcher = mock.patch("llm_integration.llmproxy.utils.llm_client.retry_delay", return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retries_gateway_errors_with_split_timeouts(self):
+        with mock.patch("requests.Session.post", side_effect=[_http_resp(503), _http_resp(503), _http_resp()]) as post:
+            self.assertEqual(LLMClient().chat([{"role": "user", "content": "hi"}])["answer"], "ok")
+        self.assertEqual(post.call_count, 3)
+        self.assertEqual(post.call_args.kwargs["timeout"], (5.0, 120))
+
+    def test_read_timeout_and_4xx_are_not_retried(self):
+        with mock.patch("requests.Session.post", side_effect=requests.ReadTimeout("slow")) as post:
+            with self.assertRaises(requests.ReadTimeout):
+                LLMClient().chat([{"role": "user", "content": "hi"}])
+        self.assertEqual(post.call_count, 1)
+        with mock.patch("requests.Session.post", return_value=_http_resp(422)) as post:
+            with self.assertRaises(requests.HTTPError):
+                LLMClient().chat([{"role": "user", "content": "hi"}])
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(resilience.get_breaker("http://runpod.local").state, "closed")
+
+    def test_post_is_not_resent_once_it_may_have_reached_the_pod(self):
+        # 502/504/요청 도중 끊김: pod 가 이미 생성/인제스트를 시작했을 수 있다 → 다시 보내지 않는다
+        aborted = requests.ConnectionError(ProtocolError("Connection aborted.", ConnectionResetError(104, "reset")))
+        calls = [
+            lambda: LLMClient().chat([{"role": "user", "content": "hi"}]),
+            lambda: LLMClient().ingest("a.pdf", b"%PDF", user_id="u", session_id="s"),
+        ]
+        for failure in (_http_resp(502), _http_resp(504), aborted):
+            for call in calls:
+                resilience.reset_all()
+                with mock.patch("requests.Session.post", side_effect=[failure, _http_resp()]) as post:
+                    with self.assertRaises(requests.RequestException):
+                        call()
+                self.assertEqual(post.call_count, 1)
+        # 멱등 요청이라면 같은 실패도 재시도 대상
+        self.assertTrue(resilience.is_retryable(aborted, idempotent=True))
+        self.assertFalse(resilience.is_retryable(aborted, idempotent=False))
+        self.assertTrue(resilience.is_retryable(_refused(), idempotent=False))
+
+    def test_breaker_opens_then_views_fail_fast_with_503(self):
+        with mock.patch("requests.Session.post", side_effect=_refused()) as post:
+            with self.assertRaises(requests.ConnectionError):
+                LLMClient().chat([{"role": "user", "content": "hi"}])  # 1회 + 재시도 2회 = 실패 3
+            self.assertEqual(post.call_count, 3)
+            with self.assertRaises(resilience.CircuitOpenError):
+                LLMClient().chat([{"role": "user", "content": "hi"}])
+            self.assertEqual(post.call_count, 3)
+
+            user = get_user_model().objects.create_user("cb", "cb@example.com", "pw")
+            self.client.force_login(user)
+            r = self.client.post("/llm/api/chat/send", {"message": "hi"})
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(r.json()["code"], "upstream_unavailable")
+        self.assertGreaterEqual(int(r["Retry-After"]), 1)
+        self.assertFalse(Message.objects.exists())
+
+    def test_half_open_probe_closes_breaker(self):
+        breaker = resilience.get_breaker("http://runpod.local")
+        for _ in range(3):
+            breaker.record_failure()
+        breaker.opened_at -= breaker.reset_timeout
+        with mock.patch("requests.Session.post", return_value=_http_resp()):
+            LLMClient().chat([{"role": "user", "content": "hi"}])
+        self.assertEqual(breaker.state, "closed")
+
+    @override_settings(RUNPOD_HEDGE_PERCENTILE=90, RUNPOD_HEDGE_MIN_DELAY=0.05)
+    def test_hedged_request_wins_when_first_is_slow(self):
+        tracker = resilience.get_latency("http://runpod.local")
+        for _ in range(30):
+            tracker.observe(0.01)
+        calls = []
+
+        def post(*args, **kwargs):
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                time.sleep(0.5)
+                return _http_resp(body={"answer": "slow"})
+            return _http_resp(body={"answer": "fast"})
+
+        with mock.patch("requests.Session.post", side_effect=post):
+            self.assertEqual(LLMClient().chat([{"role": "user", "content": "hi"}])["answer"], "fast")
+        self.assertEqual(len(calls), 2)
+
+    @override_settings(RUNPOD_HEDGE_PERCENTILE=90, RUNPOD_HEDGE_MIN_DELAY=0.05, RUNPOD_HEDGE_THREADS=1)
+    def test_hedges_are_bounded_and_primary_skips_the_pool(self):
+        from llm_integration.llmproxy.utils import llm_client
+        with mock.patch.object(llm_client, "_hedge_pool", None), mock.patch.object(llm_client, "_hedge_slots", None):
+            tracker = resilience.get_latency("http://runpod.local")
+            for _ in range(30):
+                tracker.observe(0.01)
+            llm_client._get_hedge_pool()
+            self.assertTrue(llm_client._hedge_slots.acquire(blocking=False))  # 버려진 hedge 하나가 아직 도는 중
+            threads = []
+
+            def post(*args, **kwargs):
+                threads.append(threading.current_thread().name)
+                time.sleep(0.2)
+                return _http_resp(body={"answer": "primary"})
+
+            with mock.patch("requests.Session.post", side_effect=post):
+                self.assertEqual(LLMClient().chat([{"role": "user", "content": "hi"}])["answer"], "primary")
+            self.assertEqual(threads, ["runpod-primary"])  # 한도가 차 있으면 hedge 를 띄우지 않는다
+            llm_client._hedge_slots.release()
+            llm_client._hedge_pool.shutdown()
+
+    def test_failed_stream_response_is_closed(self):
+        resp = _http_resp(502)
+        with override_settings(RUNPOD_RETRIES=0), mock.patch("requests.Session.post", return_value=resp):
+            with self.assertRaises(requests.HTTPError):
+                list(LLMClient().chat_stream([{"role": "user", "content": "hi"}]))
+        resp.close.assert_called_once_with()
+
+
+PODS = ["http://pod-a", "http://pod-b", "http://pod-c"]
+
+
+@override_settings(RUNPOD_API_BASES=PODS, RUNPOD_HEALTH_INTERVAL=0, RUNPOD_RETRIES=1)
+class EndpointPoolTest(SimpleTestCase):
+    def setUp(self):
+        resilience.reset_all()
+        self.addCleanup(resilience.reset_all)
+
+    def test_session_affinity_is_stable_and_only_moves_off_down_pods(self):
+        pool = EndpointPool(PODS)
+        home = {sid: pool.pick(str(sid)).base for sid in range(60)}
+        self.assertEqual(len(set(home.values())), 3)
+        self.assertEqual({sid: pool.pick(str(sid)).base for sid in range(60)}, home)
+        pool.endpoints[0].healthy = False
+        moved = {sid: pool.pick(str(sid)).base for sid in range(60)}
+        for sid, base in home.items():
+            if base != PODS[0]:
+                self.assertEqual(moved[sid], base)
+        self.assertNotIn(PODS[0], moved.values())
+
+    def test_least_outstanding_and_latency_strategies(self):
+        pool = EndpointPool(PODS, affinity=False)
+        a, b, c = pool.endpoints
+        pool.acquire(a)
+        pool.acquire(b)
+        self.assertIs(pool.pick(), c)
+        pool = EndpointPool(PODS, strategy="latency", affinity=False)
+        a, b, c = pool.endpoints
+        pool.observe(a, 2.0)
+        pool.observe(b, 0.2)
+        pool.observe(c, 0.5)
+        self.assertIs(pool.pick(), b)
+        for _ in range(3):
+            pool.acquire(b)   # 0.2 * 4 > 0.5 * 1
+        self.assertIs(pool.pick(), c)
+
+    def test_health_probe_marks_pods(self):
+        pool = EndpointPool(PODS)
+        with mock.patch("requests.Session.get", side_effect=lambda url, **kw: mock.Mock(status_code=200 if "pod-b" in url else 503)):
+            pool.probe_once()
+        self.assertEqual([e.healthy for e in pool.endpoints], [False, True, False])
+        self.assertEqual(pool.pick("any").base, "http://pod-b")
+
+    def test_client_fails_over_to_next_pod_on_connect_error(self):
+        urls = []
+
+        def post(url, **kwargs):
+            urls.append(url)
+            if len(urls) == 1:
+                raise _refused()
+            return _http_resp()
+
+        with mock.patch("requests.Session.post", side_effect=post), \
+                mock.patch("llm_integration.llmproxy.utils.llm_client.retry_delay", return_value=0):
+            LLMClient().chat([{"role": "user", "content": "hi"}], session_id="42")
+        self.assertEqual(len(urls), 2)
+        self.assertNotEqual(urls[0], urls[1])
+        self.assertTrue(all(u.endswith("/v1/chat") for u in urls))
+
+
+class AdmissionTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, True)
+
+    def _queue_up(self, adm, user, label, order):
+        """별도 스레드에서 admit → 대기열에 들어간 것을 확인하고 돌아온다."""
+        before = adm.global_queued()
+
+        def run():
+            with adm.admit(user):
+                order.append(label)
+                time.sleep(0.05)
+
+        t = threading.Thread(target=run)
+        t.start()
+        deadline = time.monotonic() + 2
+        while adm.global_queued() == before and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(adm.global_queued(), before + 1)
+        return t
+
+    def test_per_user_cap_and_queue_limits_reject(self):
+        adm = Admission(self.dir, max_inflight=4, per_user=1, max_queue=4, per_user_queue=0)
+        with adm.admit(1):
+            with self.assertRaises(AdmissionRejected) as cm:
+                with adm.admit(1):
+                    pass
+            self.assertEqual(cm.exception.reason, "user_queue_full")
+            with adm.admit(2):  # 다른 사용자는 통과
+                pass
+        self.assertEqual(adm.stats()["rejected"], {"user_queue_full": 1})
+
+    def test_waiter_is_admitted_when_slot_frees_across_workers(self):
+        # 같은 디렉터리를 보는 인스턴스 2개 = gunicorn 워커 2개
+        a = Admission(self.dir, max_inflight=1, per_user=1, max_queue=2, per_user_queue=1, max_wait=5)
+        b = Admission(self.dir, max_inflight=1, per_user=1, max_queue=2, per_user_queue=1, max_wait=5)
+        ready, result = threading.Event(), {}
+
+        def holder():
+            with a.admit(1):
+                ready.set()
+                time.sleep(0.3)
+
+        t = threading.Thread(target=holder)
+        t.start()
+        ready.wait()
+        self.assertEqual(b.global_inflight(), 1)
+        with b.admit(2) as ticket:
+            result["queue_ms"] = ticket.queue_ms
+        t.join()
+        self.assertGreaterEqual(result["queue_ms"], 150)
+        self.assertEqual(b.stats()["queued"], 1)
+
+    def test_new_arrival_does_not_jump_ahead_of_waiter(self):
+        adm = Admission(self.dir, max_inflight=1, per_user=1, max_queue=4, per_user_queue=2, max_wait=5)
+        slow = Admission(self.dir, max_inflight=1, per_user=1, max_queue=4, per_user_queue=2, max_wait=5)
+        slow.POLL_MIN = slow.POLL_MAX = 0.5  # 대기자가 늦게 확인해도 순서는 지켜져야 한다
+        order = []
+        with adm.admit("holder"):
+            waiter = self._queue_up(slow, "early", "early", order)
+        # 자리는 비었지만 대기자가 있으므로 새 요청은 줄 뒤로
+        with adm.admit("late"):
+            order.append("late")
+        waiter.join()
+        self.assertEqual(order, ["early", "late"])
+        self.assertEqual(adm.stats()["queued"], 1)
+
+    def test_waiters_rotate_across_users(self):
+        adm = Admission(self.dir, max_inflight=1, per_user=2, max_queue=8, per_user_queue=3, max_wait=5)
+        order, threads = [], []
+        with adm.admit("holder"):
+            threads.append(self._queue_up(adm, "a", "a1", order))
+            threads.append(self._queue_up(adm, "a", "a2", order))
+            threads.append(self._queue_up(adm, "b", "b1", order))
+        for t in threads:
+            t.join()
+        self.assertEqual(order, ["a1", "b1", "a2"])
+        self.assertEqual(adm.global_queued(), 0)
+        self.assertEqual(adm.global_inflight(), 0)
+
+    def test_counts_do_not_wait_for_admission_lock(self):
+        import fcntl
+        adm = Admission(self.dir, max_inflight=2, per_user=1)
+        result = {}
+        with adm.admit(1):
+            fd = os.open(os.path.join(self.dir, Admission.LOCK_FILE), os.O_CREAT | os.O_RDWR)
+            fcntl.flock(fd, fcntl.LOCK_EX)  # 다른 워커가 입장 판단 중
+            try:
+                t = threading.Thread(target=lambda: result.update(n=(adm.global_inflight(), adm.global_queued())))
+                t.start()
+                t.join(2)
+                self.assertFalse(t.is_alive())
+            finally:
+                os.close(fd)
+            t.join()
+        self.assertEqual(result["n"], (1, 0))
+
+    def test_chat_send_returns_429_when_queue_is_full(self):
+        user = get_user_model().objects.create_user("q", "q@example.com", "pw")
+        self.client.force_login(user)
+        with override_settings(ADMISSION_DIR=self.dir, ADMISSION_MAX_INFLIGHT=1, ADMISSION_MAX_QUEUE=0,
+                               RUNPOD_API_BASE="http://runpod.local"):
+            with Admission(self.dir, max_inflight=1, per_user=1).admit("other"):
+                r = self.client.post("/llm/api/chat/send", {"message": "hi"})
+        self.assertEqual(r.status_code, 429)
+        self.assertEqual(r.json()["reason"], "queue_full")
+        self.assertGreaterEqual(int(r["Retry-After"]), 1)
+        self.assertFalse(Message.objects.exists())
+
+    def test_stream_releases_slot_when_finished_or_closed_unread(self):
+        user = get_user_model().objects.create_user("st", "st@example.com", "pw")
+        self.client.force_login(user)
+        probe = Admission(self.dir, max_inflight=1, per_user=1)
+        lines = ['data: {"token": "a"}', "data: [DONE]"]
+        with override_settings(ADMISSION_DIR=self.dir, ADMISSION_MAX_INFLIGHT=1, RUNPOD_API_BASE="http://runpod.local"), \
+                mock.patch("requests.Session.post", side_effect=lambda *a, **k: _FakeStreamResponse(lines)):
+            r = self.client.post("/llm/api/chat/send/stream", {"message": "hi"})
+            self.assertEqual(probe.global_inflight(), 1)
+            body = b"".join(r.streaming_content).decode()
+            self.assertIn("event: done", body)
+            self.assertEqual(probe.global_inflight(), 0)
+
+            r = self.client.post("/llm/api/chat/send/stream", {"message": "again"})
+            self.assertEqual(probe.global_inflight(), 1)
+            r.close()  # 클라이언트가 읽기 전에 끊음
+            self.assertEqual(probe.global_inflight(), 0)
+
+
+@override_settings(AWS_S3_BUCKET="bkt", AWS_REGION="ap-northeast-2")
+class PresignCacheTest(SimpleTestCase):
+    def setUp(self):
+        storage._presign_cache = None
+
+    def test_key_from_url_unquotes(self):
+        url = "https://bkt.s3.ap-northeast-2.amazonaws.com/uploads/1/2/abc-%ED%95%9C%EA%B8%80%20a.pdf"
+        self.assertEqual(storage.s3_key_from_url(url), "uploads/1/2/abc-한글 a.pdf")
+        self.assertEqual(storage.s3_key_from_url("https://s3.ap-northeast-2.amazonaws.com/bkt/k/x.pdf"), "k/x.pdf")
+        self.assertIsNone(storage.s3_key_from_url("https://example.com/x.pdf"))
+
+    def test_presign_reuses_signature_until_near_expiry(self):
+        client = mock.Mock()
+        client.generate_presigned_url.side_effect = ["u1", "u2"]
+        with mock.patch.object(storage, "get_s3_client", return_value=client):
+            self.assertEqual(storage.presign_get("k", 3600), "u1")
+            self.assertEqual(storage.presign_get("k", 3600), "u1")
+            with mock.patch("time.time", return_value=__import__("time").time() + 3500):
+                self.assertEqual(storage.presign_get("k", 3600), "u2")
+        stats = storage.presign_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    def test_lru_eviction(self):
+        cache = storage.PresignCache(maxsize=2)
+        for k in ("a", "b", "c"):
+            cache.put(k, k, 1e12)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), "c")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+
+class ExistingSchemaMigrateTest(TransactionTestCase):
+    """운영 DB 처럼 llmproxy 테이블은 있는데 마이그레이션 기록이 없을 때 배포 명령(migrate --fake-initial)이 통과하는지."""
+    def test_fake_initial_adopts_existing_tables(self):
+        from django.core.management import call_command
+        from django.db.migrations.recorder import MigrationRecorder
+        out = io.StringIO()
+        call_command("migrate", "llmproxy", "zero", stdout=out)
+        call_command("migrate", "llmproxy", "0001", stdout=out)
+        MigrationRecorder(connection).migration_qs.filter(app="llmproxy").delete()
+
+        call_command("migrate", "llmproxy", fake_initial=True, stdout=out)
+        self.assertIn("0001_initial... FAKED", out.getvalue())
+        applied = MigrationRecorder(connection).applied_migrations()
+        self.assertIn(("llmproxy", "0002_conversation_message_indexes"), applied)
+
+
+# 쿼리 플랜 회귀 테스트: 사이드바/히스토리 쿼리가 인덱스를 타는지(filesort / full scan 금지)
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = [User.objects.create_user(f"u{i}", f"u{i}@example.com", "pw") for i in range(3)]
+        for u in cls.users:
+            for n in range(5):
+                conv = Conversation.objects.create(user=u, title=f"c{n}")
+                Message.objects.bulk_create([Message(conversation=conv, role="user", content="x") for _ in range(4)])
+        cls.conv = Conversation.objects.filter(user=cls.users[0]).first()
+
+    def assertUsesIndex(self, qs):
+        plan = qs.explain()
+        if connection.vendor == "sqlite":
+            self.assertNotIn("TEMP B-TREE", plan, plan)
+            self.assertIn("SEARCH", plan, plan)
+        elif connection.vendor == "mysql":
+            self.assertNotIn("Using filesort", plan, plan)
+            self.assertNotRegex(plan, r"\bALL\b", plan)
+
+    def test_conversation_list_plan(self):
+        self.assertUsesIndex(Conversation.objects.filter(user=self.users[0]).order_by("-updated_at", "-id"))
+
+    def test_message_history_plans(self):
+        msgs = self.conv.messages.all()
+        self.assertUsesIndex(msgs.order_by("-id")[:50])
+        self.assertUsesIndex(msgs.filter(id__lt=10**9).order_by("-id")[:50])
+        self.assertUsesIndex(msgs.filter(id__gt=0).order_by("id")[:50])
+
+
+class ChatHistoryTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("h", "h@example.com", "pw")
+        self.client.force_login(self.user)
+        self.conv = Conversation.objects.create(user=self.user, title="t")
+        self.ids = [Message.objects.create(conversation=self.conv, role="user", content=str(i)).id for i in range(7)]
+
+    def _get(self, **params):
+        return self.client.get("/llm/api/chat/history", {"conversation_id": self.conv.id, **params}).json()
+
+    def test_keyset_pages(self):
+        j = self._get(limit=3)
+        self.assertEqual([m["content"] for m in j["items"]], ["4", "5", "6"])
+        self.assertTrue(j["has_more"])
+        j = self._get(limit=3, before_id=j["first_id"])
+        self.assertEqual([m["content"] for m in j["items"]], ["1", "2", "3"])
+        j = self._get(after_id=self.ids[5])
+        self.assertEqual([m["content"] for m in j["items"]], ["6"])
+        self.assertFalse(j["has_more"])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/llm/api/chat/history", {"before_id": "x"}).status_code, 400)
+
+    def test_walks_back_to_start_and_stays_in_conversation(self):
+        other = Conversation.objects.create(user=self.user, title="o")
+        Message.objects.create(conversation=other, role="user", content="other")
+        seen, j = [], self._get(limit=2)
+        while True:
+            seen = [m["content"] for m in j["items"]] + seen
+            if not j["has_more"]:
+                break
+            j = self._get(limit=2, before_id=j["first_id"])
+        self.assertEqual(seen, [str(i) for i in range(7)])
+        # 빈 페이지는 커서를 그대로 돌려준다 (클라이언트가 같은 자리에서 다시 물어볼 수 있게)
+        j = self._get(after_id=self.ids[-1])
+        self.assertEqual((j["items"], j["last_id"], j["has_more"]), ([], self.ids[-1], False))
+        self.assertEqual(len(self._get(limit=10_000)["items"]), 7)  # 너무 큰 limit 은 HISTORY_PAGE_MAX 로 줄여 처리
+
+
+@override_settings(RUNPOD_API_BASE="http://runpod.local")
+class ChatSendTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("s", "s@example.com", "pw")
+        self.client.force_login(self.user)
+
+    def _post(self, answer="응답", **data):
+        resp = mock.Mock()
+        resp.json.return_value = {"answer": answer}
+        with mock.patch("requests.Session.post", return_value=resp) as post:
+            r = self.client.post("/llm/api/chat/send", {"message": "질문입니다", **data})
+        return r, post
+
+    def test_send_saves_both_turns(self):
+        r, post = self._post()
+        self.assertEqual(r.json()["item"]["content"], "응답")
+        conv = Conversation.objects.get(user=self.user)
+        self.assertEqual(list(conv.messages.values_list("role", flat=True)), ["user", "assistant"])
+        self.assertEqual(post.call_args.kwargs["json"]["messages"][-1]["content"], "질문입니다")
+
+    def test_llm_call_runs_outside_transaction(self):
+        seen = {}
+
+        def fake_post(*args, **kwargs):
+            seen["savepoints"] = len(connection.savepoint_ids)
+            resp = mock.Mock()
+            resp.json.return_value = {"answer": "ok"}
+            return resp
+
+        baseline = len(connection.savepoint_ids)
+        with mock.patch("requests.Session.post", side_effect=fake_post):
+            self.client.post("/llm/api/chat/send", {"message": "hi"})
+        # TestCase 자체가 트랜잭션을 감싸므로, LLM 호출 시점에 뷰가 추가로 연 atomic(savepoint)이 없어야 한다
+        self.assertEqual(seen["savepoints"], baseline)
+
+    def test_user_message_saved_under_conversation_row_lock(self):
+        from django.db.models import QuerySet
+        locked = []
+        original = QuerySet.select_for_update
+
+        def spy(qs, *args, **kwargs):
+            locked.append((qs.model, connection.in_atomic_block, len(connection.savepoint_ids)))
+            return original(qs, *args, **kwargs)
+
+        baseline = len(connection.savepoint_ids)
+        with mock.patch.object(QuerySet, "select_for_update", spy):
+            self._post()
+        # 유저 메시지 저장 단계의 짧은 atomic(savepoint) 안에서 Conversation 행을 잠근다
+        self.assertIn((Conversation, True, baseline + 1), locked)
+
+    def test_title_set_only_by_first_turn(self):
+        conv = Conversation.objects.create(user=self.user, title="")
+        self._post(conversation_id=conv.id)
+        with mock.patch("requests.Session.post") as post:
+            post.return_value.json.return_value = {"answer": "둘째"}
+            self.client.post("/llm/api/chat/send", {"message": "다른 질문입니다", "conversation_id": conv.id})
+        conv.refresh_from_db()
+        self.assertEqual(conv.title, "질문입니다")
+        # LLM 호출이 실패해도 유저 메시지는 이미 커밋된 별도 트랜잭션에 남는다
+        with mock.patch("requests.Session.post", side_effect=requests.ConnectionError("down")):
+            self.client.post("/llm/api/chat/send", {"message": "세 번째", "conversation_id": conv.id})
+        self.assertTrue(conv.messages.filter(role="user", content="세 번째").exists())
+
+
+@override_settings(RUNPOD_API_BASE="http://runpod.local")
+class ChatSendStreamAsyncTest(TestCase):
+    """ASGI(LLM_ASYNC_VIEWS) 스트림 뷰: uvicorn 이 하듯 __aiter__ 로 읽는다."""
+    def setUp(self):
+        from django.contrib.sessions.backends.db import SessionStore
+        self.user = get_user_model().objects.create_user("as", "as@example.com", "pw")
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, True)
+        self.session = SessionStore()
+
+    def _request(self, **headers):
+        from django.test import RequestFactory
+        request = RequestFactory().post("/llm/api/chat/send/stream", {"message": "질문"}, **headers)
+        request.user, request.session = self.user, self.session
+
+        async def auser():
+            return self.user
+        request.auser = auser
+        return request
+
+    def _stream(self, request, upstream_calls):
+        import warnings
+        from asgiref.sync import async_to_sync, sync_to_async
+        from llm_integration.llmproxy import views
+
+        def handler(req):
+            upstream_calls.append(str(req.url))
+            body = b'data: {"token": "a"}\n\ndata: {"token": "b"}\n\ndata: [DONE]\n\n'
+            return httpx.Response(200, content=body, headers={"Content-Type": "text/event-stream"})
+
+        async def main():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            with mock.patch("llm_integration.llmproxy.utils.llm_client.get_async_client", return_value=client):
+                r = await views.chat_send_stream_async(request)
+                parts = [part async for part in r]
+                await sync_to_async(r.close)()
+            return r, b"".join(parts).decode()
+
+        with override_settings(ADMISSION_DIR=self.dir), warnings.catch_warnings():
+            warnings.simplefilter("error")  # sync 이터레이터를 모아서 보내는 경로면 Django 가 경고한다
+            return async_to_sync(main)()
+
+    def test_streams_tokens_and_releases_slot_and_key(self):
+        calls = []
+        r, body = self._stream(self._request(HTTP_IDEMPOTENCY_KEY="a1"), calls)
+        self.assertTrue(r.is_async)
+        self.assertEqual(calls, ["http://runpod.local/v1/chat"])
+        self.assertLess(body.index('"t": "a"'), body.index('"t": "b"'))
+        self.assertIn("event: done", body)
+        conv = Conversation.objects.get(user=self.user)
+        self.assertEqual(list(conv.messages.values_list("content", flat=True)), ["질문", "ab"])
+        self.assertEqual(Admission(self.dir).global_inflight(), 0)
+        self.assertEqual(IdempotencyKey.objects.get(key="a1").status, "done")
+
+        again, replayed = self._stream(self._request(HTTP_IDEMPOTENCY_KEY="a1"), calls)
+        self.assertEqual((len(calls), again["Idempotent-Replayed"]), (1, "true"))
+        self.assertIn('"t": "ab"', replayed)
+
+    def test_async_mode_maps_stream_url(self):
+        from importlib import reload
+        from llm_integration.llmproxy import urls, views
+        self.addCleanup(reload, urls)
+        with override_settings(LLM_ASYNC_VIEWS=True):
+            reload(urls)
+        view = next(p.callback for p in urls.urlpatterns if p.name == "chat_send_stream")
+        self.assertIs(view, views.chat_send_stream_async)
+
+
+class RequestTimingTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("tm", "tm@example.com", "pw")
+        self.client.force_login(self.user)
+
+    def test_span_accumulates_and_is_noop_outside_request(self):
+        with timing.span("x"):
+            pass  # 측정 중인 요청 없음
+        timer, token = timing.begin()
+        try:
+            for _ in range(2):
+                with timing.span("s3_upload"):
+                    time.sleep(0.001)
+            Conversation.objects.count()
+        finally:
+            timing.end(token)
+        self.assertIsNone(timing.current())
+        summary = timer.summary()
+        self.assertEqual((summary["s3_upload"]["count"], summary["db"]["count"]), (2, 1))
+        self.assertIn('db;dur=', timer.server_timing())
+        self.assertIn('desc="1 queries"', timer.server_timing())
+        self.assertIn('s3_upload;dur=', timer.server_timing())
+
+    @override_settings(RUNPOD_API_BASE="http://runpod.local")
+    def test_chat_send_emits_server_timing_and_log(self):
+        resp = mock.Mock()
+        resp.json.return_value = {"answer": "ok"}
+        with mock.patch("requests.Session.post", return_value=resp), \
+                self.assertLogs("llm_integration.llmproxy.timing", level="INFO") as logs:
+            r = self.client.post("/llm/api/chat/send", {"message": "hi"})
+        header = r["Server-Timing"]
+        for name in ("db;", "queue;", "context;", "runpod;", "total;"):
+            self.assertIn(name, header)
+        self.assertIn("view=llm:chat_send status=200", logs.output[-1])
+        self.assertRegex(logs.output[-1], r"queries=[1-9]")
+
+    @override_settings(SERVER_TIMING_HEADER=False)
+    def test_header_can_be_disabled(self):
+        r = self.client.get("/llm/api/conversations")
+        self.assertEqual(r.status_code, 200)
+        self.assertFalse(r.has_header("Server-Timing"))
+
+
+@override_settings(RUNPOD_API_BASE="http://runpod.local", RUNPOD_RETRIES=0, METRICS_TOKEN="")
+class MetricsTest(TestCase):
+    def setUp(self):
+        resilience.reset_all()
+        self.user = get_user_model().objects.create_user("pm", "pm@example.com", "pw")
+        self.client.force_login(self.user)
+
+    def _sample(self, name, labels):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    def test_scrape_reports_requests_llm_and_upstream_errors(self):
+        errors = self._sample("llmproxy_upstream_errors_total", {"kind": "http_5xx"})
+        llm_errors = self._sample("llmproxy_llm_duration_seconds_count", {"mode": "sync", "outcome": "error"})
+        with mock.patch("requests.Session.post", return_value=_http_resp(503, {})):
+            self.client.post("/llm/api/chat/send", {"message": "hi"})
+        self.assertEqual(self._sample("llmproxy_upstream_errors_total", {"kind": "http_5xx"}), errors + 1)
+        self.assertEqual(self._sample("llmproxy_llm_duration_seconds_count", {"mode": "sync", "outcome": "error"}),
+                         llm_errors + 1)
+
+        r = self.client.get("/metrics")
+        self.assertEqual(r.status_code, 200)
+        body = r.content.decode()
+        self.assertIn('llmproxy_http_request_duration_seconds_count{method="POST",status="200",view="llm:chat_send"}', body)
+        self.assertIn("llmproxy_admission_queue_depth 0.0", body)
+        self.assertIn("llmproxy_admission_inflight 0.0", body)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_token_required_when_configured(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        r = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(r.status_code, 200)
+
+    def test_multiprocess_scrape_sums_workers(self):
+        with tempfile.TemporaryDirectory() as d:
+            code = ("from llm_integration.llmproxy.utils import metrics; "
+                    "metrics.observe_request('llm:chat_history', 'GET', 200, 0.05)")
+            env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": d}
+            for _ in range(2):  # 워커 두 개
+                subprocess.run([sys.executable, "-c", code], env=env, check=True, cwd=settings.BASE_DIR)
+            with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": d}):
+                body, _ = metrics.render()
+        self.assertIn(
+            b'llmproxy_http_request_duration_seconds_count{method="GET",status="200",view="llm:chat_history"} 2.0', body,
+        )
+
+    def test_scrape_merges_worker_container_dir(self):
+        with tempfile.TemporaryDirectory() as web, tempfile.TemporaryDirectory() as worker:
+            code = "from llm_integration.llmproxy.utils import metrics; metrics.time_extract().__enter__().__exit__()"
+            # run_jobs 컨테이너: 자기 디렉터리에 기록
+            subprocess.run([sys.executable, "-c", code], env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": worker},
+                           check=True, cwd=settings.BASE_DIR)
+            with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": web}), \
+                    override_settings(METRICS_EXTRA_DIRS=[worker]):
+                body, _ = metrics.render()
+        self.assertIn(b"llmproxy_pdf_extract_seconds_count 1.0", body)
+        self.assertEqual(body.count(b"# TYPE llmproxy_pdf_extract_seconds histogram"), 1)
+
+
+@override_settings(RUNPOD_API_BASE="http://runpod.local")
+class IdempotencyTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("i", "i@example.com", "pw")
+        self.client.force_login(self.user)
+        self.conv = Conversation.objects.create(user=self.user, title="t")
+
+    def _send(self, key, message="질문"):
+        resp = mock.Mock()
+        resp.json.return_value = {"answer": "한 번만 생성"}
+        with mock.patch("requests.Session.post", return_value=resp) as post:
+            r = self.client.post("/llm/api/chat/send", {"message": message, "conversation_id": self.conv.id},
+                                 HTTP_IDEMPOTENCY_KEY=key)
+        return r, post
+
+    def test_retry_replays_without_second_turn(self):
+        first, post = self._send("k1")
+        self.assertEqual(post.call_count, 1)
+        again, post = self._send("k1")
+        self.assertEqual(post.call_count, 0)
+        self.assertEqual(again["Idempotent-Replayed"], "true")
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(self.conv.messages.count(), 2)
+
+    def test_key_reused_for_other_message(self):
+        self._send("k2")
+        r, post = self._send("k2", message="다른 질문")
+        self.assertEqual((r.status_code, r.json()["code"], post.call_count), (422, "idempotency_key_reused", 0))
+
+    def test_in_flight_duplicate_waits_for_first_result(self):
+        fp = idempotency.fingerprint(str(self.conv.id), "질문")
+        rec = IdempotencyKey.objects.create(user=self.user, key="k3", fingerprint=fp,
+                                            expires_at=timezone.now() + timedelta(hours=1))
+        body = {"ok": True, "conversation_id": self.conv.id, "item": {"content": "첫 요청 결과"}}
+
+        def first_request_finishes(_delay):
+            # 다른 워커의 첫 요청이 기다리는 동안 끝난 상황
+            idempotency.finish(rec, 200, body)
+
+        with mock.patch("llm_integration.llmproxy.idempotency.time.sleep", side_effect=first_request_finishes) as sleep:
+            r, post = self._send("k3")
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual((r.json(), post.call_count), (body, 0))
+        self.assertEqual(self.conv.messages.count(), 0)
+
+    @override_settings(IDEMPOTENCY_WAIT=0)
+    def test_gives_up_with_409_and_failed_turn_frees_key(self):
+        fp = idempotency.fingerprint(str(self.conv.id), "질문")
+        IdempotencyKey.objects.create(user=self.user, key="k4", fingerprint=fp,
+                                      expires_at=timezone.now() + timedelta(hours=1))
+        r, _ = self._send("k4")
+        self.assertEqual((r.status_code, r["Retry-After"]), (409, "5"))
+
+        with mock.patch("llm_integration.llmproxy.views.upstream_retry_after", return_value=10):
+            r, _ = self._send("k5")
+        self.assertEqual(r.status_code, 503)
+        self.assertFalse(IdempotencyKey.objects.filter(key="k5").exists())
+
+    def test_llm_error_turn_is_not_replayed(self):
+        resilience.reset_all()
+        self.addCleanup(resilience.reset_all)
+        with mock.patch("requests.Session.post", side_effect=requests.ConnectionError("boom")):
+            r = self.client.post("/llm/api/chat/send", {"message": "질문", "conversation_id": self.conv.id},
+                                 HTTP_IDEMPOTENCY_KEY="k6")
+        self.assertIn("LLM error", r.json()["item"]["content"])
+        self.assertFalse(IdempotencyKey.objects.filter(key="k6").exists())
+        again, post = self._send("k6")  # 같은 키로 재시도 → 실제로 다시 생성
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(again.json()["item"]["content"], "한 번만 생성")
+
+    def _stream(self, key, lines=('data: {"token": "스트림 "}', 'data: {"token": "답"}', "data: [DONE]")):
+        with mock.patch("requests.Session.post", side_effect=lambda *a, **k: _FakeStreamResponse(list(lines))) as post:
+            r = self.client.post("/llm/api/chat/send/stream", {"message": "질문", "conversation_id": self.conv.id},
+                                 HTTP_IDEMPOTENCY_KEY=key)
+            body = b"".join(r.streaming_content).decode()
+            r.close()
+        return r, body, post
+
+    def test_stream_retry_replays_done_event(self):
+        first, body, post = self._stream("s1")
+        self.assertEqual(post.call_count, 1)
+        again, replayed, post = self._stream("s1")
+        self.assertEqual((post.call_count, again["Idempotent-Replayed"]), (0, "true"))
+        done = lambda text: json.loads(text.split("event: done\ndata: ")[1].split("\n")[0])
+        self.assertEqual(done(replayed), done(body))
+        self.assertIn('"t": "스트림 답"', replayed)
+        self.assertEqual(self.conv.messages.count(), 2)
+        # chat_send 도 같은 키 공간
+        r, post = self._send("s1")
+        self.assertEqual((r.json()["item"]["content"], post.call_count), ("스트림 답", 0))
+
+    def test_stream_closed_before_done_frees_key(self):
+        with mock.patch("requests.Session.post", side_effect=lambda *a, **k: _FakeStreamResponse(["data: [DONE]"])):
+            r = self.client.post("/llm/api/chat/send/stream", {"message": "질문", "conversation_id": self.conv.id},
+                                 HTTP_IDEMPOTENCY_KEY="s2")
+            self.assertEqual(IdempotencyKey.objects.get(key="s2").status, "pending")
+            r.close()
+        self.assertFalse(IdempotencyKey.objects.filter(key="s2").exists())
+
+    def test_expired_keys_are_purged_periodically_not_per_request(self):
+        from django.core.management import call_command
+        past = timezone.now() - timedelta(minutes=1)
+        IdempotencyKey.objects.create(user=self.user, key="old", fingerprint="x", status="done", expires_at=past)
+        IdempotencyKey.objects.create(user=self.user, key="k7", fingerprint="x", status="done", expires_at=past)
+        self._send("k7", message="새 질문")  # 만료된 같은 키만 지우고 새 요청으로 처리
+        self.assertEqual(IdempotencyKey.objects.get(key="k7").status, "done")
+        self.assertTrue(IdempotencyKey.objects.filter(key="old").exists())
+
+        with mock.patch("signal.signal"):  # 테스트 프로세스의 SIGINT/SIGTERM 핸들러는 그대로
+            call_command("run_jobs", "--once", stdout=io.StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["k7"])
+
+
+@override_settings(RUNPOD_API_BASE="http://runpod.local", CONVERSATION_SUMMARY_EVERY=4, CONVERSATION_SUMMARY_KEEP=2)
+class ConversationSummaryTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("m", "m@example.com", "pw")
+        self.client.force_login(self.user)
+        self.conv = Conversation.objects.create(user=self.user, title="t")
+
+    def _send(self, text):
+        resp = mock.Mock()
+        resp.json.return_value = {"answer": f"답 {text}"}
+        with mock.patch("requests.Session.post", return_value=resp) as post:
+            self.client.post("/llm/api/chat/send", {"message": text, "conversation_id": self.conv.id})
+        return post.call_args.kwargs["json"]["messages"]
+
+    def test_summary_job_every_n_turns_then_prompt_stays_bounded(self):
+        self._send("q1")
+        self._send("q2")
+        self.assertFalse(BackgroundJob.objects.filter(kind="summarize").exists())
+        self._send("q3")  # 6 messages = KEEP(2) + EVERY(4)
+        self.assertEqual(BackgroundJob.objects.filter(kind="summarize", status="queued").count(), 1)
+        self._send("q4")  # 대기 중인 작업이 있으면 더 걸지 않는다
+        self.assertEqual(BackgroundJob.objects.filter(kind="summarize").count(), 1)
+
+        resp = mock.Mock()
+        resp.json.return_value = {"answer": "- q1~q3 논의"}
+        with mock.patch("requests.Session.post", return_value=resp) as post:
+            job = jobs.run_job(jobs.claim_next("test"))
+        self.assertEqual(job.status, "done")
+        prompt = post.call_args.kwargs["json"]["messages"][-1]["content"]
+        self.assertIn("q1", prompt)
+        self.assertNotIn("q4", prompt)  # 최근 KEEP 개는 요약하지 않는다
+
+        self.conv.refresh_from_db()
+        msgs = list(self.conv.messages.values_list("id", flat=True))
+        self.assertEqual(self.conv.summary_upto_id, msgs[-3])
+        sent = self._send("q5")
+        self.assertEqual(sent[0], {"role": "system", "content": "이전 대화 요약:\n- q1~q3 논의"})
+        self.assertEqual([m["content"] for m in sent[1:]], ["q4", "답 q4", "q5"])
+
+    def test_summary_job_takes_admission_slot_or_requeues(self):
+        for n in range(3):
+            self._send(f"q{n}")
+        job = BackgroundJob.objects.get(kind="summarize")
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d, True)
+        resp = mock.Mock()
+        resp.json.return_value = {"answer": "- 요약"}
+        with override_settings(ADMISSION_DIR=d, ADMISSION_MAX_INFLIGHT=1, ADMISSION_PER_USER=1), \
+                mock.patch("requests.Session.post", return_value=resp) as post:
+            with Admission(d, max_inflight=1, per_user=1).admit("chat-user"):  # 대화형 요청이 GPU 를 쓰는 중
+                job = jobs.run_job(jobs.claim_next("test"))
+            self.assertEqual((job.status, post.call_count), ("queued", 0))
+            self.assertIn("gpu busy", job.last_error)
+
+            BackgroundJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            probe = Admission(d)
+            post.side_effect = lambda *a, **k: (self.assertEqual(probe.global_inflight(), 1), resp)[1]
+            job = jobs.run_job(jobs.claim_next("test"))
+        self.assertEqual((job.status, post.call_count), ("done", 1))
+        self.assertEqual(probe.global_inflight(), 0)
+
+
+@override_settings(RUNPOD_API_BASE="http://runpod.local", RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("rc", "rc@example.com", "pw")
+        self.client.force_login(self.user)
+
+    def _ask(self, text, answer="캐시할 답"):
+        # 새 대화마다 앞선 대화가 없으니 scope 는 (사용자, 파라미터) 로 같다
+        conv = Conversation.objects.create(user=self.user, title="t")
+        resp = mock.Mock()
+        resp.json.return_value = {"answer": answer}
+        with mock.patch("requests.Session.post", return_value=resp) as post:
+            r = self.client.post("/llm/api/chat/send", {"message": text, "conversation_id": conv.id})
+        return r.json(), post
+
+    def test_repeat_question_skips_llm(self):
+        first, post = self._ask("환불 규정이 어떻게 되나요?")
+        self.assertEqual(first["context"]["cache"], "miss")
+        self.assertEqual(post.call_count, 1)
+        again, post = self._ask("환불 규정이 어떻게 되나요")  # 문장부호만 다름
+        self.assertEqual(again["context"]["cache"], "exact")
+        self.assertEqual(post.call_count, 0)
+        self.assertEqual(again["item"]["content"], "캐시할 답")
+        st = ResponseCacheEntry.stats()
+        self.assertEqual((st["entries"], st["hits"]), (1, 1))
+
+    def test_errors_are_not_cached_and_users_are_isolated(self):
+        with mock.patch("requests.Session.post", side_effect=requests.exceptions.ReadTimeout("slow")):
+            self.client.post("/llm/api/chat/send", {"message": "q"})
+        self.assertFalse(ResponseCacheEntry.objects.exists())
+        self._ask("같은 질문")
+        self.user = get_user_model().objects.create_user("rc2", "rc2@example.com", "pw")
+        self.client.force_login(self.user)
+        body, post = self._ask("같은 질문")
+        self.assertEqual((body["context"]["cache"], post.call_count), ("miss", 1))
+
+    @override_settings(RESPONSE_CACHE_NEAR_DUP=True, RESPONSE_CACHE_NEAR_DUP_THRESHOLD=0.75)
+    def test_near_duplicate_question(self):
+        self._ask("배송은 보통 며칠 걸리나요")
+        body, post = self._ask("배송은 보통 며칠 걸리나여")  # 오타 하나
+        self.assertEqual((body["context"]["cache"], post.call_count), ("near", 0))
+        body, post = self._ask("결제 수단은 무엇이 있나요")
+        self.assertEqual((body["context"]["cache"], post.call_count), ("miss", 1))
+
+    @override_settings(RESPONSE_CACHE_MAX_ENTRIES=2)
+    def test_ttl_and_lru_eviction(self):
+        ck = [response_cache.CacheKey("s", f"q{n}") for n in range(3)]
+        response_cache.store(ck[0], "a0", 2.0)
+        response_cache.store(ck[1], "a1", 2.0)
+        self.assertEqual(response_cache.lookup(ck[0]), ("a0", "exact"))  # q0 이 최근 사용 → q1 이 LRU
+        response_cache.store(ck[2], "a2", 2.0)
+        self.assertEqual(ResponseCacheEntry.objects.count(), 3)  # store 는 쓰기만, 정리는 purge
+        self.assertEqual(response_cache.purge(), 1)
+        self.assertEqual(set(ResponseCacheEntry.objects.values_list("question", flat=True)), {"q0", "q2"})
+        self.assertEqual(ResponseCacheEntry.stats()["gpu_seconds_saved"], 2.0)
+
+        ResponseCacheEntry.objects.filter(question="q2").update(expires_at=timezone.now())
+        self.assertEqual(response_cache.lookup(ck[2]), (None, None))
+        self.assertEqual(response_cache.purge(), 1)
+        self.assertEqual(list(ResponseCacheEntry.objects.values_list("question", flat=True)), ["q0"])
+
+    def test_store_does_not_scan_the_table(self):
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response_cache.store(response_cache.CacheKey("s", "q"), "a", 1.0)
+        self.assertFalse([q["sql"] for q in queries if q["sql"].startswith("DELETE")])
+
+
+class ConversationsListTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("l", "l@example.com", "pw")
+        self.client.force_login(self.user)
+        for n in range(5):
+            Conversation.objects.create(user=self.user, title=f"c{n}")
+
+    def test_cursor_pages_cover_all_without_duplicates(self):
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            j = self.client.get("/llm/api/conversations", params).json()
+            seen += [c["id"] for c in j["items"]]
+            cursor = j["next_cursor"]
+            if not cursor:
+                break
+        expected = list(Conversation.objects.filter(user=self.user).order_by("-updated_at", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_etag_returns_304_until_list_changes(self):
+        r = self.client.get("/llm/api/conversations")
+        etag = r["ETag"]
+        self.assertEqual(self.client.get("/llm/api/conversations", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Conversation.objects.filter(user=self.user).first().delete()
+        self.assertEqual(self.client.get("/llm/api/conversations", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_bad_cursor(self):
+        self.assertEqual(self.client.get("/llm/api/conversations", {"cursor": "!!"}).status_code, 400)
+
+
+@override_settings(RUNPOD_API_BASE="http://runpod.local")
+class PdfDocumentTest(TestCase):
+    def test_store_dedups_and_compresses(self):
+        md = "# 제목\n\n" + "본문 " * 2000
+        a = PdfDocument.store(md)
+        b = PdfDocument.store(md)
+        self.assertEqual(a.pk, b.pk)
+        self.assertLess(len(bytes(a.content_z)), a.size)
+        self.assertEqual(PdfDocument.objects.get(pk=a.pk).markdown, md)
+
+    def test_chat_send_loads_document_only_when_attaching(self):
+        user = get_user_model().objects.create_user("d", "d@example.com", "pw")
+        self.client.force_login(user)
+        conv = Conversation.objects.create(user=user, title="t", uploaded_pdf_url="https://b/x.pdf",
+                                           document=PdfDocument.store("문서 내용"))
+        resp = mock.Mock()
+        resp.json.return_value = {"answer": "ok"}
+        with mock.patch("requests.Session.post", return_value=resp) as post:
+            self.client.post("/llm/api/chat/send", {"message": "q", "conversation_id": conv.id})
+            self.client.post("/llm/api/chat/send", {"message": "q2", "conversation_id": conv.id})
+        first, second = [c.kwargs["json"]["messages"] for c in post.call_args_list]
+        self.assertIn("문서 내용", first[-1]["content"])
+        self.assertFalse(any("문서 내용" in m["content"] for m in second))
+
+    @override_settings(CONTEXT_TOKEN_BUDGET=500)
+    def test_large_document_is_budgeted_and_resent_until_complete(self):
+        user = get_user_model().objects.create_user("b", "b@example.com", "pw")
+        self.client.force_login(user)
+        md = "\n\n---\n\n".join(f"page {i} " + "word " * 300 for i in range(30))
+        conv = Conversation.objects.create(user=user, title="t", uploaded_pdf_url="https://b/x.pdf",
+                                           document=PdfDocument.store(md))
+        resp = mock.Mock()
+        resp.json.return_value = {"answer": "ok"}
+        with mock.patch("requests.Session.post", return_value=resp) as post:
+            ctx = self.client.post("/llm/api/chat/send", {"message": "q", "conversation_id": conv.id}).json()["context"]
+        self.assertTrue(ctx["document_truncated"])
+        self.assertLessEqual(ctx["total_tokens"], 500)
+        sent = post.call_args.kwargs["json"]["messages"][-1]["content"]
+        self.assertLess(len(sent), len(md) // 4)
+        # 일부만 보냈으므로 다음 턴에도 문서 청크를 다시 고른다
+        self.assertFalse(Conversation.objects.get(pk=conv.pk).pdf_context_attached)
+
+    def test_purge_keeps_documents_other_users_can_reuse(self):
+        from django.core.management import call_command
+        from uauth.models import UserDeletionStatus
+
+        User = get_user_model()
+        gone, stays = User.objects.create_user("gone", "g@example.com", "pw"), User.objects.create_user("st", "st@example.com", "pw")
+        own_doc, shared_doc, cached_doc = PdfDocument.store("탈퇴자 문서"), PdfDocument.store("공유 문서"), PdfDocument.store("캐시 문서")
+        Conversation.objects.create(user=gone, title="t", document=own_doc)
+        Conversation.objects.create(user=gone, title="t", document=shared_doc)
+        Conversation.objects.create(user=stays, title="t", document=shared_doc)
+        PdfExtraction.objects.create(source_sha256="a" * 64, document=own_doc, owner=gone)
+        PdfExtraction.objects.create(source_sha256="b" * 64, document=cached_doc, owner=stays)  # 대화는 지웠지만 캐시는 남음
+        UserDeletionStatus.objects.create(user=gone, pending_until=timezone.now() - timedelta(days=1))
+
+        call_command("purge_deleted_accounts", stdout=io.StringIO())
+
+        # 탈퇴자 문서와 그 추출 캐시는 삭제, 다른 사용자가 참조하는 문서/캐시는 유지
+        self.assertEqual(set(PdfDocument.objects.values_list("pk", flat=True)), {shared_doc.pk, cached_doc.pk})
+        self.assertEqual(list(PdfExtraction.objects.values_list("source_sha256", flat=True)), ["b" * 64])
+
+
+class ContextBuilderTest(SimpleTestCase):
+    def test_history_is_trimmed_oldest_first_within_budget(self):
+        history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"msg{i} " + "x" * 400} for i in range(10)]
+        messages, _, st = build_context(history, budget=400)
+        self.assertLessEqual(st["total_tokens"], 400)
+        self.assertEqual(messages[-1], history[-1])
+        self.assertEqual(messages, history[-len(messages):])
+        self.assertEqual(st["history_dropped"], 10 - len(messages))
+
+    def test_document_keeps_relevant_pages_under_budget(self):
+        pages = [f"페이지 {i} 일반 내용 " + "filler " * 200 for i in range(20)]
+        pages[13] = "환불 정책: 구매 후 7일 이내 환불 가능. " + "filler " * 200
+        doc = "\n\n---\n\n".join(pages)
+        history = [{"role": "user", "content": "환불 정책 알려줘"}]
+        _, atts, st = build_context(history, [{"type": "markdown", "content": doc}], budget=1200)
+        self.assertIn("환불 정책", atts[0]["content"])
+        self.assertTrue(st["document_truncated"])
+        self.assertLess(st["document_chunks"], st["document_chunks_total"])
+        self.assertLessEqual(count_tokens(atts[0]["content"]), st["document_tokens"])
+        self.assertLessEqual(st["total_tokens"], 1200)
+
+
+class BM25IndexTest(TestCase):
+    def _doc(self):
+        pages = [f"{i}장. 일반적인 서비스 안내와 이용 방법 설명입니다." for i in range(40)]
+        pages[17] = "17장. 환불은 구매일로부터 7일 이내에 신청할 수 있습니다. refund policy."
+        pages[31] = "31장. 배송비는 주문 금액에 따라 달라집니다."
+        return "\n\n---\n\n".join(pages)
+
+    def test_top_chunk_matches_question_and_roundtrips(self):
+        idx = BM25Index.from_bytes(BM25Index.build(self._doc()).to_bytes())
+        self.assertEqual(len(idx.chunks), 40)
+        self.assertEqual(idx.search("환불 기간이 어떻게 되나요?", 3)[0][0], 17)
+        self.assertEqual(idx.search("refund", 3)[0][0], 17)
+        self.assertEqual(idx.search("배송비", 3)[0][0], 31)
+        self.assertEqual(idx.search("zzz", 3), [])
+
+    def test_chat_attaches_retrieved_chunks_not_whole_document(self):
+        user = get_user_model().objects.create_user("r", "r@example.com", "pw")
+        self.client.force_login(user)
+        doc = PdfDocument.store(self._doc())
+        PdfIndex.build(doc)
+        conv = Conversation.objects.create(user=user, title="t", uploaded_pdf_url="https://b/x.pdf", document=doc)
+        resp = mock.Mock()
+        resp.json.return_value = {"answer": "ok"}
+        with override_settings(CONTEXT_TOP_K=2, RUNPOD_API_BASE="http://runpod.local"), mock.patch("requests.Session.post", return_value=resp) as post:
+            ctx = self.client.post("/llm/api/chat/send", {"message": "환불 규정", "conversation_id": conv.id}).json()["context"]
+        sent = post.call_args.kwargs["json"]["messages"][-1]["content"]
+        self.assertIn("17장. 환불은", sent)
+        self.assertNotIn("31장", sent)
+        self.assertEqual((ctx["document_chunks"], ctx["document_chunks_total"]), (1, 40))
+
+
+def _fake_download(key):
+    tmp = tempfile.NamedTemporaryFile(suffix=".pdf")
+    tmp.write(b"pdf")
+    tmp.flush()
+    tmp.seek(0)
+    return tmp
+
+
+@override_settings(RUNPOD_API_BASE="http://runpod.local", AWS_S3_BUCKET="bkt", AWS_REGION="ap-northeast-2")
+class UploadJobTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("j", "j@example.com", "pw")
+        self.client.force_login(self.user)
+
+    def _upload(self, content=b"%PDF-1.4 fake"):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        f = SimpleUploadedFile("doc.pdf", content, content_type="application/pdf")
+        url = "https://bkt.s3.ap-northeast-2.amazonaws.com/uploads/k.pdf"
+        with mock.patch("llm_integration.llmproxy.views.upload_file", return_value=url) as up:
+            j = self.client.post("/llm/api/file/upload", {"file": f}).json()
+        j["_s3_uploads"] = up.call_count
+        return j
+
+    def _run_worker(self):
+        ingest = mock.Mock()
+        ingest.json.return_value = {"ok": True}
+        with mock.patch.object(jobs, "download_to_tempfile", side_effect=_fake_download), \
+                mock.patch.object(jobs, "pdf_bytes_to_markdown", return_value="# md") as extract, \
+                mock.patch("requests.Session.post", return_value=ingest):
+            while (job := jobs.claim_next("test")) is not None:
+                jobs.run_job(job)
+        return extract.call_count
+
+    def test_same_pdf_reuses_extraction_and_owner_s3_object(self):
+        self._upload()
+        self.assertEqual(self._run_worker(), 1)
+        j = self._upload()
+        self.assertEqual(j["_s3_uploads"], 0)
+        self.assertEqual(self._run_worker(), 0)
+        conv = Conversation.objects.get(pk=j["conversation_id"])
+        self.assertEqual((conv.s3_key, conv.document_id), ("uploads/k.pdf", PdfDocument.objects.get().pk))
+        st = PdfExtraction.stats()
+        self.assertEqual((st["hits"], st["misses"], st["hit_ratio"]), (1, 1, 0.5))
+        self.assertEqual(st["bytes_saved"], 2 * len(b"%PDF-1.4 fake"))
+
+    @override_settings(RUNPOD_API_BASE="", RUNPOD_API_BASES=["http://pod-a", "http://pod-b"])
+    def test_ingest_runs_with_endpoint_pool_only(self):
+        j = self._upload()
+        ingest = mock.Mock()
+        ingest.json.return_value = {"ok": True}
+        with mock.patch.object(jobs, "download_to_tempfile", side_effect=_fake_download), \
+                mock.patch.object(jobs, "pdf_bytes_to_markdown", return_value="# md"), \
+                mock.patch("requests.Session.post", return_value=ingest) as post:
+            jobs.run_job(jobs.claim_next("test"))
+        self.assertTrue(post.call_args.args[0].endswith("/v1/ingest"))
+        st = self.client.get("/llm/api/file/status", {"job_id": j["job_id"]}).json()
+        self.assertTrue(st["ingest_ok"])
+
+    def test_other_user_reuses_extraction_but_uploads_own_copy(self):
+        self._upload()
+        self._run_worker()
+        other = get_user_model().objects.create_user("o2", "o2@example.com", "pw")
+        self.client.force_login(other)
+        j = self._upload()
+        self.assertEqual(j["_s3_uploads"], 1)
+        self.assertEqual(self._run_worker(), 0)
+
+    def test_upload_returns_before_processing_then_worker_finishes(self):
+        j = self._upload()
+        self.assertEqual(j["status"], "queued")
+        conv = Conversation.objects.get(pk=j["conversation_id"])
+        self.assertEqual(conv.s3_key, "uploads/k.pdf")
+        self.assertIsNone(conv.document_id)
+
+        ingest = mock.Mock()
+        ingest.json.return_value = {"ok": True}
+        with mock.patch.object(jobs, "download_to_tempfile", side_effect=_fake_download), \
+                mock.patch.object(jobs, "pdf_bytes_to_markdown", return_value="# md"), \
+                mock.patch("requests.Session.post", return_value=ingest):
+            job = jobs.run_job(jobs.claim_next("test"))
+        self.assertEqual(job.status, "done")
+        self.assertIsNone(jobs.claim_next("test"))
+        self.assertEqual(PdfIndex.objects.get().document_id, Conversation.objects.get(pk=conv.pk).document_id)
+
+        st = self.client.get("/llm/api/file/status", {"job_id": j["job_id"]}).json()
+        self.assertEqual((st["status"], st["document_ready"], st["ingest_ok"]), ("done", True, True))
+        self.assertTrue(Conversation.objects.get(pk=conv.pk).pdf_context_attached)
+
+    def test_ingest_failure_is_retried_with_backoff(self):
+        self._upload()
+        with mock.patch.object(jobs, "download_to_tempfile", side_effect=_fake_download), \
+                mock.patch.object(jobs, "pdf_bytes_to_markdown", return_value="# md"), \
+                mock.patch("requests.Session.post", side_effect=ConnectionError("down")):
+            job = jobs.run_job(jobs.claim_next("test"))
+            self.assertEqual((job.status, job.attempts), ("queued", 1))
+            self.assertIsNone(jobs.claim_next("test"))  # run_after 가 미래
+            BackgroundJob.objects.update(run_after=job.created_at)
+            job = jobs.run_job(jobs.claim_next("test"))
+        # 재시도에서도 추출은 다시 하지 않는다
+        self.assertEqual(PdfDocument.objects.count(), 1)
+        self.assertEqual(job.attempts, 2)
+
+    def test_upload_is_hashed_while_received(self):
+        with mock.patch("llm_integration.llmproxy.views._hash_upload") as rehash:
+            self._upload(b"%PDF-1.4 streamed")
+        rehash.assert_not_called()
+        self.assertEqual(BackgroundJob.objects.get().payload["source_sha256"],
+                         hashlib.sha256(b"%PDF-1.4 streamed").hexdigest())
+
+    def test_worker_extracts_from_path_and_ingests_same_file(self):
+        self._upload()
+        ingest = mock.Mock()
+        ingest.json.return_value = {"ok": True}
+        with mock.patch.object(jobs, "download_to_tempfile", side_effect=_fake_download) as dl, \
+                mock.patch.object(jobs, "pdf_bytes_to_markdown", return_value="# md") as extract, \
+                mock.patch("requests.Session.post", return_value=ingest) as post:
+            jobs.run_job(jobs.claim_next("test"))
+        self.assertEqual(dl.call_count, 1)
+        src = extract.call_args.args[0]
+        self.assertIsInstance(src, str)
+        sent = post.call_args.kwargs["files"]["file"][1]
+        self.assertEqual(sent.name, src)
+
+    def test_status_is_owner_only(self):
+        j = self._upload()
+        other = get_user_model().objects.create_user("o", "o@example.com", "pw")
+        self.client.force_login(other)
+        self.assertEqual(self.client.get("/llm/api/file/status", {"job_id": j["job_id"]}).status_code, 404)
+
+
+class FakeRunPodTest(SimpleTestCase):
+    def setUp(self):
+        resilience.reset_all()
+
+    def test_chat_stream_and_ingest(self):
+        cfg = FakeRunPodConfig(latency=0.05, token_rate=200, tokens=10, ingest_latency=0)
+        with FakeRunPod(cfg) as fake:
+            client = LLMClient(fake.base_url)
+            self.assertEqual(client.chat([{"role": "user", "content": "hi"}])["tokens"], 10)
+            started = time.perf_counter()
+            pieces = list(client.chat_stream([{"role": "user", "content": "hi"}]))
+            elapsed = time.perf_counter() - started
+            self.assertEqual(len(pieces), 10)
+            self.assertGreaterEqual(elapsed, 0.05 + 9 / 200)  # 첫 토큰 지연 + 토큰 속도
+            self.assertTrue(client.ingest("a.pdf", b"%PDF-1.4", user_id="u", session_id="s")["ok"])
+        self.assertEqual(fake.requests, {"/v1/chat": 2, "/v1/ingest": 1})
+
+    @override_settings(RUNPOD_RETRIES=1, RUNPOD_RETRY_BASE=0)
+    def test_error_rate_returns_503(self):
+        with FakeRunPod(FakeRunPodConfig(latency=0, error_rate=1.0)) as fake:
+            with self.assertRaises(requests.HTTPError):
+                LLMClient(fake.base_url).chat([{"role": "user", "content": "hi"}])
+        self.assertEqual(fake.requests["/v1/chat"], 2)  # 503 은 재시도 대상
+
+
+class LoadTestStatsTest(SimpleTestCase):
+    def test_percentiles_and_summary(self):
+        lat = sorted(float(n) for n in range(1, 101))
+        self.assertEqual((loadtest.percentile(lat, 50), loadtest.percentile(lat, 95), loadtest.percentile(lat, 99)),
+                         (50.0, 95.0, 99.0))
+        summary = loadtest.summarize([("chat_send", True, 100.0), ("chat_send", False, 300.0), ("chat_history", True, 5.0)], 2.0)
+        self.assertEqual((summary["chat_send"]["errors"], summary["all"]["count"], summary["all"]["rps"]), (1, 3, 1.5))
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix("chat_send=1,unknown=2")
+
+    def test_compare_flags_p95_and_throughput_regressions(self):
+        def result(p95, rps):
+            row = {"count": 50, "p95_ms": p95, "rps": rps}
+            return {"levels": [{"concurrency": 4, "summary": {"chat_send": row, "all": row}}]}
+
+        rows = loadtest.compare(result(130, 8.0), result(100, 10.0), threshold_pct=10)
+        flagged = {(r["scenario"], r["metric"]) for r in rows if r["regression"]}
+        self.assertEqual(flagged, {("chat_send", "p95_ms"), ("all", "p95_ms"), ("all", "rps")})
+        self.assertFalse(any(r["regression"] for r in loadtest.compare(result(105, 9.5), result(100, 10.0), 10)))
+
+
+@override_settings(ADMISSION_DIR=tempfile.mkdtemp(prefix="bench-test-"))
+class LoadRunnerTest(TransactionTestCase):
+    def test_runs_real_views_against_fake_runpod(self):
+        resilience.reset_all()
+        user = get_user_model().objects.create_user("lr", "lr@example.com", "pw")
+        with FakeRunPod(FakeRunPodConfig(latency=0.01, token_rate=0)) as fake, \
+                override_settings(RUNPOD_API_BASE=fake.base_url, RUNPOD_API_BASES=[fake.base_url]):
+            level = loadtest.run_level(lambda i: loadtest.InProcessDriver(user),
+                                       {"chat_send": 1, "conversations_list": 1}, 1, requests=8, seed=1)
+        self.assertEqual(level["summary"]["all"]["count"], 8)
+        self.assertEqual(level["summary"]["all"]["errors"], 0)
+        self.assertEqual(fake.requests.get("/v1/chat", 0), level["summary"]["chat_send"]["count"])
+
+
+class ReplayFormatTest(SimpleTestCase):
+    def test_shape_diff(self):
+        before = replay.shape({"ok": True, "item": {"id": 1, "content": "a"}, "items": [{"id": 1}], "cursor": None})
+        after = replay.shape({"ok": True, "item": {"id": "1"}, "items": [], "cursor": "abc", "extra": 1})
+        self.assertEqual(replay.shape_diff(before, after), [
+            "$.extra: added", "$.item.content: missing", "$.item.id: number → str",
+        ])
+        self.assertEqual(replay.shape_diff(before, None), ["$: object → non-JSON"])
+
+    def test_loaders(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as fh:
+            fh.write('{"request_id": "x", "title": "not a request"}\n')
+            fh.write('{"method": "GET", "path": "/llm/api/conversations", "status": 200}\n')
+        self.addCleanup(os.remove, fh.name)
+        records, skipped = replay.load(fh.name)
+        self.assertEqual((len(records), skipped), (1, 1))
+
+        records, skipped = replay.load(os.path.join(settings.BASE_DIR, "test.http"))
+        self.assertEqual([replay.endpoint(r) for r in records], ["GET /healthz", "POST /v1/ingest", "POST /v1/chat"])
+        self.assertEqual(records[1]["form"]["session_id"], "s1")
+        self.assertEqual(records[1]["files"]["file"]["name"], "sample.pdf")
+        self.assertEqual(records[2]["json"]["max_new_tokens"], 512)
+        self.assertTrue(all(replay.is_runpod_path(r["path"]) for r in records))
+
+
+@override_settings(ADMISSION_DIR=tempfile.mkdtemp(prefix="replay-test-"))
+class TrafficReplayTest(TransactionTestCase):
+    def test_capture_then_replay(self):
+        resilience.reset_all()
+        User = get_user_model()
+        log = os.path.join(tempfile.mkdtemp(prefix="capture-"), "traffic.jsonl")
+        with FakeRunPod(FakeRunPodConfig(latency=0, token_rate=0)) as fake, \
+                override_settings(RUNPOD_API_BASE=fake.base_url, RUNPOD_API_BASES=[fake.base_url]):
+            with override_settings(TRAFFIC_CAPTURE_PATH=log):
+                self.client.force_login(User.objects.create_user("cap", "cap@example.com", "pw"))
+                conv_id = self.client.post("/llm/api/conversations/new").json()["id"]
+                self.client.post("/llm/api/chat/send", {"message": "환불 규정 알려줘", "conversation_id": conv_id})
+                self.client.get("/llm/api/chat/history", {"conversation_id": conv_id})
+                self.client.get("/llm/policy/terms")  # prefix 밖 → 안 남김
+
+            with open(log, encoding="utf-8") as fh:
+                lines = [json.loads(line) for line in fh]
+            self.assertEqual([r["path"] for r in lines],
+                             ["/llm/api/conversations/new", "/llm/api/chat/send", "/llm/api/chat/history"])
+            self.assertEqual(lines[1]["form"]["message"], "xx xx xxx")  # 원문은 남기지 않는다
+            self.assertEqual(lines[0]["ids"], {"id": conv_id})
+            self.assertEqual(len({r["user"] for r in lines}), 1)
+
+            # 다른 사용자/새 DB 행으로 재생: 캡처된 conversation id 는 새로 생긴 id 로 바뀌어야 404 가 안 난다
+            Conversation.objects.all().delete()
+            driver = loadtest.InProcessDriver(User.objects.create_user("rep", "rep@example.com", "pw"))
+            records, _ = replay.load(log)
+            run = replay.replay(records, lambda rec: driver, speed=0, concurrency=1)
+        total = run["summary"]["all"]
+        self.assertEqual((total["count"], total["errors"], total["status_mismatch"], total["shape_mismatch"]),
+                         (3, 0, 0, 0))
+        self.assertEqual(fake.requests["/v1/chat"], 2)
+
+
+class PdfExtractionTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pdf = make_synthetic_pdf(12, lines_per_page=2)
+
+    def test_parallel_pages_stream_in_order(self):
+        pages = list(iter_pages_markdown(self.pdf, workers=2, chunk_pages=3))
+        self.assertEqual(len(pages), 12)
+        for n, md in enumerate(pages, start=1):
+            self.assertIn(f"Chapter {n}:", md)
+
+    def test_page_budget(self):
+        limits = ExtractionLimits(max_pages=5, time_budget=60)
+        md = pdf_bytes_to_markdown(self.pdf, limits=limits)
+        self.assertEqual(limits.pages_done, 5)
+        self.assertIn("Chapter 5:", md)
+        self.assertNotIn("Chapter 6:", md)
+        self.assertIn("page budget", md)
+
+    def test_time_budget(self):
+        limits = ExtractionLimits(max_pages=100, time_budget=0)
+        list(iter_pages_markdown(self.pdf, workers=1, chunk_pages=4, limits=limits))
+        self.assertEqual(limits.pages_done, 0)
+        self.assertIn("time budget", limits.truncated_reason)
+
+    @override_settings(PDF_EXTRACT_WORKERS=1, PDF_EXTRACT_CHUNK_PAGES=3)
+    def test_failed_chunk_keeps_other_pages(self):
+        real = pdf_to_md._extract_range
+
+        def flaky(path, start, stop, deadline=None):
+            if start == 3:
+                raise RuntimeError("broken page")
+            return real(path, start, stop, deadline)
+
+        limits = ExtractionLimits(max_pages=100, time_budget=60)
+        with mock.patch.object(pdf_to_md, "_extract_range", flaky):
+            md = pdf_bytes_to_markdown(self.pdf, limits=limits)
+        self.assertEqual((limits.pages_done, limits.failed_pages), (9, 3))
+        self.assertIn("Chapter 3:", md)
+        self.assertIn("Chapter 7:", md)
+        self.assertNotIn("Chapter 4:", md)
+        self.assertIn("페이지 4–6 추출 실패", md)
+
+    def test_worker_stops_at_deadline(self):
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as fh:
+            fh.write(self.pdf)
+        self.addCleanup(os.remove, fh.name)
+        self.assertEqual(pdf_to_md._extract_range(fh.name, 0, 12, deadline=time.time() - 1), [])
+        self.assertEqual(len(pdf_to_md._extract_range(fh.name, 0, 12, deadline=time.time() + 60)), 12)
+
+    def test_stuck_chunk_recycles_pool(self):
+        pool = pdf_to_md._get_pool(2)
+        fut = pool.submit(time.sleep, 30)
+        time.sleep(0.5)
+        started = time.monotonic()
+        pdf_to_md._recycle_pool(pool)
+        with self.assertRaises(Exception):
+            fut.result(timeout=10)  # 워커가 종료돼 BrokenProcessPool
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertIsNot(pdf_to_md._get_pool(2), pool)
@@ -1,14 +1,21 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# ASGI(uvicorn 워커)로 띄울 때는 같은 URL에 async 뷰를 연결
+_async = getattr(settings, "LLM_ASYNC_VIEWS", False)
+
 app_name = "llm"
 
 urlpatterns = [
     path("", views.landing, name="landing"),
     path("chat/", views.chat_page, name="chat"),
     path("api/chat/history", views.chat_history, name="chat_history"),
-    path("api/chat/send", views.chat_send, name="chat_send"),
-    path("api/file/upload", views.file_upload, name="file_upload"),
+    path("api/chat/send", views.chat_send_async if _async else views.chat_send, name="chat_send"),
+    path("api/chat/send/stream", views.chat_send_stream_async if _async else views.chat_send_stream,
+         name="chat_send_stream"),
+    path("api/file/upload", views.file_upload_async if _async else views.file_upload, name="file_upload"),
+    path("api/file/status", views.file_status, name="file_status"),
     path("api/conversations", views.conversations_list, name="conversations_list"),
     path("api/conversations/new", views.conversations_new, name="conversations_new"),
     path("api/conversations/rename", views.conversations_rename, name="conversations_rename"),
@@ -0,0 +1,386 @@
+# 04_project/llm_integration/llmproxy/utils/admission.py
+"""
+GPU 호출 앞단의 동시 실행 제한 (gunicorn 워커 간 공유: ADMISSION_DIR 의 파일).
+- 실행 권한 = slot-<i> 파일 flock (전역 ADMISSION_MAX_INFLIGHT). 프로세스가 죽으면 OS가 풀어 준다
+- 대기열/실행 중 목록은 state.json (state.lock 을 잡고 판단하는 동안만 — 수 ms 이하)
+  · 도착 순서대로 번호표(seq), 대기자 각자 w-<seq> 파일을 flock → 죽은 워커의 대기자/실행 기록은 다음 판단 때 정리
+  · 차례: 사용자 간 라운드 로빈(가장 오래 전에 처리된 사용자부터), 같은 사용자 안에서는 FIFO
+  · 사용자별 동시 실행(ADMISSION_PER_USER)에 걸린 사용자는 건너뛰고 다음 사용자 (한 사용자가 앞을 막지 않게)
+- 누군가 기다리고 있으면 새 요청은 자리가 비어 있어도 줄 뒤에 선다 (늦게 온 요청이 새치기하지 않게)
+- 대기열(ADMISSION_MAX_QUEUE, 사용자별 ADMISSION_PER_USER_QUEUE)이 꽉 차면 바로 거절(429)
+- admit(key, wait=False): 바로 못 들어가면 줄 서지 않고 거절("busy") — 백그라운드 작업용
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 로컬 개발: 제한 없이 통과
+    fcntl = None
+
+
+def _setting(name: str, default):
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+class AdmissionRejected(Exception):
+    """대기열이 꽉 찼거나 너무 오래 기다림 → 429 + Retry-After."""
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _empty_state() -> dict:
+    # seq: 마지막 번호표, tick: 입장 횟수(라운드 로빈용 시계), served: 사용자 → 마지막 입장 tick
+    return {"seq": 0, "tick": 0, "waiters": [], "running": [], "served": {}}
+
+
+class Admission:
+    POLL_MIN = 0.02
+    POLL_MAX = 0.25
+    STATE_FILE = "state.json"
+    LOCK_FILE = "state.lock"
+
+    def __init__(self, directory: str = None, max_inflight: int = None, per_user: int = None,
+                 max_queue: int = None, per_user_queue: int = None, max_wait: float = None):
+        self.directory = directory or _setting("ADMISSION_DIR", "/tmp/llmproxy-admission")
+        self.max_inflight = int(max_inflight or _setting("ADMISSION_MAX_INFLIGHT", 8))
+        self.per_user = int(per_user or _setting("ADMISSION_PER_USER", 2))
+        self.max_queue = int(max_queue if max_queue is not None else _setting("ADMISSION_MAX_QUEUE", 32))
+        self.per_user_queue = int(per_user_queue if per_user_queue is not None else _setting("ADMISSION_PER_USER_QUEUE", 2))
+        self.max_wait = float(max_wait if max_wait is not None else _setting("ADMISSION_MAX_WAIT", 30))
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._hold_ewma = None
+        self.admitted = 0
+        self.queued = 0
+        self.waiting = 0
+        self.rejected = {}
+        self.queue_seconds_total = 0.0
+        self.queue_seconds_max = 0.0
+
+    # ---- 파일 락 ----
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _try_lock(self, name: str):
+        fd = os.open(self._path(name), os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except OSError:
+            os.close(fd)
+            return None
+
+    def _try_any(self, prefix: str, n: int):
+        """→ (fd, name) 또는 None. 시작 위치를 섞어 여러 워커가 같은 파일부터 두드리지 않게."""
+        start = random.randrange(n) if n > 0 else 0
+        for k in range(n):
+            name = f"{prefix}-{(start + k) % n}"
+            fd = self._try_lock(name)
+            if fd is not None:
+                return fd, name
+        return None
+
+    @staticmethod
+    def _release(*fds):
+        for fd in fds:
+            if fd is not None:
+                os.close(fd)  # close 하면 flock 도 풀린다
+
+    def _held(self, name: str) -> bool:
+        """누군가(살아 있는 프로세스) 이 파일을 flock 하고 있나. state.lock 안에서만 부른다."""
+        fd = self._try_lock(name)
+        if fd is None:
+            return True
+        self._release(fd)
+        return False
+
+    # ---- 공유 상태 ----
+    def _read_state(self) -> dict:
+        try:
+            with open(self._path(self.STATE_FILE), encoding="utf-8") as fh:
+                return {**_empty_state(), **json.load(fh)}
+        except (OSError, ValueError):
+            return _empty_state()
+
+    def _write_state(self, state: dict):
+        # 임시 파일 + rename: 읽는 쪽은 항상 온전한 스냅샷을 본다
+        tmp = self._path(f"{self.STATE_FILE}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(state, fh, separators=(",", ":"))
+        os.replace(tmp, self._path(self.STATE_FILE))
+
+    @contextmanager
+    def _state(self):
+        """state.lock 을 잡고 상태를 읽어(죽은 워커 기록 정리) 넘기고, 바뀌었으면 다시 쓴다."""
+        fd = os.open(self._path(self.LOCK_FILE), os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            state = self._read_state()
+            before = json.dumps(state, sort_keys=True)
+            self._prune(state)
+            try:
+                yield state
+            finally:
+                if json.dumps(state, sort_keys=True) != before:
+                    self._write_state(state)
+        finally:
+            os.close(fd)
+
+    def _prune(self, state: dict):
+        alive = []
+        for w in state["waiters"]:
+            if self._held(w["file"]):
+                alive.append(w)
+            else:
+                self._unlink(w["file"])  # 기다리던 워커가 죽음
+        state["waiters"] = alive
+        state["running"] = [r for r in state["running"] if self._held(r["slot"])]
+        active = {w["user"] for w in alive} | {r["user"] for r in state["running"]}
+        state["served"] = {u: t for u, t in state["served"].items() if u in active}
+
+    def _unlink(self, name: str):
+        try:
+            os.unlink(self._path(name))
+        except OSError:
+            pass
+
+    def _order(self, state: dict) -> list:
+        """지금 들어갈 수 있는 대기자 순서 (seq 목록): 사용자 간 라운드 로빈, 사용자 안에서는 FIFO, 사용자 한도 반영."""
+        queues = {}
+        for w in sorted(state["waiters"], key=lambda w: w["seq"]):
+            queues.setdefault(w["user"], []).append(w["seq"])
+        users = sorted(queues, key=lambda u: (state["served"].get(u, -1), queues[u][0]))
+        running = Counter(r["user"] for r in state["running"])
+        order = []
+        while any(queues[u] for u in users):
+            for u in users:
+                if not queues[u]:
+                    continue
+                if running[u] >= self.per_user:
+                    queues[u] = []  # 이 사용자는 실행 중인 것이 끝나야 차례가 온다
+                    continue
+                order.append(queues[u].pop(0))
+                running[u] += 1
+        return order
+
+    def _take_slot(self, state: dict, user: str):
+        """빈 slot 을 잡고 실행 중 목록에 기록 → (fd, name) 또는 None."""
+        got = self._try_any("slot", self.max_inflight)
+        if got is None:
+            return None
+        state["tick"] += 1
+        state["served"][user] = state["tick"]
+        state["running"].append({"slot": got[1], "user": user})
+        return got
+
+    def _leave_queue(self, state: dict, seq: int):
+        state["waiters"] = [w for w in state["waiters"] if w["seq"] != seq]
+
+    # ---- 입장 절차 (sync/async 공용: 기다릴 초를 yield, 잡은 slot 을 return) ----
+    def _steps(self, user: str, wait: bool = True):
+        with self._state() as st:
+            running = sum(1 for r in st["running"] if r["user"] == user)
+            if not st["waiters"] and running < self.per_user:
+                got = self._take_slot(st, user)
+                if got is not None:
+                    return got
+            if not wait:
+                self._reject("busy")
+            if sum(1 for w in st["waiters"] if w["user"] == user) >= self.per_user_queue:
+                self._reject("user_queue_full")
+            if len(st["waiters"]) >= self.max_queue:
+                self._reject("queue_full")
+            st["seq"] += 1
+            seq = st["seq"]
+            ticket = self._try_lock(f"w-{seq}")
+            st["waiters"].append({"seq": seq, "user": user, "file": f"w-{seq}"})
+        with self._lock:
+            self.queued += 1
+            self.waiting += 1
+        deadline = time.monotonic() + self.max_wait
+        delay = 0.0
+        try:
+            while True:
+                if delay:
+                    yield delay
+                with self._state() as st:
+                    order = self._order(st)
+                    position = order.index(seq) if seq in order else None
+                    if position is not None and position < self.max_inflight - len(st["running"]):
+                        got = self._take_slot(st, user)
+                        if got is not None:
+                            self._leave_queue(st, seq)
+                            return got
+                    if time.monotonic() > deadline:
+                        self._leave_queue(st, seq)
+                        self._reject("queue_timeout")
+                # 바로 다음 차례면 자주, 아니면 점점 느리게 확인
+                delay = self.POLL_MIN if position == 0 else min(self.POLL_MAX, max(self.POLL_MIN, delay * 2))
+        finally:
+            with self._lock:
+                self.waiting -= 1
+            with self._state() as st:
+                self._leave_queue(st, seq)  # 취소(클라이언트 끊김 등)로 빠질 때도
+            self._release(ticket)
+            self._unlink(f"w-{seq}")
+
+    def _exit(self, slot):
+        fd, name = slot
+        with self._state() as st:
+            st["running"] = [r for r in st["running"] if r["slot"] != name]
+            self._release(fd)
+
+    def retry_after(self) -> int:
+        """최근 실행 시간(EWMA)으로 잡은 재시도 권장 시간(초)."""
+        with self._lock:
+            hold = self._hold_ewma
+        return max(1, int(round(hold if hold is not None else 5)))
+
+    def _reject(self, reason: str):
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise AdmissionRejected(reason, self.retry_after())
+
+    def _admitted(self, waited: float):
+        with self._lock:
+            self.admitted += 1
+            self.queue_seconds_total += waited
+            self.queue_seconds_max = max(self.queue_seconds_max, waited)
+
+    def _done(self, held: float):
+        with self._lock:
+            self._hold_ewma = held if self._hold_ewma is None else 0.8 * self._hold_ewma + 0.2 * held
+
+    @contextmanager
+    def admit(self, user_key, wait: bool = True):
+        """with admit(user.id) as ticket: → ticket.queue_ms. 거절되면 AdmissionRejected."""
+        ticket = Ticket()
+        if fcntl is None:
+            yield ticket
+            return
+        start = time.monotonic()
+        steps = self._steps(str(user_key), wait)
+        try:
+            while True:
+                time.sleep(next(steps))
+        except StopIteration as stop:
+            slot = stop.value
+        ticket.queue_ms = int((time.monotonic() - start) * 1000)
+        self._admitted(ticket.queue_ms / 1000)
+        entered = time.monotonic()
+        try:
+            yield ticket
+        finally:
+            self._exit(slot)
+            self._done(time.monotonic() - entered)
+
+    @asynccontextmanager
+    async def aadmit(self, user_key):
+        ticket = await self.aenter(user_key)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    async def aenter(self, user_key) -> "Ticket":
+        """
+        aadmit 의 with 없는 버전: 슬롯을 잡은 ticket 을 돌려주고, 놓는 것은 ticket.release() (동기, 여러 번 불러도 됨).
+        async 스트리밍 응답처럼 응답의 close()(동기)에서 놓아야 할 때 쓴다.
+        """
+        ticket = Ticket()
+        if fcntl is None:
+            return ticket
+        start = time.monotonic()
+        steps = self._steps(str(user_key))
+        try:
+            while True:
+                await asyncio.sleep(next(steps))
+        except StopIteration as stop:
+            slot = stop.value
+        ticket.queue_ms = int((time.monotonic() - start) * 1000)
+        self._admitted(ticket.queue_ms / 1000)
+        ticket._hold(self, slot)
+        return ticket
+
+    # 스크레이프(/metrics)·/healthz 용: 락 없이 마지막 스냅샷만 읽는다 → 입장 판단을 막지 않는다.
+    # 죽은 워커의 기록은 다음 입장 판단 때 정리되므로 그 사이에는 조금 크게 보일 수 있다
+    def global_inflight(self) -> int:
+        """모든 워커 합산 실행 중 수."""
+        if fcntl is None:
+            return 0
+        return len(self._read_state()["running"])
+
+    def global_queued(self) -> int:
+        """모든 워커 합산 대기 중 수."""
+        if fcntl is None:
+            return 0
+        return len(self._read_state()["waiters"])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_inflight": self.max_inflight,
+                "per_user": self.per_user,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "waiting": self.waiting,
+                "rejected": dict(self.rejected),
+                "queue_ms_avg": int(self.queue_seconds_total * 1000 / self.admitted) if self.admitted else 0,
+                "queue_ms_max": int(self.queue_seconds_max * 1000),
+            }
+
+
+class Ticket:
+    def __init__(self):
+        self.queue_ms = 0
+        self._owner = None
+        self._slot = None
+        self._entered = None
+
+    def _hold(self, owner: Admission, slot):
+        self._owner, self._slot, self._entered = owner, slot, time.monotonic()
+
+    def release(self):
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            self._owner._exit(slot)
+            self._owner._done(time.monotonic() - self._entered)
+
+
+_admission_lock = threading.Lock()
+_admission = None
+_admission_key = None
+
+
+def get_admission() -> Admission:
+    """프로세스당 1개(설정이 바뀌면 새로). 실제 공유 상태는 파일 락이라 워커마다 따로 만들어도 된다."""
+    global _admission, _admission_key
+    key = (
+        _setting("ADMISSION_DIR", "/tmp/llmproxy-admission"),
+        _setting("ADMISSION_MAX_INFLIGHT", 8), _setting("ADMISSION_PER_USER", 2),
+        _setting("ADMISSION_MAX_QUEUE", 32), _setting("ADMISSION_PER_USER_QUEUE", 2),
+        _setting("ADMISSION_MAX_WAIT", 30),
+    )
+    with _admission_lock:
+        if _admission is None or _admission_key != key:
+            _admission = Admission()
+            _admission_key = key
+        return _admission
+
+
+def admission_stats() -> dict:
+    adm = get_admission()
+    return {**adm.stats(), "global_inflight": adm.global_inflight(), "global_queued": adm.global_queued()}
@@ -0,0 +1,74 @@
+# 04_project/llm_integration/llmproxy/utils/bm25.py
+"""
+업로드 문서용 로컬 BM25 검색 인덱스.
+- 청크는 context.split_chunks (PAGE_SEPARATOR 페이지 → 문단) 와 같은 기준
+- 한글 어절은 조사가 붙어 그대로는 잘 안 맞으므로 어절 + 글자 bigram 을 함께 색인
+- to_bytes()/from_bytes() 로 직렬화(zlib JSON)해서 DB(PdfIndex)에 보관
+"""
+import json
+import math
+import re
+import zlib
+from collections import Counter
+
+from .context import split_chunks
+
+_TOKEN_RE = re.compile(r"[0-9A-Za-z_]+|[가-힣]+")
+
+
+def tokenize(text: str) -> list:
+    out = []
+    for tok in _TOKEN_RE.findall((text or "").lower()):
+        out.append(tok)
+        if len(tok) > 2 and "가" <= tok[0] <= "힣":
+            out.extend(tok[i:i + 2] for i in range(len(tok) - 1))
+    return out
+
+
+class BM25Index:
+    """청크 목록 위의 역색인. postings: term → [(chunk_idx, tf), ...]"""
+    VERSION = 1
+
+    def __init__(self, chunks: list, postings: dict, lengths: list, k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.postings = postings
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+        self.avgdl = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+    @classmethod
+    def build(cls, markdown: str, chunk_tokens: int = None) -> "BM25Index":
+        chunks = split_chunks(markdown, chunk_tokens)
+        postings, lengths = {}, []
+        for i, chunk in enumerate(chunks):
+            terms = Counter(tokenize(chunk))
+            lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                postings.setdefault(term, []).append((i, tf))
+        return cls(chunks, postings, lengths)
+
+    def search(self, query: str, k: int = 5) -> list:
+        """질문 → [(chunk_idx, score), ...] 점수 높은 순 최대 k개(점수 0 제외)."""
+        n = len(self.chunks)
+        if not n:
+            return []
+        scores = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for i, tf in plist:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avgdl or 1))
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0]))[:k]
+
+    def to_bytes(self) -> bytes:
+        data = {"v": self.VERSION, "chunks": self.chunks, "postings": self.postings, "lengths": self.lengths}
+        return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "BM25Index":
+        data = json.loads(zlib.decompress(bytes(blob)).decode("utf-8"))
+        return cls(data["chunks"], {t: [tuple(p) for p in pl] for t, pl in data["postings"].items()}, data["lengths"])
@@ -0,0 +1,189 @@
+# 04_project/llm_integration/llmproxy/utils/context.py
+"""
+LLM에 보낼 컨텍스트(최근 대화 + 업로드 문서)를 토큰 예산 안에서 조립한다.
+- 토큰 수는 근사치(count_tokens): 모델 토크나이저 없이도 예산 초과를 막는 용도
+- 예산은 history / document 로 나누고, 한쪽이 덜 쓰면 남은 몫은 다른 쪽으로 넘긴다
+- 문서는 페이지(PAGE_SEPARATOR) → 문단 단위 청크로 쪼개 질문과 관련 높은 청크만 고른다
+  (attachment 에 BM25 인덱스(utils/bm25.py)가 있으면 그 청크/점수로 top-k 를 고른다)
+"""
+import re
+
+from .pdf_to_md import PAGE_SEPARATOR
+
+# _build_payload 가 문서 앞에 붙이는 안내문 + 메시지별 role/구분자 오버헤드
+MESSAGE_OVERHEAD_TOKENS = 4
+ATTACHMENT_OVERHEAD_TOKENS = 40
+SEPARATOR_TOKENS = 2  # count_tokens(PAGE_SEPARATOR)
+
+_WORD_RE = re.compile(r"[0-9A-Za-z_]+|[가-힣]+")
+
+
+def _setting(name: str, default):
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+def count_tokens(text: str) -> int:
+    """
+    근사 토큰 수. BPE 토크나이저 기준으로
+    - ASCII 는 약 4글자당 1토큰
+    - 한글 등 비 ASCII 는 글자당 약 1토큰
+    으로 셈한다(실제보다 약간 크게 잡히는 쪽).
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def _terms(text: str) -> list:
+    return [t.lower() for t in _WORD_RE.findall(text or "")]
+
+
+def split_chunks(markdown: str, max_tokens: int = None) -> list:
+    """문서 → 청크 목록. 페이지 단위로 자르고, 너무 긴 페이지는 문단(빈 줄) 단위로 다시 묶는다."""
+    max_tokens = int(max_tokens or _setting("CONTEXT_CHUNK_TOKENS", 400))
+    chunks = []
+    for page in (markdown or "").split(PAGE_SEPARATOR):
+        page = page.strip()
+        if not page:
+            continue
+        if count_tokens(page) <= max_tokens:
+            chunks.append(page)
+            continue
+        buf, buf_tokens = [], 0
+        for para in re.split(r"\n\s*\n", page):
+            para = para.strip()
+            if not para:
+                continue
+            n = count_tokens(para)
+            if buf and buf_tokens + n > max_tokens:
+                chunks.append("\n\n".join(buf))
+                buf, buf_tokens = [], 0
+            buf.append(para)
+            buf_tokens += n
+        if buf:
+            chunks.append("\n\n".join(buf))
+    return chunks
+
+
+def rank_chunks(chunks: list, query: str) -> list:
+    """질문 단어와 겹치는 정도로 청크 인덱스를 정렬(관련도 높은 순, 같으면 문서 앞쪽 우선)."""
+    q = set(_terms(query))
+    scores = []
+    for i, chunk in enumerate(chunks):
+        terms = _terms(chunk)
+        hits = sum(1 for t in terms if t in q)
+        scores.append((-(hits / (len(terms) ** 0.5) if terms else 0.0), i))
+    return [i for _, i in sorted(scores)]
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    if count_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + " …"
+
+
+def _fit_history(history: list, budget: int):
+    """
+    최신 메시지부터 예산이 허락하는 만큼. 마지막(현재 질문) 메시지는 항상 포함(필요하면 잘라서).
+    맨 앞의 system 메시지(대화 요약)는 오래된 메시지보다 먼저 자리를 잡는다.
+    """
+    pinned = []
+    while history and history[0].get("role") == "system" and len(history) > 1:
+        pinned.append(history[0])
+        history = history[1:]
+    used = sum(count_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in pinned)
+    if used > budget // 2:
+        # 요약이 예산의 절반을 넘으면 잘라서 최근 메시지 자리를 남긴다
+        pinned = [{**m, "content": truncate_to_tokens(m.get("content") or "", budget // (2 * len(pinned)))} for m in pinned]
+        used = sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in pinned)
+    kept = []
+    for i, m in enumerate(reversed(history)):
+        n = count_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+        if used + n > budget:
+            if i == 0:
+                content = truncate_to_tokens(m.get("content") or "", max(1, budget - used - MESSAGE_OVERHEAD_TOKENS))
+                kept.append({**m, "content": content})
+                used += count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+            break
+        kept.append(m)
+        used += n
+    return pinned + kept[::-1], used
+
+
+def _select_document(att: dict, query: str, budget: int):
+    index = att.get("index")
+    if index is not None:
+        chunks = index.chunks
+        # BM25 top-k, 질문과 겹치는 청크가 없으면(예: "요약해줘") 문서 앞쪽부터
+        hits = index.search(query, int(_setting("CONTEXT_TOP_K", 6)))
+        order = [i for i, _ in hits] or list(range(len(chunks)))
+    else:
+        chunks = split_chunks(att["content"])
+        order = rank_chunks(chunks, query)
+    picked, used = [], 0
+    for i in order:
+        n = count_tokens(chunks[i]) + SEPARATOR_TOKENS
+        if used + n > budget:
+            continue
+        picked.append(i)
+        used += n
+    if not picked and chunks and budget > 0:
+        # 가장 관련 높은 청크도 예산보다 크면 잘라서라도 1개는 보낸다
+        i = order[0]
+        text = truncate_to_tokens(chunks[i], budget)
+        return [text], count_tokens(text), len(chunks), True
+    # 고른 청크는 문서 순서대로 이어 붙인다
+    return [chunks[i] for i in sorted(picked)], used, len(chunks), len(picked) < len(chunks)
+
+
+def build_context(history: list, attachments=None, *, budget: int = None, history_share: float = None):
+    """
+    history(오래된→최신, 마지막이 현재 질문)와 markdown attachments({content} 또는 {index})를 예산에 맞춘다.
+    반환: (messages, attachments, stats)
+      stats = {budget, history_tokens, history_messages, history_dropped,
+               document_tokens, document_chunks, document_chunks_total, document_truncated, total_tokens}
+    """
+    budget = int(budget or _setting("CONTEXT_TOKEN_BUDGET", 6000))
+    share = float(history_share if history_share is not None else _setting("CONTEXT_HISTORY_SHARE", 0.4))
+    docs = [a for a in (attachments or []) if a.get("type") == "markdown" and (a.get("content") or a.get("index"))]
+
+    # 문서가 없으면 예산 전체를 history 에
+    history_budget = int(budget * share) if docs else budget
+    messages, history_tokens = _fit_history(history, history_budget)
+
+    doc_budget = budget - history_tokens - (ATTACHMENT_OVERHEAD_TOKENS if docs else 0)
+    query = next((m.get("content") or "" for m in reversed(history) if m.get("role") == "user"), "")
+    out_attachments, doc_tokens, n_chunks, n_total, truncated = [], 0, 0, 0, False
+    for att in docs:
+        parts, used, total, cut = _select_document(att, query, max(0, doc_budget - doc_tokens))
+        n_total += total
+        truncated = truncated or cut
+        if parts:
+            out_attachments.append({"type": "markdown", "name": att.get("name"), "content": PAGE_SEPARATOR.join(parts)})
+            doc_tokens += used
+            n_chunks += len(parts)
+
+    stats = {
+        "budget": budget,
+        "history_tokens": history_tokens,
+        "history_messages": len(messages),
+        "history_dropped": len(history) - len(messages),
+        "document_tokens": doc_tokens,
+        "document_chunks": n_chunks,
+        "document_chunks_total": n_total,
+        "document_truncated": truncated,
+        "total_tokens": history_tokens + doc_tokens + (ATTACHMENT_OVERHEAD_TOKENS if out_attachments else 0),
+    }
+    return messages, (out_attachments or None), stats
@@ -0,0 +1,182 @@
+# 04_project/llm_integration/llmproxy/utils/endpoints.py
+"""
+RunPod 엔드포인트 풀 (RUNPOD_API_BASES, 프로세스당 1개).
+- 선택: session_id 가 있으면 rendezvous hashing 으로 같은 pod (ingest 인덱스가 있는 곳),
+        없으면 least-outstanding 또는 latency(EWMA x 대기 요청 수)
+- 건강 상태: 백그라운드 스레드가 RUNPOD_HEALTH_INTERVAL 초마다 GET /healthz
+- 비정상(healthz 실패) 이거나 서킷이 열린 pod 는 건너뛰고, affinity 는 다음 순위 pod 로 넘어간다
+"""
+import hashlib
+import os
+import threading
+import time
+
+from .resilience import CircuitOpenError, get_breaker, get_latency
+
+
+def _setting(name: str, default):
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+def configured_bases() -> list:
+    raw = _setting("RUNPOD_API_BASES", "") or _setting("RUNPOD_API_BASE", "")
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    out = []
+    for b in raw:
+        b = (b or "").strip().rstrip("/")
+        if b and b not in out:
+            out.append(b)
+    return out
+
+
+class Endpoint:
+    def __init__(self, base: str):
+        self.base = base
+        self.outstanding = 0
+        self.ewma = None          # 응답(헤더)까지 걸린 시간의 지수 이동 평균(초)
+        self.healthy = True
+        self.last_probe = None
+        self.requests = 0
+
+    @property
+    def breaker(self):
+        # 브레이커/지연 기록은 resilience 레지스트리(base URL 단위)에 있다
+        return get_breaker(self.base)
+
+    @property
+    def latency(self):
+        return get_latency(self.base)
+
+    def available(self) -> bool:
+        return self.healthy and not self.breaker.is_open()
+
+    def stats(self) -> dict:
+        return {
+            "base": self.base,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "ewma_ms": int(self.ewma * 1000) if self.ewma is not None else None,
+            "breaker": self.breaker.state,
+        }
+
+
+def _rendezvous_score(key: str, base: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{key}|{base}".encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class EndpointPool:
+    EWMA_ALPHA = 0.3
+
+    def __init__(self, bases: list, strategy: str = None, affinity: bool = None):
+        self.endpoints = [Endpoint(b) for b in bases]
+        self.strategy = strategy or _setting("RUNPOD_LB_STRATEGY", "least_outstanding")
+        self.affinity = bool(_setting("RUNPOD_SESSION_AFFINITY", True) if affinity is None else affinity)
+        self._lock = threading.Lock()
+        self._probe_thread = None
+        self._stop = threading.Event()
+
+    # ---- 선택 ----
+    def _candidates(self, exclude):
+        eps = [e for e in self.endpoints if e not in exclude]
+        up = [e for e in eps if e.available()]
+        if up:
+            return up
+        # 전부 비정상으로 보이면 healthz 결과는 무시하고 서킷만 본다(프로브가 틀렸을 수 있음)
+        return [e for e in eps if not e.breaker.is_open()]
+
+    def pick(self, session_id: str = None, exclude=()) -> Endpoint:
+        """호출할 엔드포인트. 모두 서킷이 열려 있으면 CircuitOpenError."""
+        cands = self._candidates(set(exclude))
+        if not cands:
+            retry_after = min((e.breaker.retry_after() for e in self.endpoints), default=1.0)
+            raise CircuitOpenError(",".join(e.base for e in self.endpoints), retry_after)
+        if len(cands) == 1:
+            return cands[0]
+        if session_id and self.affinity:
+            return max(cands, key=lambda e: _rendezvous_score(str(session_id), e.base))
+        with self._lock:
+            if self.strategy == "latency":
+                # 모르는 pod 는 평균 지연으로 가정해 한 번씩은 써 보게 한다
+                known = [e.ewma for e in cands if e.ewma is not None]
+                default = sum(known) / len(known) if known else 1.0
+                return min(cands, key=lambda e: ((e.ewma if e.ewma is not None else default) * (e.outstanding + 1), e.outstanding))
+            return min(cands, key=lambda e: (e.outstanding, e.requests))
+
+    def acquire(self, ep: Endpoint):
+        with self._lock:
+            ep.outstanding += 1
+            ep.requests += 1
+
+    def observe(self, ep: Endpoint, seconds: float):
+        with self._lock:
+            ep.ewma = seconds if ep.ewma is None else (1 - self.EWMA_ALPHA) * ep.ewma + self.EWMA_ALPHA * seconds
+
+    def release(self, ep: Endpoint):
+        with self._lock:
+            ep.outstanding = max(0, ep.outstanding - 1)
+
+    def retry_after(self):
+        """쓸 수 있는 엔드포인트가 하나도 없으면 가장 빨리 열리는 서킷까지 남은 초, 아니면 None."""
+        if any(not e.breaker.is_open() for e in self.endpoints):
+            return None
+        return min((e.breaker.retry_after() for e in self.endpoints), default=None)
+
+    # ---- 헬스 체크 ----
+    def probe_once(self):
+        from .http_session import get_session
+        timeout = float(_setting("RUNPOD_HEALTH_TIMEOUT", 3))
+        for ep in self.endpoints:
+            try:
+                ok = get_session().get(f"{ep.base}/healthz", timeout=(timeout, timeout)).status_code == 200
+            except Exception:
+                ok = False
+            ep.healthy = ok
+            ep.last_probe = time.time()
+
+    def start_probes(self, interval: float):
+        if interval <= 0 or self._probe_thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.probe_once()
+
+        self._probe_thread = threading.Thread(target=loop, name="runpod-healthz", daemon=True)
+        self._probe_thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> list:
+        return [e.stats() for e in self.endpoints]
+
+
+_pool_lock = threading.Lock()
+_pool = None
+_pool_key = None
+
+
+def get_pool() -> EndpointPool:
+    """프로세스당 풀 1개 (fork 후 / 설정이 바뀌면 새로 만든다). 헬스 프로브 스레드도 여기서 시작."""
+    global _pool, _pool_key
+    key = (os.getpid(), tuple(configured_bases()))
+    if _pool is None or _pool_key != key:
+        with _pool_lock:
+            if _pool is None or _pool_key != key:
+                if _pool is not None and _pool_key[0] == key[0]:
+                    _pool.stop()
+                _pool = EndpointPool(list(key[1]))
+                if len(key[1]) > 1:  # 하나뿐이면 고를 게 없으니 프로브도 안 돌린다
+                    _pool.start_probes(float(_setting("RUNPOD_HEALTH_INTERVAL", 10)))
+                _pool_key = key
+    return _pool
+
+
+def endpoint_stats() -> list:
+    return get_pool().stats()
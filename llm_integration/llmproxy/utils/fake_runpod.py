@@ -0,0 +1,160 @@
+# 04_project/llm_integration/llmproxy/utils/fake_runpod.py
+"""
+부하 테스트용 로컬 RunPod 대역 (표준 라이브러리 HTTP 서버, GPU 없음).
+- GET  /healthz
+- POST /v1/chat    : latency(+jitter) 뒤 tokens 개를 token_rate(개/초)로 생성. stream=true 면 SSE(chunked)로 한 조각씩
+- POST /v1/ingest  : ingest_latency 뒤 {"ok": true}
+- error_rate 비율만큼 503 (재시도/서킷 동작 확인용)
+bench_load 가 띄우거나, `manage.py fake_runpod` 로 따로 띄워 RUNPOD_API_BASES 로 가리킨다.
+"""
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeRunPodConfig:
+    def __init__(self, latency: float = 0.2, jitter: float = 0.0, token_rate: float = 50.0, tokens: int = 64,
+                 ingest_latency: float = 1.0, error_rate: float = 0.0):
+        self.latency = latency            # 첫 토큰까지(프리필/큐) 초
+        self.jitter = jitter              # latency 에 더하는 U(0, jitter)
+        self.token_rate = token_rate      # 초당 토큰 (0 이하면 즉시)
+        self.tokens = tokens              # 응답 토큰 수
+        self.ingest_latency = ingest_latency
+        self.error_rate = error_rate
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive (실제 RunPod 프록시처럼 커넥션 재사용)
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def cfg(self) -> FakeRunPodConfig:
+        return self.server.config
+
+    def _json(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _fail(self) -> bool:
+        if self.cfg.error_rate and random.random() < self.cfg.error_rate:
+            self._json(503, {"error": "fake upstream unavailable"})
+            return True
+        return False
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._json(200, {"ok": True})
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = self._read_body()
+        self.server.count(self.path)
+        if self.path == "/v1/ingest":
+            time.sleep(self.cfg.ingest_latency)
+            if not self._fail():
+                self._json(200, {"ok": True, "bytes": len(body)})
+            return
+        if self.path != "/v1/chat":
+            self._json(404, {"error": "not found"})
+            return
+        payload = json.loads(body or b"{}")
+        time.sleep(self.cfg.latency + random.uniform(0, self.cfg.jitter))
+        if self._fail():
+            return
+        n = max(1, min(int(self.cfg.tokens), int(payload.get("max_new_tokens") or self.cfg.tokens)))
+        per_token = 1.0 / self.cfg.token_rate if self.cfg.token_rate > 0 else 0.0
+        words = [f"tok{i} " for i in range(n)]
+        if not payload.get("stream"):
+            time.sleep(per_token * n)
+            self._json(200, {"answer": "".join(words).strip(), "tokens": n})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, w in enumerate(words):
+            if i:
+                time.sleep(per_token)
+            self._chunk(f"data: {json.dumps({'token': w})}\n\n")
+        self._chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class FakeRunPod(ThreadingHTTPServer):
+    """with FakeRunPod(config) as fake: fake.base_url ... (포트 0 이면 빈 포트)."""
+    daemon_threads = True
+
+    def __init__(self, config: FakeRunPodConfig = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.config = config or FakeRunPodConfig()
+        self.requests = {}
+        self._count_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle_error(self, request, client_address):
+        # 클라이언트가 [DONE] 을 받고 먼저 끊는 건 정상
+        if not isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            super().handle_error(request, client_address)
+
+    def count(self, path: str):
+        with self._count_lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def start(self) -> "FakeRunPod":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-runpod", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def add_arguments(parser):
+    """fake_runpod / bench_load 공용 옵션."""
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra U(0, jitter) seconds per chat call.")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Generated tokens per second (0 = instant).")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens per answer.")
+    parser.add_argument("--ingest-latency", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 503.")
+
+
+def config_from_options(opts: dict) -> FakeRunPodConfig:
+    return FakeRunPodConfig(
+        latency=opts["latency"], jitter=opts["jitter"], token_rate=opts["token_rate"], tokens=opts["tokens"],
+        ingest_latency=opts["ingest_latency"], error_rate=opts["error_rate"],
+    )
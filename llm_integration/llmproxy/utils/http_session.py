@@ -0,0 +1,126 @@
+# 04_project/llm_integration/llmproxy/utils/http_session.py
+"""
+RunPod 호출용 프로세스 단위 HTTP 세션(커넥션 풀 + keep-alive).
+- gunicorn fork 이후 부모의 소켓을 공유하지 않도록 PID가 바뀌면 새로 만든다.
+- pool_stats()로 새 연결 수 / 재사용 수를 확인할 수 있다.
+- ASGI 경로는 get_async_client() (이벤트 루프마다 httpx.AsyncClient 하나)
+"""
+import asyncio
+import os
+import socket
+import threading
+import weakref
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+_async_clients = weakref.WeakKeyDictionary()  # event loop → httpx.AsyncClient
+
+
+def _keepalive_socket_options(idle: int) -> list:
+    opts = list(HTTPConnection.default_socket_options)
+    opts.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    # Linux 전용 옵션은 있을 때만
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        opts.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        opts.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, idle // 3)))
+    return opts
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    def __init__(self, *, keepalive_idle: int = 60, **kwargs):
+        self.keepalive_idle = keepalive_idle
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = _keepalive_socket_options(self.keepalive_idle)
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _build_session() -> requests.Session:
+    adapter = KeepAliveAdapter(
+        pool_connections=int(getattr(settings, "RUNPOD_POOL_CONNECTIONS", 4)),
+        pool_maxsize=int(getattr(settings, "RUNPOD_POOL_MAXSIZE", 16)),
+        keepalive_idle=int(getattr(settings, "RUNPOD_KEEPALIVE_IDLE", 60)),
+        max_retries=0,
+    )
+    s = requests.Session()
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    s.headers["Connection"] = "keep-alive"
+    return s
+
+
+def get_session() -> requests.Session:
+    """프로세스 공용 세션. fork 된 자식에서는 첫 호출 때 새로 만든다."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+    return _session
+
+
+def get_async_client():
+    """
+    현재 이벤트 루프 전용 httpx.AsyncClient (루프가 바뀌면 소켓을 공유할 수 없으므로 루프별로 하나).
+    풀 크기/keep-alive는 동기 세션과 같은 설정을 쓴다.
+    """
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        maxsize = int(getattr(settings, "RUNPOD_POOL_MAXSIZE", 16))
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=int(getattr(settings, "RUNPOD_ASYNC_MAX_CONNECTIONS", maxsize * 8)),
+                max_keepalive_connections=maxsize,
+                keepalive_expiry=float(getattr(settings, "RUNPOD_KEEPALIVE_IDLE", 60)),
+            ),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def _reset_after_fork():
+    global _session, _session_pid, _lock, _async_clients
+    _lock = threading.Lock()
+    _session = None
+    _session_pid = None
+    _async_clients = weakref.WeakKeyDictionary()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def pool_stats() -> dict:
+    """urllib3 풀 카운터 합계: requests(총 요청) / new_connections(새 TCP 연결) / reused."""
+    stats = {"pid": os.getpid(), "pools": 0, "requests": 0, "new_connections": 0, "reused": 0}
+    s = _session
+    if s is None or _session_pid != os.getpid():
+        return stats
+    seen = set()
+    for adapter in s.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats["pools"] += 1
+            stats["requests"] += pool.num_requests
+            stats["new_connections"] += pool.num_connections
+    stats["reused"] = max(0, stats["requests"] - stats["new_connections"])
+    return stats
@@ -1,29 +1,218 @@
 # 04_project/llm_integration/llmproxy/utils/llm_client.py
 import os
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
 import requests
 from django.conf import settings
 
+from . import metrics
+from .http_session import get_async_client, get_session
+from .endpoints import EndpointPool, get_pool
+from .resilience import CircuitOpenError, is_retryable, is_upstream_failure, retry_delay
+from .timing import span
+
+_hedge_lock = threading.Lock()
+_hedge_pool = None
+_hedge_slots = None  # 동시에 떠 있을 수 있는 hedge 수 (RUNPOD_HEDGE_THREADS)
+# 이 메서드만 요청 도중 실패/502/504 도 재시도 (POST /v1/chat, /v1/ingest 는 GPU 작업이 두 번 돌 수 있어 제외)
+_IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def _get_hedge_pool() -> ThreadPoolExecutor:
+    global _hedge_pool, _hedge_slots
+    with _hedge_lock:
+        if _hedge_pool is None:
+            threads = int(getattr(settings, "RUNPOD_HEDGE_THREADS", 8))
+            _hedge_pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="runpod-hedge")
+            _hedge_slots = threading.BoundedSemaphore(threads)
+        return _hedge_pool
+
+
+def _submit_hedge(fn, *args):
+    """
+    hedge 를 풀에 올린다. 이미 RUNPOD_HEDGE_THREADS 개가 떠 있으면(느린 쪽은 취소할 수 없어 RUNPOD_TIMEOUT 까지 남는다)
+    줄을 세우지 않고 None → hedge 없이 primary 만 기다린다.
+    """
+    pool = _get_hedge_pool()
+    if not _hedge_slots.acquire(blocking=False):
+        return None
+    fut = pool.submit(fn, *args)
+    fut.add_done_callback(lambda _: _hedge_slots.release())
+    return fut
+
+
+def _in_own_thread(fn, *args) -> Future:
+    """primary 시도: 공용 hedge 풀이 아니라 자기 스레드에서 (버려진 hedge 뒤에 줄 서지 않게)."""
+    fut = Future()
+
+    def run():
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            fut.set_result(fn(*args))
+        except BaseException as e:
+            fut.set_exception(e)
+
+    threading.Thread(target=run, name="runpod-primary", daemon=True).start()
+    return fut
+
+
+def _rewind(files):
+    # 재시도 시 업로드 파일 객체를 처음으로
+    for spec in (files or {}).values():
+        fh = spec[1] if isinstance(spec, tuple) else spec
+        if hasattr(fh, "seek"):
+            fh.seek(0)
+
+
+class _Release:
+    """스트리밍 응답을 다 읽으면(with 종료) 엔드포인트의 outstanding 을 내린다."""
+    def __init__(self, pool, ep):
+        self.pool = pool
+        self.ep = ep
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.pool.release(self.ep)
+        return False
+
+
 class LLMClient:
     """
     RunPod FastAPI (/v1/chat) 래퍼.
     Django 쪽은 attachments를 선택적으로 보낼 수 있게 하되,
     RunPod API가 첨부를 직접 받지 않으므로 메시지에 녹여 보낸다.
+
+    모든 호출은 utils/resilience.py 를 거친다:
+    연결/읽기 타임아웃 분리, 멱등한 실패만 재시도(jitter), 서킷 브레이커, (옵션) hedge.
+    엔드포인트는 utils/endpoints.py 풀(RUNPOD_API_BASES)에서 session_id 기준으로 고른다.
     """
-    def __init__(self, base_url: str = None, timeout: int = None):
-        self.base = (base_url or getattr(settings, "RUNPOD_API_BASE", "")).rstrip("/")
-        if not self.base:
+    def __init__(self, base_url: str = None, timeout: int = None, connect_timeout: float = None):
+        # base_url 을 주면 그 엔드포인트 하나만 쓴다(풀/헬스 프로브 없이)
+        self.pool = EndpointPool([base_url.rstrip("/")]) if base_url else get_pool()
+        if not self.pool.endpoints:
             raise RuntimeError("RUNPOD_API_BASE is not set")
+        self.base = self.pool.endpoints[0].base
         self.timeout = timeout or int(getattr(settings, "RUNPOD_TIMEOUT", 120))
+        self.connect_timeout = float(connect_timeout or getattr(settings, "RUNPOD_CONNECT_TIMEOUT", 5))
+        self.retries = int(getattr(settings, "RUNPOD_RETRIES", 2))
+
+    def _timeouts(self):
+        # requests: (connect, read)
+        return (self.connect_timeout, self.timeout)
+
+    def _attempt(self, ep, method: str, path: str, *, hold: bool = False, **kwargs):
+        """
+        ep 로 보내는 요청 1회(브레이커 + 대기 요청 수 집계). 응답을 돌려주기 전에 상태 코드를 확인한다.
+        hold=True(스트리밍)면 응답을 다 읽을 때까지 outstanding 을 유지하고, 호출자가 pool.release(ep).
+        """
+        ep.breaker.before_call()
+        self.pool.acquire(ep)
+        start = time.monotonic()
+        resp = None
+        try:
+            resp = getattr(get_session(), method.lower())(f"{ep.base}{path}", timeout=self._timeouts(), **kwargs)
+            resp.raise_for_status()
+        except Exception as e:
+            self.pool.release(ep)
+            if resp is not None:
+                resp.close()  # stream=True 응답은 닫아야 연결이 세션 풀로 돌아간다
+            metrics.upstream_error(e)
+            if is_upstream_failure(e):
+                ep.breaker.record_failure()
+            else:
+                ep.breaker.record_success()
+            raise
+        ep.breaker.record_success()
+        elapsed = time.monotonic() - start
+        self.pool.observe(ep, elapsed)
+        if not hold:
+            self.pool.release(ep)
+        if not kwargs.get("stream"):
+            ep.latency.observe(elapsed)
+        return resp
+
+    def _hedged(self, ep, session_id, tried, fn):
+        """
+        hedge_delay(최근 지연 분위수) 안에 끝나지 않으면 같은 요청을 (가능하면 다음 순위 pod 로) 한 번 더 보내
+        먼저 끝난 쪽을 쓴다. 느린 쪽은 취소할 수 없으므로(requests) 결과만 버린다 — GPU 작업이 늘어나니 기본은 꺼 둔다.
+        primary 는 자기 스레드에서, hedge 만 공용 풀에서(동시 RUNPOD_HEDGE_THREADS 개까지, 넘치면 hedge 생략).
+        """
+        delay = ep.latency.hedge_delay()
+        if delay is None:
+            return fn(ep)
+        futures = [_in_own_thread(fn, ep)]
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            try:
+                second = self.pool.pick(session_id, exclude=tried | {ep})
+            except CircuitOpenError:
+                second = ep
+            hedge = _submit_hedge(fn, second)
+            if hedge is not None:
+                futures.append(hedge)
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    return fut.result()
+                except Exception as e:
+                    error = error or e
+        raise error
+
+    def _call(self, method: str, path: str, *, session_id=None, hedge: bool = False, hold: bool = False, **kwargs):
+        """
+        재시도 포함 호출 → (resp, endpoint). 재시도는 is_retryable 실패만(POST 는 업스트림에 닿지 않은 실패만), 최대 self.retries 회,
+        실패한 엔드포인트는 빼고 다시 고른다(affinity 면 다음 순위 pod).
+        """
+        with span("runpod"):  # 스트리밍은 응답 헤더까지
+            try:
+                return self._call_with_retries(method, path, session_id=session_id, hedge=hedge, hold=hold, **kwargs)
+            except CircuitOpenError as e:
+                metrics.upstream_error(e)
+                raise
+
+    def _call_with_retries(self, method: str, path: str, *, session_id=None, hedge: bool = False, hold: bool = False, **kwargs):
+        attempt = 0
+        tried = set()
+        while True:
+            try:
+                ep = self.pool.pick(session_id, exclude=tried if len(tried) < len(self.pool.endpoints) else ())
+            except CircuitOpenError:
+                raise
+            try:
+                if attempt:
+                    _rewind(kwargs.get("files"))
+                if hedge:
+                    return self._hedged(ep, session_id, tried,
+                                        lambda e: (self._attempt(e, method, path, hold=hold, **kwargs), e))
+                return self._attempt(ep, method, path, hold=hold, **kwargs), ep
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                tried.add(ep)
+                attempt += 1
+                if attempt > self.retries or not is_retryable(e, idempotent=method in _IDEMPOTENT_METHODS):
+                    raise
+                time.sleep(retry_delay(attempt))
 
-    def chat(self, messages, *, user_id="anon@local", session_id="default",
-             max_tokens=1024, temperature=0.7, top_p=0.9, repetition_penalty=1.05,
-             k_internal=6, k_external=0, cap_internal=1200, cap_external=1500,
-             attachments=None) -> dict:
+    def _build_payload(self, messages, *, user_id="anon@local", session_id="default",
+                       max_tokens=1024, temperature=0.7, top_p=0.9, repetition_penalty=1.05,
+                       k_internal=6, k_external=0, cap_internal=1200, cap_external=1500,
+                       attachments=None) -> dict:
         # attachments에 markdown이 있으면 "system" 메시지로 합성
         merged = []
         # 시스템/유저/어시스턴트 순서를 유지
         for m in messages:
-            if not m: 
+            if not m:
                 continue
             role = m.get("role")
             content = (m.get("content") or "").strip()
@@ -42,7 +231,7 @@ class LLMClient:
                     "content": "다음은 사용자 업로드 문서에서 추출한 컨텍스트입니다. 문서를 그대로 복붙하지 말고 요약/참조만 하세요.\n\n" + "\n\n---\n\n".join(md_blobs)
                 })
 
-        payload = {
+        return {
             "user_id": user_id,
             "session_id": session_id,
             "messages": merged,
@@ -55,7 +244,217 @@ class LLMClient:
             "top_p": top_p,
             "repetition_penalty": repetition_penalty,
         }
-        url = f"{self.base}/v1/chat"
-        resp = requests.post(url, json=payload, timeout=self.timeout)
-        resp.raise_for_status()
+
+    def chat(self, messages, **kwargs) -> dict:
+        payload = self._build_payload(messages, **kwargs)
+        resp, _ = self._call("POST", "/v1/chat", session_id=payload["session_id"], json=payload, hedge=True)
+        return resp.json()
+
+    def chat_stream(self, messages, **kwargs):
+        """
+        /v1/chat 를 stream=true 로 호출하고 토큰(텍스트 조각)을 순서대로 yield 한다.
+        - SSE(`data: {...}`) / NDJSON 모두 처리
+        - 업스트림이 스트리밍을 지원하지 않아 일반 JSON을 돌려주면 전체 답변을 한 번에 yield
+        """
+        payload = self._build_payload(messages, **kwargs)
+        payload["stream"] = True
+        # 재시도는 응답 헤더를 받기 전(연결/502~504)까지만 — 토큰을 흘려보내기 시작하면 다시 보내지 않는다
+        resp, ep = self._call("POST", "/v1/chat", session_id=payload["session_id"], json=payload, stream=True, hold=True)
+        with resp, _Release(self.pool, ep):
+            ctype = resp.headers.get("Content-Type", "")
+            if "application/json" in ctype:
+                text = extract_answer(resp.json())
+                if text:
+                    yield text
+                return
+            for raw in resp.iter_lines(decode_unicode=True):
+                piece = parse_stream_line(raw)
+                if piece is None:
+                    continue
+                if piece is StopIteration:
+                    return
+                if piece:
+                    yield piece
+
+    def ingest(self, file_name: str, data, *, user_id: str, session_id: str, prefer_openai: bool = True) -> dict:
+        """/v1/ingest 로 PDF를 보내 RunPod 내부 인덱스를 만든다(chat과 같은 커넥션 풀 사용)."""
+        files = {"file": (file_name or "upload.pdf", data, "application/pdf")}
+        form = {
+            "user_id": user_id,
+            "session_id": session_id,
+            "prefer_openai": "true" if prefer_openai else "false",
+        }
+        # ingest 한 pod 가 이 session 의 인덱스를 갖게 되므로 chat 과 같은 session_id 로 고른다
+        resp, _ = self._call("POST", "/v1/ingest", session_id=session_id, files=files, data=form)
         return resp.json()
+
+
+class AsyncLLMClient(LLMClient):
+    """LLMClient의 asyncio 버전(httpx). ASGI 뷰에서 GPU 대기 동안 워커를 붙잡지 않는다."""
+
+    def _timeouts(self):
+        import httpx
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout)
+
+    async def _attempt(self, ep, method: str, path: str, *, stream: bool = False, hold: bool = False, **kwargs):
+        ep.breaker.before_call()
+        self.pool.acquire(ep)
+        start = time.monotonic()
+        client = get_async_client()
+        resp = None
+        try:
+            req = client.build_request(method, f"{ep.base}{path}", timeout=self._timeouts(), **kwargs)
+            resp = await client.send(req, stream=stream)
+            resp.raise_for_status()
+        except BaseException as e:
+            # 취소(hedge 패자)도 outstanding 은 돌려놓는다
+            self.pool.release(ep)
+            if resp is not None:
+                await resp.aclose()
+            if isinstance(e, Exception):
+                metrics.upstream_error(e)
+                if is_upstream_failure(e):
+                    ep.breaker.record_failure()
+                else:
+                    ep.breaker.record_success()
+            raise
+        ep.breaker.record_success()
+        elapsed = time.monotonic() - start
+        self.pool.observe(ep, elapsed)
+        if not hold:
+            self.pool.release(ep)
+        if not stream:
+            ep.latency.observe(elapsed)
+        return resp
+
+    async def _hedged(self, ep, session_id, tried, make):
+        delay = ep.latency.hedge_delay()
+        if delay is None:
+            return await make(ep)
+        tasks = [asyncio.ensure_future(make(ep))]
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            try:
+                second = self.pool.pick(session_id, exclude=tried | {ep})
+            except CircuitOpenError:
+                second = ep
+            tasks.append(asyncio.ensure_future(make(second)))
+        error = None
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        return t.result()
+                    error = error or t.exception()
+            raise error
+        finally:
+            # asyncio 는 느린 쪽을 실제로 취소할 수 있다
+            for t in pending:
+                t.cancel()
+
+    async def _call(self, method: str, path: str, *, session_id=None, hedge: bool = False, hold: bool = False, **kwargs):
+        with span("runpod"):
+            try:
+                return await self._call_with_retries(method, path, session_id=session_id, hedge=hedge, hold=hold, **kwargs)
+            except CircuitOpenError as e:
+                metrics.upstream_error(e)
+                raise
+
+    async def _call_with_retries(self, method: str, path: str, *, session_id=None, hedge: bool = False, hold: bool = False, **kwargs):
+        attempt = 0
+        tried = set()
+        while True:
+            ep = self.pool.pick(session_id, exclude=tried if len(tried) < len(self.pool.endpoints) else ())
+            try:
+                if attempt:
+                    _rewind(kwargs.get("files"))
+                if hedge:
+                    async def make(e):
+                        return await self._attempt(e, method, path, hold=hold, **kwargs), e
+                    return await self._hedged(ep, session_id, tried, make)
+                return await self._attempt(ep, method, path, hold=hold, **kwargs), ep
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                tried.add(ep)
+                attempt += 1
+                if attempt > self.retries or not is_retryable(e, idempotent=method in _IDEMPOTENT_METHODS):
+                    raise
+                await asyncio.sleep(retry_delay(attempt))
+
+    async def chat(self, messages, **kwargs) -> dict:
+        payload = self._build_payload(messages, **kwargs)
+        resp, _ = await self._call("POST", "/v1/chat", session_id=payload["session_id"], json=payload, hedge=True)
+        return resp.json()
+
+    async def chat_stream(self, messages, **kwargs):
+        payload = self._build_payload(messages, **kwargs)
+        payload["stream"] = True
+        resp, ep = await self._call("POST", "/v1/chat", session_id=payload["session_id"], json=payload,
+                                    stream=True, hold=True)
+        try:
+            if "application/json" in resp.headers.get("Content-Type", ""):
+                await resp.aread()
+                text = extract_answer(resp.json())
+                if text:
+                    yield text
+                return
+            async for raw in resp.aiter_lines():
+                piece = parse_stream_line(raw)
+                if piece is None:
+                    continue
+                if piece is StopIteration:
+                    return
+                if piece:
+                    yield piece
+        finally:
+            self.pool.release(ep)
+            await resp.aclose()
+
+
+def upstream_retry_after():
+    """모든 RunPod 엔드포인트의 서킷이 열려 있으면 다시 시도해 볼 때까지 남은 초, 아니면 None (상태는 바꾸지 않음)."""
+    pool = get_pool()
+    return pool.retry_after() if pool.endpoints else None
+
+
+def extract_answer(result: dict) -> str:
+    """RunPod 응답 JSON에서 답변 텍스트만 꺼낸다(answer / OpenAI 호환 choices 둘 다)."""
+    return (result.get("answer") or
+            result.get("choices", [{}])[0].get("message", {}).get("content") or
+            "")
+
+
+def parse_stream_line(line):
+    """
+    스트리밍 응답 한 줄 → 텍스트 조각.
+    - 빈 줄/주석/이벤트명은 None
+    - `data: [DONE]` 은 StopIteration (스트림 종료 신호)
+    - JSON이면 token / delta / answer / choices[0].delta.content 순으로 찾는다
+    """
+    if not line:
+        return None
+    line = line.strip()
+    if not line or line.startswith(":") or line.startswith("event:"):
+        return None
+    if line.startswith("data:"):
+        line = line[5:].strip()
+    if line == "[DONE]":
+        return StopIteration
+    try:
+        obj = json.loads(line)
+    except ValueError:
+        return line
+    if not isinstance(obj, dict):
+        return str(obj)
+    if obj.get("done") is True and not obj.get("token"):
+        return StopIteration
+    for key in ("token", "delta", "text", "answer"):
+        val = obj.get(key)
+        if isinstance(val, str):
+            return val
+    choices = obj.get("choices") or [{}]
+    delta = choices[0].get("delta") or choices[0].get("message") or {}
+    return delta.get("content") or ""
@@ -0,0 +1,305 @@
+# 04_project/llm_integration/llmproxy/utils/loadtest.py
+"""
+부하 테스트 러너 (bench_load 매니지먼트 커맨드).
+- 시나리오: chat_send / chat_history / conversations_list / file_upload (실제 뷰를 그대로 호출)
+- 드라이버: 프로세스 안 Django 테스트 Client(기본, 테스트 DB) 또는 HTTP(--target, 떠 있는 서버)
+- 가상 사용자 concurrency 명이 가중치(mix)대로 시나리오를 고르며 duration 초 / requests 개만큼 반복
+- 결과: 시나리오별 p50/p95/p99/평균 지연, 처리량(rps), 오류 수 → JSON 으로 저장해 이전 실행과 비교
+"""
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+SCENARIOS = ("chat_send", "chat_history", "conversations_list", "file_upload")
+DEFAULT_MIX = {"chat_send": 4, "chat_history": 3, "conversations_list": 2, "file_upload": 1}
+QUESTIONS = (
+    "이 문서의 핵심을 세 줄로 요약해줘",
+    "환불 규정이 어떻게 되나요?",
+    "앞에서 말한 내용 중 두 번째 항목을 자세히 설명해줘",
+    "What are the main risks mentioned?",
+    "표에 나온 수치를 비교해줘",
+)
+
+
+def parse_mix(text: str) -> dict:
+    """"chat_send=4,chat_history=3" → {"chat_send": 4, ...}. 비우면 DEFAULT_MIX."""
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"unknown scenario: {name} (choose from {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return {k: v for k, v in mix.items() if v > 0}
+
+
+def percentile(sorted_values: list, p: float):
+    """nearest-rank 분위수 (정렬된 목록). 비어 있으면 None."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(-(-p * len(sorted_values) // 100)))  # ceil(p/100 * n)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples: list, wall_seconds: float) -> dict:
+    """samples: [(scenario, ok, ms), ...] → {scenario: {...}, "all": {...}}"""
+    groups = {}
+    for scenario, ok, ms in samples:
+        groups.setdefault(scenario, []).append((ok, ms))
+        groups.setdefault("all", []).append((ok, ms))
+    out = {}
+    for name, rows in groups.items():
+        lat = sorted(ms for _, ms in rows)
+        out[name] = {
+            "count": len(rows),
+            "errors": sum(1 for ok, _ in rows if not ok),
+            "p50_ms": round(percentile(lat, 50), 1),
+            "p95_ms": round(percentile(lat, 95), 1),
+            "p99_ms": round(percentile(lat, 99), 1),
+            "mean_ms": round(sum(lat) / len(lat), 1),
+            "rps": round(len(rows) / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+        }
+    return out
+
+
+def compare(current: dict, baseline: dict, threshold_pct: float = 10.0, min_count: int = 20) -> list:
+    """
+    같은 concurrency 끼리 비교 → [{..., "regression": bool}, ...]
+    - 시나리오별 p95: threshold% 넘게 늘면 회귀 (양쪽 모두 min_count 개 이상일 때만)
+    - 전체(all) rps: threshold% 넘게 줄면 회귀 (시나리오별 rps 는 mix 무작위 선택에 따라 흔들려 보지 않는다)
+    """
+    base_levels = {lvl["concurrency"]: lvl["summary"] for lvl in baseline.get("levels", [])}
+    rows = []
+    for lvl in current.get("levels", []):
+        base = base_levels.get(lvl["concurrency"])
+        if not base:
+            continue
+        for scenario, now in sorted(lvl["summary"].items(), key=lambda kv: (kv[0] == "all", kv[0])):
+            before = base.get(scenario)
+            if not before:
+                continue
+            checks = [("rps", False)] if scenario == "all" else []
+            if min(before["count"], now["count"]) >= min_count:
+                checks.insert(0, ("p95_ms", True))
+            for metric, worse_if_higher in checks:
+                a, b = before[metric], now[metric]
+                change = ((b - a) / a * 100) if a else 0.0
+                regression = change > threshold_pct if worse_if_higher else change < -threshold_pct
+                rows.append({
+                    "concurrency": lvl["concurrency"], "scenario": scenario, "metric": metric,
+                    "baseline": a, "current": b, "change_pct": round(change, 1), "regression": regression,
+                })
+    return rows
+
+
+# ---- 드라이버 ----
+class InProcessDriver:
+    """Django 테스트 Client (가상 사용자 1명 = Client 1개, 스레드마다 따로)."""
+    def __init__(self, user):
+        from django.test import Client
+        self.client = Client(raise_request_exception=False)  # 서버 오류는 500 으로 집계
+        self.client.force_login(user)
+
+    def request(self, method: str, path: str, data=None, files=None, json_body=None):
+        if method == "GET":
+            r = self.client.get(path, data or {})
+        elif json_body is not None:
+            r = self.client.generic(method, path, json.dumps(json_body), content_type="application/json")
+        else:
+            payload = dict(data or {})
+            for name, (filename, content, ctype) in (files or {}).items():
+                from django.core.files.uploadedfile import SimpleUploadedFile
+                payload[name] = SimpleUploadedFile(filename, content, content_type=ctype)
+            r = self.client.post(path, payload)
+        # 스트리밍 응답(SSE)은 끝까지 읽어야 지연이 맞다
+        content = b"".join(r.streaming_content) if r.streaming else r.content
+        return r.status_code, _json_or_none(content, r.get("Content-Type", ""))
+
+    def close(self):
+        # 워커 스레드가 연 DB 연결 정리
+        from django.db import connection
+        connection.close()
+
+
+class HttpDriver:
+    """떠 있는 서버(--target). 로그인된 세션 쿠키(sessionid, csrftoken)를 그대로 쓴다."""
+    def __init__(self, base_url: str, cookie: str):
+        import requests
+        self.base = base_url.rstrip("/")
+        self.session = requests.Session()
+        for part in (cookie or "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name:
+                self.session.cookies.set(name, value)
+        self.csrf = self.session.cookies.get("csrftoken", "")
+
+    def request(self, method: str, path: str, data=None, files=None, json_body=None):
+        headers = {"X-CSRFToken": self.csrf, "Referer": self.base + "/"} if method != "GET" else {}
+        r = self.session.request(method, self.base + path, params=data if method == "GET" else None,
+                                 data=data if method != "GET" else None, files=files, json=json_body,
+                                 headers=headers, timeout=300)
+        return r.status_code, _json_or_none(r.content, r.headers.get("Content-Type", ""))
+
+    def close(self):
+        self.session.close()
+
+
+def _json_or_none(content: bytes, content_type: str):
+    if "json" not in content_type:
+        return None
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+
+# ---- 시나리오 ----
+class VirtualUser:
+    def __init__(self, driver, pdf_bytes: bytes = b""):
+        self.driver = driver
+        self.pdf_bytes = pdf_bytes
+        self.conv_id = None
+
+    def chat_send(self):
+        data = {"message": random.choice(QUESTIONS)}
+        if self.conv_id:
+            data["conversation_id"] = self.conv_id
+        status, body = self.driver.request("POST", "/llm/api/chat/send", data)
+        if body and body.get("conversation_id"):
+            self.conv_id = body["conversation_id"]
+        # 뷰는 LLM 오류도 200 + "LLM error: ..." 로 저장하므로 내용까지 본다
+        content = ((body or {}).get("item") or {}).get("content", "")
+        return status == 200 and not content.startswith("LLM error")
+
+    def chat_history(self):
+        status, _ = self.driver.request("GET", "/llm/api/chat/history", {"conversation_id": self.conv_id} if self.conv_id else {})
+        return status == 200
+
+    def conversations_list(self):
+        status, _ = self.driver.request("GET", "/llm/api/conversations")
+        return status == 200
+
+    def file_upload(self):
+        # 매번 다른 바이트(추출 캐시 적중 방지): %%EOF 뒤 주석은 PDF 파서가 무시한다
+        data = self.pdf_bytes + f"\n% bench {uuid.uuid4().hex}\n".encode()
+        status, body = self.driver.request("POST", "/llm/api/file/upload", {},
+                                           files={"file": ("bench.pdf", data, "application/pdf")})
+        if body and body.get("conversation_id"):
+            self.conv_id = body["conversation_id"]
+        return status == 200
+
+
+def run_level(make_driver, mix: dict, concurrency: int, *, duration: float = None, requests: int = None,
+              pdf_bytes: bytes = b"", seed: int = None) -> dict:
+    """concurrency 명이 duration 초(또는 합계 requests 개) 동안 시나리오를 반복 → {"concurrency", "wall_s", "summary"}"""
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    samples, lock = [], threading.Lock()
+    budget = {"left": requests}
+    deadline = time.monotonic() + duration if duration else None
+
+    def take() -> bool:
+        with lock:
+            if budget["left"] is None:
+                return time.monotonic() < deadline
+            if budget["left"] <= 0:
+                return False
+            budget["left"] -= 1
+            return True
+
+    # 로그인(세션 생성)은 측정 밖에서 미리
+    drivers = [make_driver(i) for i in range(concurrency)]
+
+    def worker(i: int):
+        driver = drivers[i]
+        vu = VirtualUser(driver, pdf_bytes)
+        try:
+            while take():
+                with lock:
+                    scenario = rng.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    ok = getattr(vu, scenario)()
+                except Exception:
+                    ok = False
+                ms = (time.perf_counter() - start) * 1000
+                with lock:
+                    samples.append((scenario, ok, ms))
+        finally:
+            driver.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall = time.perf_counter() - started
+    return {"concurrency": concurrency, "wall_s": round(wall, 2), "summary": summarize(samples, wall)}
+
+
+# ---- 프로세스 안 모드 (bench_load / replay_traffic 공용) ----
+def setup_in_process(stack, upstream: str, n_users: int) -> list:
+    """
+    격리된 테스트 DB + S3 대역 위에서 실제 뷰를 Django 테스트 Client 로 호출할 준비 → 사용자 n_users 명.
+    정리(테스트 DB 삭제 등)는 stack(ExitStack)에 등록한다.
+    """
+    from unittest import mock
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    stack.callback(teardown_test_environment)
+    if connection.vendor == "sqlite":
+        # 메모리 DB(shared cache)는 스레드 동시 쓰기에서 테이블 잠금 오류 → 임시 파일 DB
+        db_dir = tempfile.mkdtemp(prefix="bench-db-")
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(db_dir, "bench.sqlite3")
+        # 쓰기 트랜잭션끼리는 잠금을 기다리게 (운영 MySQL 과 달리 SQLite 는 DB 단위 쓰기 잠금)
+        connection.settings_dict.setdefault("OPTIONS", {}).update(timeout=30, transaction_mode="IMMEDIATE")
+        stack.callback(shutil.rmtree, db_dir, True)
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    stack.callback(connection.creation.destroy_test_db, old_name, 0)
+
+    s3 = LocalS3()
+    stack.callback(s3.cleanup)
+    stack.enter_context(mock.patch("llm_integration.llmproxy.utils.storage.get_s3_client", return_value=s3))
+    stack.enter_context(override_settings(
+        RUNPOD_API_BASES=[upstream], RUNPOD_API_BASE=upstream,
+        AWS_S3_BUCKET="bench", AWS_S3_REGION_NAME="local",
+        ADMISSION_DIR=tempfile.mkdtemp(prefix="bench-admission-"),
+        JOBS_RUN_INLINE=False,
+    ))
+
+    User = get_user_model()
+    return [User.objects.create_user(f"bench{i}", f"bench{i}@local", "pw") for i in range(max(1, n_users))]
+
+
+# ---- 프로세스 안 모드용 S3 대역 ----
+class LocalS3:
+    """boto3 S3 클라이언트 중 storage.py 가 쓰는 메서드만 로컬 디렉터리로."""
+    def __init__(self, root: str = None):
+        self.root = root or tempfile.mkdtemp(prefix="bench-s3-")
+
+    def _path(self, bucket: str, key: str) -> str:
+        path = os.path.join(self.root, bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None, Config=None):
+        with open(self._path(bucket, key), "wb") as out:
+            shutil.copyfileobj(fileobj, out)
+
+    def download_fileobj(self, bucket, key, fileobj, Config=None):
+        with open(self._path(bucket, key), "rb") as src:
+            shutil.copyfileobj(src, fileobj)
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return f"file://{self._path(Params['Bucket'], Params['Key'])}?X-Amz-Signature=local"
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,159 @@
+# 04_project/llm_integration/llmproxy/utils/metrics.py
+"""
+Prometheus 지표 (/metrics, prometheus_client).
+- gunicorn 워커 간 합산: PROMETHEUS_MULTIPROC_DIR 가 있으면 multiprocess 모드(워커별 mmap 파일을 스크레이프 때 합침)
+  → gunicorn.conf.py 가 시작할 때 디렉터리를 비우고, 죽은 워커는 child_exit 에서 정리
+  → run_jobs(다른 컨테이너)는 자기 디렉터리에 쓰고, 스크레이프 때 METRICS_EXTRA_DIRS 로 함께 합친다 (docker-compose.yml)
+- 대기열 깊이/실행 중 수는 스크레이프 시점에 직접 읽는다(admission 상태 스냅샷, BackgroundJob) → 워커 합산이 필요 없다
+- prometheus_client 가 없으면 기록 함수는 아무것도 안 하고 /metrics 는 503
+"""
+import glob
+import os
+import time
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Histogram
+except ImportError:  # 지표 없이도 서비스는 돌아가야 한다
+    prometheus_client = None
+
+# 업로드 크기(바이트) 버킷: 64KiB ~ 256MiB
+_SIZE_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(8))
+# LLM 응답: 콜드 스타트까지 고려해 길게
+_LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 180)
+
+if prometheus_client is not None:
+    REQUEST_LATENCY = Histogram(
+        "llmproxy_http_request_duration_seconds", "Django 요청 처리 시간 (스트리밍은 첫 바이트까지)",
+        ["view", "method", "status"],
+    )
+    LLM_TTFT = Histogram(
+        "llmproxy_llm_ttft_seconds", "LLM 첫 토큰까지 시간 (비스트리밍은 전체 응답)", ["mode"], buckets=_LLM_BUCKETS,
+    )
+    LLM_LATENCY = Histogram(
+        "llmproxy_llm_duration_seconds", "LLM 응답 전체 시간", ["mode", "outcome"], buckets=_LLM_BUCKETS,
+    )
+    UPSTREAM_ERRORS = Counter(
+        "llmproxy_upstream_errors_total", "RunPod 호출 실패 (재시도 1회마다)", ["kind"],
+    )
+    UPLOAD_BYTES = Histogram("llmproxy_upload_bytes", "업로드 파일 크기", buckets=_SIZE_BUCKETS)
+    EXTRACT_SECONDS = Histogram(
+        "llmproxy_pdf_extract_seconds", "PDF → Markdown 추출 시간", buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120),
+    )
+
+
+def enabled() -> bool:
+    return prometheus_client is not None
+
+
+def observe_request(view: str, method: str, status: int, seconds: float):
+    if prometheus_client is not None:
+        REQUEST_LATENCY.labels(view or "unmatched", method, str(status)).observe(seconds)
+
+
+def observe_llm(mode: str, outcome: str, seconds: float, ttft: float = None):
+    """mode: sync | stream, outcome: ok | error | cache."""
+    if prometheus_client is None:
+        return
+    LLM_LATENCY.labels(mode, outcome).observe(seconds)
+    if outcome == "ok":
+        LLM_TTFT.labels(mode).observe(seconds if ttft is None else ttft)
+
+
+def upstream_error(exc):
+    if prometheus_client is None:
+        return
+    from .resilience import CircuitOpenError, _status_of, is_connect_error, is_connection_error
+    status = _status_of(exc)
+    if isinstance(exc, CircuitOpenError):
+        kind = "circuit_open"
+    elif is_connect_error(exc):
+        kind = "connect"
+    elif is_connection_error(exc):
+        kind = "disconnect"
+    elif status is not None:
+        kind = f"http_{status // 100}xx"
+    elif "timeout" in type(exc).__name__.lower():
+        kind = "timeout"
+    else:
+        kind = "other"
+    UPSTREAM_ERRORS.labels(kind).inc()
+
+
+def observe_upload(size: int):
+    if prometheus_client is not None and size is not None:
+        UPLOAD_BYTES.observe(size)
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.histogram is not None:
+            self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+def time_extract():
+    """with time_extract(): pdf_bytes_to_markdown(...)"""
+    return _Timer(EXTRACT_SECONDS if prometheus_client is not None else None)
+
+
+class _QueueCollector:
+    """스크레이프 때 전 워커 공통 상태를 직접 읽는 gauge 들 (admission 상태, 작업 큐). 락은 잡지 않는다."""
+    def collect(self):
+        from prometheus_client.core import GaugeMetricFamily
+        from .admission import get_admission
+
+        adm = get_admission()
+        yield GaugeMetricFamily("llmproxy_admission_inflight", "실행 중인 GPU 호출 (전 워커)", value=adm.global_inflight())
+        yield GaugeMetricFamily("llmproxy_admission_queue_depth", "admission 대기열 길이 (전 워커)", value=adm.global_queued())
+        try:
+            from django.db.models import Count
+            from ..models import BackgroundJob
+            jobs = GaugeMetricFamily("llmproxy_jobs", "백그라운드 작업 수", labels=["kind", "status"])
+            rows = (BackgroundJob.objects.filter(status__in=("queued", "running"))
+                    .values("kind", "status").annotate(n=Count("id")))
+            for row in rows:
+                jobs.add_metric([row["kind"], row["status"]], row["n"])
+            yield jobs
+        except Exception:
+            pass  # DB 가 죽어도 나머지 지표는 내보낸다
+
+
+def render():
+    """(본문 bytes, content type). multiprocess 모드면 워커 파일을 합친 새 레지스트리로."""
+    from django.conf import settings
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest
+
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        dirs = [os.environ["PROMETHEUS_MULTIPROC_DIR"], *getattr(settings, "METRICS_EXTRA_DIRS", [])]
+        registry.register(_MultiDirCollector(dirs))
+    else:
+        registry = CollectorRegistry()
+        registry.register(_DefaultRegistryView())
+    registry.register(_QueueCollector())
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class _MultiDirCollector:
+    """여러 multiprocess 디렉터리의 파일을 한 번에 합친다 (디렉터리마다 따로 내보내면 지표 이름이 겹친다)."""
+    def __init__(self, paths):
+        self.paths = paths
+
+    def collect(self):
+        from prometheus_client.multiprocess import MultiProcessCollector
+        files = [f for path in self.paths for f in glob.glob(os.path.join(path, "*.db"))]
+        return MultiProcessCollector.merge(files, accumulate=True)
+
+
+class _DefaultRegistryView:
+    """단일 프로세스(개발/테스트): 기본 REGISTRY 의 지표를 그대로."""
+    def collect(self):
+        return prometheus_client.REGISTRY.collect()
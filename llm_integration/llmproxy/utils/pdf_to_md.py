@@ -1,22 +1,212 @@
-def pdf_bytes_to_markdown(data: bytes) -> str:
-    """PDF → Markdown using PyMuPDF(fitz).
+import os
+import time
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout, wait as futures_wait
+
+PAGE_SEPARATOR = "\n\n---\n\n"
+
+_pool_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_pool_workers = 0
+
+
+def _setting(name: str, default):
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+def _page_markdown(page) -> str:
+    try:
+        # 'markdown' yields MD-like content including headings/lists/links.
+        md = page.get_text("markdown") or ""
+    except Exception:
+        # fallback to plain text if markdown extractor fails on a page
+        md = page.get_text("text") or ""
+    return md.strip()
+
+
+def _extract_range(path: str, start: int, stop: int, deadline: float = None) -> list:
+    """
+    (프로세스 풀 워커) path의 [start, stop) 페이지를 마크다운으로.
+    deadline(time.time() 기준)을 넘기면 페이지 사이에서 멈추고 그때까지의 페이지만 돌려준다
+    → 예산이 끝난 뒤에도 워커가 남은 페이지를 계속 붙잡고 있지 않게.
+    """
+    import fitz  # PyMuPDF
+    out = []
+    with fitz.open(path) as doc:
+        for i in range(start, min(stop, doc.page_count)):
+            if deadline is not None and time.time() > deadline:
+                break
+            out.append(_page_markdown(doc[i]))
+    return out
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    프로세스당 추출 풀 1개 (spawn: 스레드가 있는 gunicorn/워커 프로세스에서 fork 하지 않도록).
+    fork 된 자식에서는 부모 풀을 쓰지 않고 새로 만든다.
+    """
+    global _pool, _pool_pid, _pool_workers
+    pid = os.getpid()
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid or _pool_workers != workers:
+            if _pool is not None and _pool_pid == pid:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            import multiprocessing
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid = pid
+            _pool_workers = workers
+    return _pool
+
+
+def _recycle_pool(pool: ProcessPoolExecutor):
+    """
+    예산이 끝났는데도 안 돌아오는 청크(한 페이지에서 멈춘 경우)는 취소로 멈출 수 없다
+    → 워커 프로세스를 종료하고 다음 요청부터 새 풀을 쓴다.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    if hasattr(pool, "terminate_workers"):  # Python 3.14+
+        pool.terminate_workers()
+        return
+    for proc in list((getattr(pool, "_processes", None) or {}).values()):
+        proc.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ExtractionLimits:
+    """
+    문서당 예산. truncated_reason 이 채워지면 일부 페이지만 추출된 것.
+    failed_pages: 청크 추출이 실패해 빠진 페이지 수 (나머지 페이지는 그대로 쓴다)
+    """
+    def __init__(self, max_pages: int = None, time_budget: float = None):
+        self.max_pages = int(max_pages if max_pages is not None else _setting("PDF_MAX_PAGES", 500))
+        self.time_budget = float(time_budget if time_budget is not None else _setting("PDF_EXTRACT_TIME_BUDGET", 60))
+        self.page_count = 0
+        self.pages_done = 0
+        self.failed_pages = 0
+        self.truncated_reason = ""
+
+
+def _failed_note(start: int, stop: int, exc: Exception) -> str:
+    return f"> (페이지 {start + 1}–{stop} 추출 실패: {type(exc).__name__})"
+
+
+def iter_pages_markdown(source, *, workers: int = None, chunk_pages: int = None, limits: ExtractionLimits = None):
+    """
+    PDF(bytes 또는 파일 경로) → 페이지별 마크다운을 **순서대로** yield.
+    - 페이지 범위를 chunk_pages 단위로 나눠 프로세스 풀에서 병렬 추출
+    - 청크가 1개뿐이면(작은 문서) 풀 없이 현재 프로세스에서 추출
+    - limits.max_pages 초과 페이지는 건너뛴다
+    - limits.time_budget(초): 워커도 같은 마감 시각을 보고 페이지 사이에서 멈춘다.
+      마감 뒤 PDF_EXTRACT_KILL_GRACE 초가 지나도 안 끝난 청크가 있으면 풀을 갈아엎는다
+    - 실패한 청크는 그 페이지 범위만 안내 문구로 대신하고 나머지 페이지는 계속
+    """
+    import fitz  # PyMuPDF
+
+    limits = limits or ExtractionLimits()
+    workers = int(workers or _setting("PDF_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))
+    chunk_pages = max(1, int(chunk_pages or _setting("PDF_EXTRACT_CHUNK_PAGES", 16)))
+    grace = float(_setting("PDF_EXTRACT_KILL_GRACE", 5))
+    deadline = time.monotonic() + limits.time_budget
+    wall_deadline = time.time() + limits.time_budget  # 워커 프로세스용 (monotonic 은 프로세스 간 비교하지 않는다)
+    out_of_time = f"time budget: {limits.time_budget:.0f}s"
+
+    tmp_path = None
+    try:
+        if isinstance(source, (str, os.PathLike)):
+            path = os.fspath(source)
+        else:
+            # 워커 프로세스가 각자 열 수 있도록 한 번만 파일로 (청크마다 bytes를 pickle 하지 않음)
+            fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(source)
+            path = tmp_path
+
+        with fitz.open(path) as doc:
+            limits.page_count = doc.page_count
+        total = min(limits.page_count, limits.max_pages)
+        if limits.page_count > limits.max_pages:
+            limits.truncated_reason = f"page budget: {limits.max_pages}/{limits.page_count} pages"
+
+        ranges = [(s, min(s + chunk_pages, total)) for s in range(0, total, chunk_pages)]
+        if len(ranges) <= 1 or workers <= 1:
+            for start, stop in ranges:
+                if time.monotonic() > deadline:
+                    limits.truncated_reason = out_of_time
+                    return
+                try:
+                    pages = _extract_range(path, start, stop, wall_deadline)
+                except Exception as e:
+                    limits.failed_pages += stop - start
+                    yield _failed_note(start, stop, e)
+                    continue
+                for md in pages:
+                    limits.pages_done += 1
+                    yield md
+                if len(pages) < stop - start:
+                    limits.truncated_reason = out_of_time
+                    return
+            return
+
+        pool = _get_pool(workers)
+        futures = [pool.submit(_extract_range, path, start, stop, wall_deadline) for start, stop in ranges]
+        try:
+            for fut, (start, stop) in zip(futures, ranges):
+                remaining = deadline - time.monotonic()
+                try:
+                    pages = fut.result(timeout=max(0.0, remaining))
+                except FutureTimeout:
+                    limits.truncated_reason = out_of_time
+                    return
+                except Exception as e:  # 청크 하나의 실패(깨진 페이지, 워커 종료)로 문서 전체를 버리지 않는다
+                    limits.failed_pages += stop - start
+                    yield _failed_note(start, stop, e)
+                    continue
+                for md in pages:
+                    limits.pages_done += 1
+                    yield md
+                if len(pages) < stop - start:
+                    limits.truncated_reason = out_of_time
+                    return
+        finally:
+            running = [fut for fut in futures if not fut.cancel() and not fut.done()]
+            # 예산 초과로 끝났을 때: 워커는 마감 시각을 보고 다음 페이지 전에 멈춘다
+            # → grace 초 안에 안 끝나면(한 페이지에서 멈춤) 강제 종료. 예산 전에 닫힌 경우 워커가 마감에 알아서 멈춘다
+            if running and limits.truncated_reason == out_of_time:
+                _, not_done = futures_wait(running, timeout=grace)
+                if not_done:
+                    _recycle_pool(pool)
+    finally:
+        if tmp_path:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+
+def pdf_bytes_to_markdown(data, *, limits: ExtractionLimits = None) -> str:
+    """PDF(bytes 또는 파일 경로) → Markdown using PyMuPDF(fitz).
+    - A path is opened in place by every extraction worker (no in-memory copy).
     - Uses page.get_text("markdown") for good heading/list/table fidelity when possible.
+    - Large documents are split into page chunks and extracted in parallel (iter_pages_markdown).
     - Falls back to simple text join with minimal formatting when PyMuPDF is unavailable.
     """
+    limits = limits or ExtractionLimits()
     try:
-        import fitz  # PyMuPDF
-        import io
-        md_pages: list[str] = []
-        with fitz.open(stream=data, filetype="pdf") as doc:
-            for page in doc:
-                try:
-                    # 'markdown' yields MD-like content including headings/lists/links.
-                    md = page.get_text("markdown") or ""
-                except Exception:
-                    # fallback to plain text if markdown extractor fails on a page
-                    md = page.get_text("text") or ""
-                md_pages.append(md.strip())
-        merged = "\n\n---\n\n".join([m for m in md_pages if m])
+        md_pages = [m for m in iter_pages_markdown(data, limits=limits) if m]
+        if not limits.pages_done and limits.failed_pages:
+            raise RuntimeError("no page could be extracted")
+        if limits.truncated_reason:
+            md_pages.append(f"> (추출 중단: {limits.truncated_reason}, {limits.pages_done}/{limits.page_count} 페이지)")
+        merged = PAGE_SEPARATOR.join(md_pages)
         if merged.strip():
             return merged
     except Exception:
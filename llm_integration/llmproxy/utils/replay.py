@@ -0,0 +1,332 @@
+# 04_project/llm_integration/llmproxy/utils/replay.py
+"""
+트래픽 재생 (replay_traffic 매니지먼트 커맨드) + 캡처 레코드 형식 (TrafficCaptureMiddleware).
+- 입력: JSONL 요청 로그(캡처 미들웨어 출력) 또는 .http 파일(test.http 형식, ### 로 구분)
+  method/path 가 없는 줄(예: 다른 용도의 JSONL)은 건너뛰고 개수만 알려준다
+- 기록된 ts 간격을 speed 배로 줄여(0 이면 간격 없이) 재생, 동시 실행은 concurrency 개까지
+- 요청별 지연, 상태 코드 일치 여부, 응답 JSON 구조(shape) 차이를 모은다
+- RunPod API 경로(/v1/*, /healthz)는 RunPod 쪽(대역 또는 --runpod-base)으로, 나머지는 앱으로
+- 캡처된 conversation_id / id / job_id 는 재생 중 새로 생긴 id 로 바꿔 보낸다
+
+레코드 예 (JSONL 한 줄):
+{"ts": 1760000000.12, "method": "POST", "path": "/llm/api/chat/send", "query": {}, "form": {"message": "xx xxx"},
+ "files": {}, "json": null, "user": "3f9a0c1d2e4b", "status": 200, "ms": 812.3, "shape": {...}, "ids": {...}}
+"""
+import json
+import os
+import queue
+import re
+import threading
+import time
+
+from . import loadtest
+
+# 요청 필드 → id 종류 (응답 ids 와 같은 이름공간끼리 바꾼다)
+ID_FIELDS = {"conversation_id": "conversation", "id": "conversation", "job_id": "job"}
+# 캡처 때 가리는 자유 텍스트 필드 (TRAFFIC_CAPTURE_BODIES=1 이면 원문)
+TEXT_FIELDS = ("message", "title")
+SKIP_FIELDS = ("csrfmiddlewaretoken",)
+
+_write_lock = threading.Lock()
+
+
+# ---- 응답 구조 ----
+def shape(value):
+    """JSON 값 → 구조(키와 타입만). 리스트는 첫 원소 기준."""
+    if isinstance(value, dict):
+        return {k: shape(v) for k, v in sorted(value.items())}
+    if isinstance(value, list):
+        return [shape(value[0])] if value else []
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "str"
+    return "null"
+
+
+def shape_diff(expected, actual, where: str = "$") -> list:
+    """구조 차이 목록. null 과 빈 리스트는 어느 쪽과도 맞는 것으로 본다(값에 따라 흔히 바뀜)."""
+    if expected == actual or "null" in (expected, actual) or [] in (expected, actual):
+        return []
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        out = [f"{where}.{k}: missing" for k in expected if k not in actual]
+        out += [f"{where}.{k}: added" for k in actual if k not in expected]
+        for k in expected.keys() & actual.keys():
+            out += shape_diff(expected[k], actual[k], f"{where}.{k}")
+        return sorted(out)
+    if isinstance(expected, list) and isinstance(actual, list):
+        return shape_diff(expected[0], actual[0], f"{where}[]")
+    return [f"{where}: {_kind(expected)} → {_kind(actual)}"]
+
+
+def _kind(s) -> str:
+    if isinstance(s, dict):
+        return "object"
+    if isinstance(s, list):
+        return "array"
+    return s if s is not None else "non-JSON"
+
+
+# ---- 캡처 ----
+def redact(text: str) -> str:
+    """글자 수와 띄어쓰기만 남긴다 (토큰 수가 비슷하게 재생되도록)."""
+    return re.sub(r"\S", "x", text)
+
+
+def capture_record(request, response, ms: float, user_key: str = None, keep_text: bool = False) -> dict:
+    """요청/응답 → JSONL 레코드. 응답 본문은 구조(shape)와 id 만 남긴다."""
+    form = {}
+    for k, v in request.POST.items():
+        if k in SKIP_FIELDS:
+            continue
+        form[k] = v if keep_text or k not in TEXT_FIELDS else redact(v)
+    files = {
+        k: {"name": f.name, "size": f.size, "content_type": f.content_type}
+        for k, f in request.FILES.items()
+    }
+    body = None
+    if not response.streaming and "json" in response.get("Content-Type", ""):
+        body = loadtest._json_or_none(response.content, "json")
+    return {
+        "ts": round(time.time() - ms / 1000, 3),
+        "method": request.method,
+        "path": request.path,
+        "query": dict(request.GET.items()),
+        "form": form,
+        "files": files,
+        "user": user_key,
+        "status": response.status_code,
+        "ms": round(ms, 1),
+        "shape": shape(body) if body is not None else None,
+        "ids": _ids(body),
+    }
+
+
+def append_record(path: str, record: dict):
+    """한 줄 append (워커 여러 개가 같은 파일에 써도 줄 단위로 섞이지 않게 한 번에 write)."""
+    line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+    with _write_lock, open(path, "a", encoding="utf-8") as fh:
+        fh.write(line)
+
+
+def _ids(body) -> dict:
+    if not isinstance(body, dict):
+        return {}
+    return {k: body[k] for k in ID_FIELDS if isinstance(body.get(k), (int, str)) and not isinstance(body.get(k), bool)}
+
+
+# ---- 입력 ----
+def load_jsonl(path: str) -> tuple:
+    """→ (records, skipped). method/path 가 없는 줄은 요청 로그가 아닌 것으로 보고 건너뛴다."""
+    records, skipped = [], 0
+    with open(path, encoding="utf-8") as fh:
+        for n, line in enumerate(fh, 1):
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if not isinstance(rec, dict) or not rec.get("method") or not str(rec.get("path", "")).startswith("/"):
+                skipped += 1
+                continue
+            rec.setdefault("source", f"{os.path.basename(path)}:{n}")
+            records.append(rec)
+    return records, skipped
+
+
+def load_http(path: str) -> tuple:
+    """test.http(REST Client 형식) → (records, skipped). 호스트는 버리고 경로만 쓴다."""
+    with open(path, encoding="utf-8") as fh:
+        text = fh.read()
+    base_dir = os.path.dirname(os.path.abspath(path))
+    records, skipped = [], 0
+    for n, block in enumerate(re.split(r"^###.*$", text, flags=re.M)):
+        lines = [ln for ln in block.strip("\n").splitlines() if not ln.lstrip().startswith("#")]
+        while lines and not lines[0].strip():
+            lines.pop(0)
+        if not lines:
+            continue
+        m = re.match(r"^(GET|POST|PUT|PATCH|DELETE|HEAD)\s+(\S+)", lines[0].strip())
+        if not m:
+            skipped += 1
+            continue
+        rec = {"method": m.group(1), "source": f"{os.path.basename(path)}#{n}", "form": {}, "files": {}}
+        url = re.sub(r"^https?://[^/]+", "", m.group(2)) or "/"
+        rec["path"], _, qs = url.partition("?")
+        rec["query"] = dict(p.split("=", 1) for p in qs.split("&") if "=" in p)
+        headers, i = {}, 1
+        while i < len(lines) and lines[i].strip():
+            name, _, value = lines[i].partition(":")
+            headers[name.strip().lower()] = value.strip()
+            i += 1
+        body = "\n".join(lines[i + 1:]).strip()
+        ctype = headers.get("content-type", "")
+        if body and "json" in ctype:
+            rec["json"] = json.loads(body)
+        elif body and "multipart/form-data" in ctype:
+            boundary = ctype.split("boundary=", 1)[1].strip().strip('"')
+            rec["form"], rec["files"] = _parse_multipart(body, boundary, base_dir)
+        records.append(rec)
+    return records, skipped
+
+
+def _parse_multipart(body: str, boundary: str, base_dir: str) -> tuple:
+    form, files = {}, {}
+    for part in body.split(f"--{boundary}"):
+        part = part.strip("\r\n ")
+        if not part or part == "--":
+            continue
+        head, _, value = part.partition("\n\n")
+        disp = re.search(r'name="([^"]+)"(?:;\s*filename="([^"]+)")?', head)
+        if not disp:
+            continue
+        ctype = re.search(r"Content-Type:\s*(\S+)", head, re.I)
+        value = value.strip()
+        if disp.group(2):
+            ref = value[1:].strip() if value.startswith("@") else ""
+            files[disp.group(1)] = {
+                "name": disp.group(2),
+                "path": os.path.join(base_dir, ref) if ref else "",
+                "content_type": ctype.group(1) if ctype else "application/octet-stream",
+            }
+        else:
+            form[disp.group(1)] = value
+    return form, files
+
+
+def load(path: str) -> tuple:
+    return load_http(path) if path.endswith(".http") else load_jsonl(path)
+
+
+# ---- 재생 ----
+def is_runpod_path(path: str) -> bool:
+    return path == "/healthz" or path.startswith("/v1/")
+
+
+def endpoint(rec: dict) -> str:
+    return f"{rec['method']} {rec['path']}"
+
+
+def file_payload(spec: dict, pdf_bytes: bytes) -> tuple:
+    """캡처에는 파일 크기만 있다 → 파일이 있으면 그대로, 없으면 합성 PDF 를 기록된 크기까지 채워서."""
+    path = spec.get("path")
+    if path and os.path.isfile(path):
+        with open(path, "rb") as fh:
+            return spec["name"], fh.read(), spec.get("content_type") or "application/pdf"
+    data = pdf_bytes + f"\n% replay {time.time_ns()}\n".encode()  # 매번 다른 바이트 (추출 캐시 적중 방지)
+    pad = (spec.get("size") or 0) - len(data)
+    if pad > 0:
+        data += b"%" + b"x" * (pad - 2) + b"\n" if pad >= 2 else b"\n" * pad
+    return spec.get("name") or "replay.pdf", data, spec.get("content_type") or "application/pdf"
+
+
+class _IdMap:
+    def __init__(self):
+        self._map = {}
+        self._lock = threading.Lock()
+
+    def rewrite(self, fields: dict) -> dict:
+        with self._lock:
+            return {k: self._map.get((ID_FIELDS[k], str(v)), v) if k in ID_FIELDS else v for k, v in fields.items()}
+
+    def learn(self, captured: dict, body):
+        if not captured or not isinstance(body, dict):
+            return
+        with self._lock:
+            for k, old in captured.items():
+                if k in ID_FIELDS and body.get(k) is not None:
+                    self._map[(ID_FIELDS[k], str(old))] = body[k]
+
+
+def replay(records: list, driver_for, *, speed: float = 1.0, concurrency: int = 16, pdf_bytes: bytes = b"") -> dict:
+    """
+    records 를 기록된 간격/speed 로 재생 → {"wall_s", "results": [...], "summary": {...}}
+    driver_for(rec) → 드라이버 (loadtest.InProcessDriver / HttpDriver, 호출자가 미리 만들어 둔 것)
+    """
+    stamps = [r["ts"] for r in records if isinstance(r.get("ts"), (int, float))]
+    t0 = min(stamps) if stamps else 0.0
+    ids = _IdMap()
+    results = [None] * len(records)
+    work = queue.Queue()
+    started = time.perf_counter()
+
+    def run_one(i: int, rec: dict, due: float):
+        late = max(0.0, time.perf_counter() - due)
+        driver = driver_for(rec)
+        query = ids.rewrite(rec.get("query") or {})
+        form = ids.rewrite(rec.get("form") or {})
+        files = {k: file_payload(v, pdf_bytes) for k, v in (rec.get("files") or {}).items()}
+        status, body, error = None, None, None
+        start = time.perf_counter()
+        try:
+            if rec["method"] == "GET":
+                status, body = driver.request("GET", rec["path"], query)
+            else:
+                status, body = driver.request(rec["method"], rec["path"] + _qs(query), form or None,
+                                              files=files or None, json_body=rec.get("json"))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        ms = (time.perf_counter() - start) * 1000
+        ids.learn(rec.get("ids"), body)
+        expected = rec.get("status")
+        diff = []
+        if rec.get("shape") is not None and status is not None and status == expected:
+            diff = shape_diff(rec["shape"], shape(body) if body is not None else None)
+        ok = error is None and (status == expected if expected else status is not None and status < 400)
+        results[i] = {
+            "i": i, "source": rec.get("source", ""), "endpoint": endpoint(rec), "status": status,
+            "expected_status": expected, "ok": ok, "ms": round(ms, 1), "orig_ms": rec.get("ms"),
+            "late_ms": round(late * 1000, 1), "shape_diff": diff, "error": error,
+        }
+
+    def worker():
+        from django.db import connections
+        try:
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                run_one(*item)
+        finally:
+            connections.close_all()  # 워커 스레드가 연 DB 연결 정리
+
+    threads = [threading.Thread(target=worker, name=f"replay-{n}", daemon=True) for n in range(max(1, concurrency))]
+    for t in threads:
+        t.start()
+    offset = 0.0
+    for i, rec in enumerate(records):
+        if speed > 0 and isinstance(rec.get("ts"), (int, float)):
+            offset = (rec["ts"] - t0) / speed
+        due = started + offset
+        wait = due - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        work.put((i, rec, max(due, started)))
+    for _ in threads:
+        work.put(None)
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    return {"wall_s": round(wall, 2), "results": results, "summary": summarize(results, wall)}
+
+
+def _qs(query: dict) -> str:
+    from urllib.parse import urlencode
+    return "?" + urlencode(query) if query else ""
+
+
+def summarize(results: list, wall_seconds: float) -> dict:
+    """loadtest.summarize + 엔드포인트별 상태/구조 불일치 수, 원래 p95, 최대 지연 시작(late)."""
+    out = loadtest.summarize([(r["endpoint"], r["ok"], r["ms"]) for r in results], wall_seconds)
+    for name, row in out.items():
+        rows = [r for r in results if name == "all" or r["endpoint"] == name]
+        orig = sorted(r["orig_ms"] for r in rows if isinstance(r.get("orig_ms"), (int, float)))
+        row["status_mismatch"] = sum(1 for r in rows if r["expected_status"] and r["status"] != r["expected_status"])
+        row["shape_mismatch"] = sum(1 for r in rows if r["shape_diff"])
+        row["orig_p95_ms"] = loadtest.percentile(orig, 95) if orig else None
+        row["max_late_ms"] = max(r["late_ms"] for r in rows)
+    return out
@@ -0,0 +1,240 @@
+# 04_project/llm_integration/llmproxy/utils/resilience.py
+"""
+RunPod 호출 보호 장치 (프로세스 단위 상태).
+- CircuitBreaker: 연속 실패가 쌓이면 reset_timeout 동안 호출 없이 바로 CircuitOpenError
+- LatencyTracker: 최근 응답 시간 분위수 → hedge(두 번째 요청) 시점
+- retry_delay / is_retryable: 다시 보내도 되는 실패만 지수 백오프(full jitter)로 재시도 (POST 는 업스트림에 닿지 않은 실패만)
+"""
+import random
+import threading
+import time
+from collections import deque
+
+RETRYABLE_STATUS = (502, 503, 504)
+RETRYABLE_STATUS_UNSENT = (503,)  # 게이트웨이가 워커에 넘기지 않고 돌려준 응답 (비멱등 요청도 재시도)
+
+
+def _setting(name: str, default):
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+class CircuitOpenError(RuntimeError):
+    """업스트림이 비정상이라 호출하지 않고 바로 실패. retry_after 초 뒤 다시 시도해 볼 수 있다."""
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"upstream unavailable (circuit open): {name}")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def _status_of(exc):
+    return getattr(getattr(exc, "response", None), "status_code", None)
+
+
+def is_connect_error(exc) -> bool:
+    """
+    요청이 서버에 닿기 전에 실패(연결 거부/연결 타임아웃/DNS/풀 대기) — 어떤 요청이든 다시 보내도 안전.
+    requests 는 보낸 뒤 끊긴 경우(Connection aborted)도 ConnectionError 로 감싸므로 urllib3 원인까지 본다.
+    """
+    import requests
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectionError) and not isinstance(exc, requests.exceptions.ReadTimeout):
+        from urllib3.exceptions import ConnectTimeoutError, MaxRetryError, NewConnectionError
+        cause = exc.args[0] if exc.args else None
+        if isinstance(cause, MaxRetryError):
+            cause = cause.reason
+        return isinstance(cause, (NewConnectionError, ConnectTimeoutError))
+    try:
+        import httpx
+        return isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+    except ImportError:
+        return False
+
+
+def is_connection_error(exc) -> bool:
+    """연결 단계 실패 + 요청 도중 끊김(서버가 요청을 받았을 수도 있음)."""
+    import requests
+    if isinstance(exc, requests.exceptions.ConnectionError) and not isinstance(exc, requests.exceptions.ReadTimeout):
+        return True
+    try:
+        import httpx
+        if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout,
+                            httpx.RemoteProtocolError, httpx.ReadError, httpx.WriteError)):
+            return True
+    except ImportError:
+        pass
+    return is_connect_error(exc)
+
+
+def is_retryable(exc, idempotent: bool = True) -> bool:
+    """
+    재시도 대상. 읽기 타임아웃은 GPU가 아직 생성 중일 수 있어 어느 쪽이든 제외.
+    - 멱등(GET 등): 연결 실패/도중 끊김 + 게이트웨이/콜드스타트 응답(502/503/504)
+    - 비멱등(POST /v1/chat, /v1/ingest): 업스트림에 닿지 않은 게 확실한 실패만 — 연결 단계 실패와 게이트웨이 503.
+      502/504/도중 끊김은 pod 가 이미 생성·인제스트를 시작했을 수 있어 다시 보내면 GPU 작업이 두 번 돈다
+    """
+    status = _status_of(exc)
+    if idempotent:
+        return is_connection_error(exc) or status in RETRYABLE_STATUS
+    return is_connect_error(exc) or status in RETRYABLE_STATUS_UNSENT
+
+
+def is_upstream_failure(exc) -> bool:
+    """브레이커 실패로 셀 것: 재시도 대상 + 타임아웃 + 5xx. 4xx 는 업스트림이 살아 있다는 뜻이라 제외."""
+    import requests
+    if is_retryable(exc, idempotent=True) or isinstance(exc, requests.exceptions.Timeout):
+        return True
+    try:
+        import httpx
+        if isinstance(exc, (httpx.TimeoutException, httpx.TransportError)):
+            return True
+    except ImportError:
+        pass
+    status = _status_of(exc)
+    return status is not None and status >= 500
+
+
+def retry_delay(attempt: int, base: float = None, cap: float = None) -> float:
+    """attempt(1부터)번째 재시도 전 대기 시간: full jitter = U(0, min(cap, base * 2^(attempt-1)))."""
+    base = float(base if base is not None else _setting("RUNPOD_RETRY_BASE", 0.5))
+    cap = float(cap if cap is not None else _setting("RUNPOD_RETRY_MAX_DELAY", 4.0))
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+class CircuitBreaker:
+    """
+    closed → (연속 failure_threshold 회 실패) → open → (reset_timeout 경과) → half_open
+    half_open 에서는 시험 요청 1개만 통과시키고, 성공하면 closed / 실패하면 다시 open.
+    """
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._probe_inflight = False
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def is_open(self) -> bool:
+        """상태를 바꾸지 않고 확인(뷰에서 미리 503 판단용). half_open 으로 넘어갈 시점이면 False."""
+        with self._lock:
+            return self.state == "open" and self.retry_after() > 0
+
+    def before_call(self):
+        """호출 직전. 막혀 있으면 CircuitOpenError."""
+        with self._lock:
+            if self.state == "open":
+                if self.retry_after() > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.retry_after())
+                self.state = "half_open"
+                self._probe_inflight = False
+            if self.state == "half_open":
+                if self._probe_inflight:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, 1.0)
+                self._probe_inflight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_inflight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_inflight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opens += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self.state,
+                "failures": self.failures,
+                "opens": self.opens,
+                "rejected": self.rejected,
+                "retry_after": round(self.retry_after(), 1) if self.state == "open" else 0.0,
+            }
+
+
+class LatencyTracker:
+    """최근 window 개 성공 응답의 지연(초). 샘플이 min_samples 미만이면 분위수 없음."""
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float):
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            data = sorted(self._samples)
+        return data[min(len(data) - 1, int(len(data) * p / 100.0))]
+
+    def hedge_delay(self):
+        """hedge 를 쓸 때 두 번째 요청을 보낼 시점(초). 꺼져 있거나 샘플 부족이면 None."""
+        p = float(_setting("RUNPOD_HEDGE_PERCENTILE", 0) or 0)
+        if p <= 0:
+            return None
+        q = self.percentile(p)
+        if q is None:
+            return None
+        return max(q, float(_setting("RUNPOD_HEDGE_MIN_DELAY", 1.0)))
+
+
+_registry_lock = threading.Lock()
+_breakers = {}
+_latencies = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _registry_lock:
+        b = _breakers.get(name)
+        if b is None:
+            b = _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=int(_setting("RUNPOD_BREAKER_FAILURES", 5)),
+                reset_timeout=float(_setting("RUNPOD_BREAKER_RESET", 30)),
+            )
+        return b
+
+
+def get_latency(name: str) -> LatencyTracker:
+    with _registry_lock:
+        t = _latencies.get(name)
+        if t is None:
+            t = _latencies[name] = LatencyTracker()
+        return t
+
+
+def breaker_stats() -> list:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return [b.stats() for b in breakers]
+
+
+def reset_all():
+    """테스트/설정 변경용: 프로세스 상태 초기화."""
+    with _registry_lock:
+        _breakers.clear()
+        _latencies.clear()
@@ -1,9 +1,153 @@
 # 04_project/llm_integration/llmproxy/utils/storage.py
 import os
+import time
 import uuid
+import tempfile
+import threading
+from collections import OrderedDict
+
 import boto3
 from django.conf import settings
-from urllib.parse import quote
+from urllib.parse import quote, urlparse, unquote
+
+from .timing import span
+
+_s3_lock = threading.Lock()
+_s3_client = None
+_s3_pid = None
+
+
+def _bucket_region():
+    bucket = getattr(settings, "AWS_S3_BUCKET", None) or getattr(settings, "AWS_STORAGE_BUCKET_NAME", None)
+    region = getattr(settings, "AWS_S3_REGION_NAME", None) or getattr(settings, "AWS_REGION", None) or os.getenv("AWS_REGION")
+    return bucket, region
+
+
+def get_s3_client():
+    """
+    프로세스당 boto3 S3 클라이언트 1개 (생성 비용이 수십 ms라 매 요청 생성 금지).
+    boto3 client는 스레드 세이프, fork 후에는 PID가 바뀌므로 새로 만든다.
+    """
+    global _s3_client, _s3_pid
+    pid = os.getpid()
+    if _s3_client is None or _s3_pid != pid:
+        with _s3_lock:
+            if _s3_client is None or _s3_pid != pid:
+                _, region = _bucket_region()
+                _s3_client = boto3.client(
+                    "s3",
+                    region_name=region,
+                    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID", getattr(settings, "AWS_ACCESS_KEY_ID", None)),
+                    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY", getattr(settings, "AWS_SECRET_ACCESS_KEY", None)),
+                    # 필요하면 서명버전 강제:
+                    # config=Config(signature_version="s3v4"),
+                )
+                _s3_pid = pid
+    return _s3_client
+
+
+def s3_key_from_url(url: str):
+    """비서명 S3 URL → 객체 키(퍼센트 인코딩 복원). virtual-hosted / path-style 둘 다. 못 찾으면 None."""
+    bucket, _ = _bucket_region()
+    if not url or not bucket:
+        return None
+    u = urlparse(url)
+    key_candidate = None
+    if u.netloc.startswith(bucket + ".") and u.path:
+        # https://{bucket}.s3.{region}.amazonaws.com/{key}
+        key_candidate = u.path.lstrip("/")
+    else:
+        # https://s3.{region}.amazonaws.com/{bucket}/{key}
+        parts = u.path.split("/")
+        if len(parts) >= 3 and parts[1] == bucket:
+            key_candidate = "/".join(parts[2:])
+    if not key_candidate:
+        return None
+    # 퍼센트 인코딩 복원 (한글/공백!)
+    return unquote(key_candidate)
+
+
+class PresignCache:
+    """
+    객체 키 → presigned URL LRU/TTL 캐시.
+    남은 유효시간이 min_remaining 초 이상이면 같은 서명을 재사용한다(브라우저 캐시에도 유리).
+    """
+    def __init__(self, maxsize: int = 1024, min_remaining: int = 300):
+        self.maxsize = maxsize
+        self.min_remaining = min_remaining
+        self._data = OrderedDict()  # (bucket, key, expires) → (url, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, cache_key):
+        now = time.time()
+        with self._lock:
+            item = self._data.get(cache_key)
+            if item and item[1] - now >= self.min_remaining:
+                self._data.move_to_end(cache_key)
+                self.hits += 1
+                return item[0]
+            if item:
+                del self._data[cache_key]
+            self.misses += 1
+            return None
+
+    def put(self, cache_key, url: str, expires_at: float):
+        with self._lock:
+            self._data[cache_key] = (url, expires_at)
+            self._data.move_to_end(cache_key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+_presign_cache = None
+
+
+def _get_presign_cache() -> PresignCache:
+    global _presign_cache
+    if _presign_cache is None:
+        _presign_cache = PresignCache(
+            maxsize=int(getattr(settings, "S3_PRESIGN_CACHE_SIZE", 1024)),
+            min_remaining=int(getattr(settings, "S3_PRESIGN_MIN_REMAINING", 300)),
+        )
+    return _presign_cache
+
+
+def presign_get(key: str, expires: int = 3600) -> str:
+    """get_object presigned URL (캐시 우선)."""
+    bucket, _ = _bucket_region()
+    cache = _get_presign_cache()
+    cache_key = (bucket, key, expires)
+    url = cache.get(cache_key)
+    if url:
+        return url
+    now = time.time()
+    with span("presign"):
+        url = get_s3_client().generate_presigned_url(
+            ClientMethod="get_object",
+            Params={"Bucket": bucket, "Key": key},
+            ExpiresIn=expires,
+        )
+    cache.put(cache_key, url, now + expires)
+    return url
+
+
+def presign_cache_stats() -> dict:
+    return _get_presign_cache().stats()
 
 def _safe_filename(name: str) -> str:
     # 공백 정리
@@ -14,6 +158,15 @@ def _safe_filename(name: str) -> str:
         name = (base[:120] + ("." + ext if ext else "")) if base else name[:140]
     return name
 
+def _transfer_config():
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(
+        multipart_threshold=int(getattr(settings, "S3_MULTIPART_THRESHOLD", 8 * 1024 * 1024)),
+        multipart_chunksize=int(getattr(settings, "S3_MULTIPART_CHUNKSIZE", 8 * 1024 * 1024)),
+        max_concurrency=int(getattr(settings, "S3_MAX_CONCURRENCY", 4)),
+    )
+
+
 def upload_file(django_file, original_name: str, prefix: str = "uploads/") -> str:
     """
     S3에 업로드하고 '비서명 URL'을 반환한다.
@@ -29,18 +182,37 @@ def upload_file(django_file, original_name: str, prefix: str = "uploads/") -> st
     unique = uuid.uuid4().hex
     key = f"{prefix}{unique}-{safe_name}"
 
-    s3 = boto3.client(
-        "s3",
-        region_name=region,
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID", getattr(settings, "AWS_ACCESS_KEY_ID", None)),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY", getattr(settings, "AWS_SECRET_ACCESS_KEY", None)),
-    )
+    s3 = get_s3_client()
 
-    # 업로드
+    # 업로드 (파일 객체에서 파트 단위로 읽어 multipart 전송, 전체를 메모리에 올리지 않음)
     extra_args = {"ContentType": getattr(django_file, "content_type", "application/octet-stream")}
-    s3.upload_fileobj(django_file, bucket, key, ExtraArgs=extra_args)
+    with span("s3_upload"):
+        s3.upload_fileobj(django_file, bucket, key, ExtraArgs=extra_args, Config=_transfer_config())
+
+    return object_url(key)
+
 
+def object_url(key: str) -> str:
     # 비서명 URL 반환 (virtual-hosted style)
     # 키에는 퍼센트 인코딩 필요(브라우저 안전), DB에는 이 "비서명 URL"만 저장
+    bucket, region = _bucket_region()
     encoded_key = quote(key)
     return f"https://{bucket}.s3.{region}.amazonaws.com/{encoded_key}"
+
+
+def download_to_tempfile(key: str, suffix: str = ".pdf"):
+    """
+    S3 객체를 임시 파일로 스트리밍 다운로드해 (처음으로 되감은) 파일 객체를 돌려준다.
+    닫으면 삭제된다. 경로(.name)로 여러 프로세스가 같은 사본을 읽을 수 있다.
+    """
+    bucket, _ = _bucket_region()
+    tmp = tempfile.NamedTemporaryFile(suffix=suffix)
+    try:
+        with span("s3_download"):
+            get_s3_client().download_fileobj(bucket, key, tmp, Config=_transfer_config())
+        tmp.flush()
+        tmp.seek(0)
+    except Exception:
+        tmp.close()
+        raise
+    return tmp
@@ -0,0 +1,101 @@
+# 04_project/llm_integration/llmproxy/utils/timing.py
+"""
+요청 단위 구간 시간 측정 (ServerTimingMiddleware 가 요청마다 RequestTimer 를 연다).
+- with span("runpod"): ...  → 같은 이름은 합산(횟수 포함). 측정 중인 요청이 없으면 아무것도 안 함
+- DB 쿼리는 connection execute_wrapper(db_wrapper)로 자동 집계 → "db" (쿼리 수 포함)
+- contextvars 기반이라 sync_to_async / 스레드 풀 안의 동기 코드에서도 같은 요청으로 모인다
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("llmproxy_request_timer", default=None)
+
+
+class RequestTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = {}       # name → [total_seconds, count]
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            s = self.spans.setdefault(name, [0.0, 0])
+            s[0] += seconds
+            s[1] += 1
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    def summary(self) -> dict:
+        """{name: {"ms": 12.3, "count": 2}, ...} + total_ms"""
+        with self._lock:
+            out = {name: {"ms": round(sec * 1000, 1), "count": n} for name, (sec, n) in self.spans.items()}
+        out["total"] = {"ms": round(self.total_ms(), 1), "count": 1}
+        return out
+
+    def server_timing(self) -> str:
+        """Server-Timing 헤더 값. 예: db;dur=3.2;desc="4 queries", runpod;dur=812.0, total;dur=830.5"""
+        parts = []
+        for name, v in self.summary().items():
+            item = f"{name};dur={v['ms']}"
+            if name == "db":
+                item += f';desc="{v["count"]} queries"'
+            elif v["count"] > 1:
+                item += f';desc="x{v["count"]}"'
+            parts.append(item)
+        return ", ".join(parts)
+
+
+def begin() -> tuple:
+    """새 측정 시작 → (timer, token). 끝나면 end(token)."""
+    timer = RequestTimer()
+    return timer, _current.set(timer)
+
+
+def end(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def span(name: str):
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+def record(name: str, seconds: float):
+    """이미 잰 시간을 더할 때 (예: admission 대기시간)."""
+    timer = _current.get()
+    if timer is not None:
+        timer.add(name, seconds)
+
+
+def db_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrappers 용. 측정 중인 요청의 쿼리 시간/수를 "db" 로 더한다."""
+    timer = _current.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.add("db", time.perf_counter() - start)
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """connection_created 수신기 (apps.ready 에서 연결). 새 DB 연결마다 db_wrapper 를 건다."""
+    # 맨 앞에 둔다: connection.execute_wrapper() 컨텍스트는 끝날 때 마지막 항목을 pop 한다
+    if db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, db_wrapper)
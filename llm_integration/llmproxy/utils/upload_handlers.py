@@ -0,0 +1,27 @@
+# 04_project/llm_integration/llmproxy/utils/upload_handlers.py
+import hashlib
+
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+class Sha256UploadHandler(FileUploadHandler):
+    """
+    멀티파트 본문을 받는 동안 파일별 sha256 을 계산한다(업로드를 다시 읽지 않음).
+    데이터는 그대로 다음 핸들러(Memory/TemporaryFile)로 넘기고,
+    결과는 request.upload_sha256[field_name] 에 남긴다.
+    FILE_UPLOAD_HANDLERS 맨 앞에 둬야 한다.
+    """
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self._hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._hash.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        digests = getattr(self.request, "upload_sha256", None)
+        if digests is None:
+            digests = self.request.upload_sha256 = {}
+        digests[self.field_name] = self._hash.hexdigest()
+        return None
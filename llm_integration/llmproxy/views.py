@@ -1,22 +1,45 @@
 # 04_project/llm_integration/llmproxy/views.py
 import os
 import html
-import requests
+import json
+import hashlib
+import logging
+import math
+import time
+from contextlib import AsyncExitStack, ExitStack, aclosing
+from datetime import datetime
 from pathlib import Path
-from urllib.parse import urlparse, parse_qs, unquote
+from urllib.parse import urlparse, parse_qs
 
-import boto3
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
-from django.http import JsonResponse, HttpRequest
+from django.db.models import Count, F, Max, Q
+from django.http import HttpResponse, JsonResponse, HttpRequest, StreamingHttpResponse
 from django.shortcuts import render, redirect
-from django.views.decorators.http import require_POST
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.views.decorators.http import condition, require_POST
 
-from .models import Conversation, Message
-from .utils.llm_client import LLMClient
-from .utils.storage import upload_file
-from .utils.pdf_to_md import pdf_bytes_to_markdown
+from . import idempotency, response_cache
+from .idempotency import IdempotencyConflict
+from .jobs import enqueue, maybe_enqueue_summary, run_inline
+from .models import BackgroundJob, Conversation, Message, PdfDocument, PdfExtraction, PdfIndex
+from .utils import metrics
+from .utils.admission import AdmissionRejected, get_admission
+from .utils.context import build_context
+from .utils.llm_client import AsyncLLMClient, LLMClient, extract_answer, upstream_retry_after
+from .utils.storage import object_url, presign_get, s3_key_from_url, upload_file
+from .utils.timing import record, span
+
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_PAGE_MAX = 200
+CONVERSATIONS_PAGE_SIZE = 50
+CONVERSATIONS_PAGE_MAX = 200
+
+logger = logging.getLogger(__name__)
 
 
 def _ensure_session_key(request: HttpRequest) -> str:
@@ -38,14 +61,13 @@ def chat_page(request: HttpRequest):
 def _presign_if_s3(url: str, expires: int = 3600) -> str:
     """
     - 이미 presigned(쿼리에 X-Amz-Algorithm/Signature)면 **그대로 반환** (이중 서명 금지)
-    - 비서명 URL이면 key를 추출해 **한글/공백 unquote** 후 presign
+    - 비서명 URL이면 key를 추출해 **한글/공백 unquote** 후 presign (프로세스 공용 클라이언트 + URL 캐시)
     - 실패 시 원본 URL 반환
     """
     if not url:
         return url
 
-    u = urlparse(url)
-    q = parse_qs(u.query)
+    q = parse_qs(urlparse(url).query)
     if "X-Amz-Signature" in q or "X-Amz-Algorithm" in q:
         return url  # already presigned
 
@@ -54,37 +76,11 @@ def _presign_if_s3(url: str, expires: int = 3600) -> str:
     if not bucket or not region:
         return url
 
-    # key 추출 (virtual-hosted / path-style 둘 다 시도)
-    key_candidate = None
     try:
-        if u.netloc.startswith(bucket + ".") and u.path:
-            # https://{bucket}.s3.{region}.amazonaws.com/{key}
-            key_candidate = u.path.lstrip("/")
-        else:
-            # https://s3.{region}.amazonaws.com/{bucket}/{key}
-            parts = u.path.split("/")
-            if len(parts) >= 3 and parts[1] == bucket:
-                key_candidate = "/".join(parts[2:])
-        if not key_candidate:
+        key = s3_key_from_url(url)
+        if not key:
             return url
-
-        # 퍼센트 인코딩 복원 (한글/공백!)
-        key = unquote(key_candidate)
-
-        s3 = boto3.client(
-            "s3",
-            region_name=region,
-            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID", getattr(settings, "AWS_ACCESS_KEY_ID", None)),
-            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY", getattr(settings, "AWS_SECRET_ACCESS_KEY", None)),
-            # 필요하면 서명버전 강제:
-            # config=Config(signature_version="s3v4"),
-        )
-        signed = s3.generate_presigned_url(
-            ClientMethod="get_object",
-            Params={"Bucket": bucket, "Key": key},
-            ExpiresIn=expires,
-        )
-        return signed
+        return presign_get(key, expires)
     except Exception:
         return url
 
@@ -105,103 +101,755 @@ def chat_history(request: HttpRequest):
         if not conv:
             conv = Conversation.objects.create(user=request.user, session_key=session_key, title="New Chat")
 
-    last50 = list(conv.messages.all().order_by("-id")[:50])
-    last50.reverse()
+    # keyset 페이지네이션 (Message.id 기준)
+    # - 기본: 최신 limit개
+    # - before_id: 그보다 오래된 limit개 (위로 스크롤 "이전 메시지")
+    # - after_id: 그보다 새로운 메시지만 (이미 본 대화로 돌아왔을 때 증분 로딩)
+    try:
+        limit = max(1, min(int(request.GET.get("limit") or HISTORY_PAGE_SIZE), HISTORY_PAGE_MAX))
+        before_id = int(request.GET["before_id"]) if request.GET.get("before_id") else None
+        after_id = int(request.GET["after_id"]) if request.GET.get("after_id") else None
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "invalid cursor"}, status=400)
+
+    msgs = conv.messages.all()
+    if after_id is not None:
+        page = list(msgs.filter(id__gt=after_id).order_by("id")[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+    else:
+        if before_id is not None:
+            msgs = msgs.filter(id__lt=before_id)
+        page = list(msgs.order_by("-id")[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        page.reverse()
     items = [
         {"id": m.id, "role": m.role, "content": m.content, "file_url": m.file_url, "created_at": m.created_at.strftime("%Y-%m-%d %H:%M:%S")}
-        for m in last50
+        for m in page
     ]
 
     # 화면 표시용 presigned URL (DB에는 비서명 저장)
     presigned = _presign_if_s3(conv.uploaded_pdf_url) if conv.uploaded_pdf_url else ""
 
-    return JsonResponse({
+    with span("serialize"):
+        return JsonResponse({
+            "ok": True,
+            "conversation_id": conv.id,
+            "title": conv.title,
+            "uploaded_pdf_url": presigned,
+            "items": items,
+            # after_id 모드면 "더 새로운 메시지 있음", 아니면 "더 오래된 메시지 있음"
+            "has_more": has_more,
+            "first_id": items[0]["id"] if items else before_id,
+            "last_id": items[-1]["id"] if items else after_id,
+        })
+
+
+async def _aresolve_conversation(user, conv_id, session_key: str):
+    """_resolve_conversation의 async ORM 버전."""
+    if conv_id:
+        try:
+            return await Conversation.objects.aget(pk=conv_id, user=user)
+        except Conversation.DoesNotExist:
+            return None
+    conv = await Conversation.objects.filter(user=user).order_by("-updated_at", "-id").afirst()
+    if not conv:
+        conv = await Conversation.objects.acreate(user=user, session_key=session_key, title="New Chat")
+    return conv
+
+
+def _resolve_conversation(request: HttpRequest, conv_id, session_key: str):
+    """conversation_id가 있으면 본인 것만, 없으면 최근 대화(없으면 새로 생성). 못 찾으면 None."""
+    if conv_id:
+        try:
+            return Conversation.objects.get(pk=conv_id, user=request.user)
+        except Conversation.DoesNotExist:
+            return None
+    conv = Conversation.objects.filter(user=request.user).order_by("-updated_at", "-id").first()
+    if not conv:
+        conv = Conversation.objects.create(user=request.user, session_key=session_key, title="New Chat")
+    return conv
+
+
+def _pdf_attachments(conv: Conversation):
+    # RunPod 인덱싱이 안 된 동안은 업로드 PDF에서 질문과 관련된 청크를 system message로 보낸다
+    # 본문 대신 로컬 BM25 인덱스(PdfIndex, 프로세스 캐시)에서 top-k 청크만 고른다(_build_context)
+    if conv.uploaded_pdf_url and (not conv.pdf_context_attached) and conv.document_id:
+        document = PdfDocument.objects.only("sha256").get(pk=conv.document_id)
+        return [{"type": "markdown", "index": PdfIndex.load(document), "name": "uploaded.pdf.md"}]
+    return None
+
+
+def _build_context(conv: Conversation, history):
+    """
+    history + 문서 첨부를 토큰 예산(CONTEXT_TOKEN_BUDGET)에 맞춰 자른다.
+    반환: (messages, attachments, stats) — stats는 응답의 "context" 와 로그에 그대로 싣는다.
+    """
+    with span("context"):
+        messages, attachments, stats = build_context(history, _pdf_attachments(conv))
+    logger.info(
+        "llm context conv=%s tokens=%d (history=%d/%d msgs, document=%d/%d chunks %d tokens) budget=%d summary_upto=%d",
+        conv.id, stats["total_tokens"], stats["history_messages"], len(history),
+        stats["document_chunks"], stats["document_chunks_total"], stats["document_tokens"], stats["budget"],
+        conv.summary_upto_id,
+    )
+    stats["summary_upto_id"] = conv.summary_upto_id
+    return messages, attachments, stats
+
+
+def _llm_params(user, conv: Conversation, attachments) -> dict:
+    return dict(
+        user_id=str(user.email or user.username),
+        session_id=str(conv.id),
+        max_tokens=1024,
+        temperature=0.7,
+        top_p=0.9,
+        repetition_penalty=1.05,
+        k_internal=6,
+        k_external=0,
+        attachments=attachments,
+    )
+
+
+def _cache_lookup(user, conv: Conversation, messages, params: dict, ctx: dict):
+    """
+    응답 캐시(RESPONSE_CACHE_ENABLED) 조회 → (key, 캐시된 응답 또는 None).
+    ctx["cache"] = "exact" | "near" | "miss" (캐시가 꺼져 있으면 넣지 않음)
+    """
+    ck = response_cache.make_key(user, conv, messages, params)
+    if ck is None:
+        return None, None
+    with span("cache"):
+        reply, mode = response_cache.lookup(ck)
+    ctx["cache"] = mode or "miss"
+    return ck, reply
+
+
+def _message_item(msg: Message) -> dict:
+    return {
+        "id": msg.id,
+        "role": msg.role,
+        "content": msg.content,
+        "created_at": msg.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def _start_turn(conv: Conversation, content: str):
+    """
+    1단계(짧은 트랜잭션): 유저 메시지 저장 + LLM에 보낼 최근 history 반환.
+    - 같은 대화에 동시 전송이 오면 Conversation 행 잠금으로 순서를 직렬화
+    - history는 방금 저장한 메시지까지만 (뒤늦게 들어온 다른 요청의 메시지 제외)
+    - 요약(summary)이 있으면 요약된 메시지는 빼고, 요약을 맨 앞 system 메시지로
+    """
+    with transaction.atomic():
+        Conversation.objects.select_for_update().filter(pk=conv.pk).values_list("id", flat=True).get()
+        # save user message
+        user_msg = Message.objects.create(conversation=conv, role="user", content=content)
+        # set title from first question if empty (동시 요청 중 첫 번째만 반영)
+        if not conv.title:
+            conv.title = content[:10]
+            Conversation.objects.filter(pk=conv.pk, title="").update(title=conv.title, updated_at=timezone.now())
+
+        # collect last few messages for context (토큰 예산에 맞추는 건 _build_context)
+        limit = int(getattr(settings, "CONTEXT_HISTORY_MAX_MESSAGES", 20))
+        history = [
+            {"role": m.role, "content": m.content}
+            for m in conv.messages.filter(id__gt=conv.summary_upto_id, id__lte=user_msg.id).order_by("-id")[:limit][::-1]
+        ]
+        if conv.summary:
+            history.insert(0, {"role": "system", "content": f"이전 대화 요약:\n{conv.summary}"})
+        return history
+
+
+def _finish_turn(conv: Conversation, reply: str, mark_attached: bool = False) -> Message:
+    """
+    3단계(짧은 트랜잭션): LLM 응답 저장. LLM 호출 동안에는 트랜잭션을 열어두지 않는다.
+    mark_attached: 문서 전체를 보냈을 때만 True (일부 청크만 보냈으면 다음 턴에도 관련 청크를 다시 고른다)
+    """
+    with transaction.atomic():
+        msg = Message.objects.create(conversation=conv, role="assistant", content=reply)
+        if mark_attached:
+            conv.pdf_context_attached = True
+            Conversation.objects.filter(pk=conv.pk, pdf_context_attached=False).update(
+                pdf_context_attached=True, updated_at=timezone.now()
+            )
+    # N턴마다 오래된 메시지를 요약으로 접는다(워커에서)
+    job = maybe_enqueue_summary(conv)
+    if job is not None and getattr(settings, "JOBS_RUN_INLINE", False):
+        run_inline(job)
+    return msg
+
+
+def _upstream_unavailable():
+    """
+    RunPod 서킷이 열려 있으면(연속 실패) 유저 메시지를 저장하기 전에 바로 503 + Retry-After.
+    2분 타임아웃을 기다리게 하지 않는다.
+    """
+    retry_after = upstream_retry_after()
+    if retry_after is None:
+        return None
+    resp = JsonResponse({
+        "ok": False,
+        "error": "LLM 서버가 일시적으로 응답하지 않습니다. 잠시 후 다시 시도해 주세요.",
+        "code": "upstream_unavailable",
+        "retry_after": math.ceil(retry_after),
+    }, status=503)
+    resp["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return resp
+
+
+def _too_many_requests(e: AdmissionRejected) -> JsonResponse:
+    """동시 실행/대기열 한도 초과 → 429 + Retry-After (유저 메시지는 저장하지 않음)."""
+    resp = JsonResponse({
+        "ok": False,
+        "error": "요청이 많아 잠시 대기열이 가득 찼습니다. 잠시 후 다시 시도해 주세요.",
+        "code": "too_many_requests",
+        "reason": e.reason,
+        "retry_after": e.retry_after,
+    }, status=429)
+    resp["Retry-After"] = str(e.retry_after)
+    return resp
+
+
+def _log_queue(conv: Conversation, ticket):
+    record("queue", ticket.queue_ms / 1000)
+    if ticket.queue_ms:
+        logger.info("llm admission conv=%s queued_ms=%d", conv.id, ticket.queue_ms)
+
+
+class _ClosingStream:
+    """
+    StreamingHttpResponse 가 닫힐 때(클라이언트 끊김 포함, 제너레이터를 시작도 안 했어도)
+    잡아 둔 자원(admission 슬롯, 멱등 키)을 놓도록 close() 를 붙인 이터러블.
+    """
+    def __init__(self, gen, stack: ExitStack):
+        self.gen = gen
+        self.stack = stack
+
+    def __iter__(self):
+        return self.gen
+
+    def close(self):
+        try:
+            self.gen.close()
+        finally:
+            self.stack.close()
+
+
+class _AsyncClosingStream:
+    """
+    _ClosingStream 의 async 버전(ASGI): async 제너레이터를 그대로 흘려 보내 토큰이 바로 나간다.
+    Django 는 응답이 끝나면 close() 를 (동기로) 부르므로 자원은 동기로 놓을 수 있는 것만 stack 에 둔다.
+    """
+    def __init__(self, agen, stack: ExitStack):
+        self.agen = agen
+        self.stack = stack
+
+    def __aiter__(self):
+        return self.agen
+
+    def close(self):
+        self.stack.close()
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _idempotency_conflict(e: IdempotencyConflict) -> JsonResponse:
+    if e.reason == "key_reused":
+        return JsonResponse({
+            "ok": False,
+            "error": "같은 Idempotency-Key 로 다른 요청을 보냈습니다.",
+            "code": "idempotency_key_reused",
+        }, status=422)
+    resp = JsonResponse({
+        "ok": False,
+        "error": "같은 요청을 아직 처리하고 있습니다. 잠시 후 다시 시도해 주세요.",
+        "code": "idempotency_in_progress",
+        "retry_after": e.retry_after,
+    }, status=409)
+    resp["Retry-After"] = str(e.retry_after)
+    return resp
+
+
+def _replayed(body: dict) -> JsonResponse:
+    """먼저 끝난 같은 키 요청의 응답을 그대로 (유저 메시지/LLM 호출 없이)."""
+    resp = JsonResponse(body)
+    resp["Idempotent-Replayed"] = "true"
+    return resp
+
+
+@require_POST
+@login_required
+def chat_send(request: HttpRequest):
+    """
+    Idempotency-Key 가 있으면 같은 키의 중복 요청(더블 클릭/재시도)은 첫 요청 결과를 기다렸다가 재전송한다.
+    """
+    content = (request.POST.get("message") or "").strip()
+    conv_id = request.POST.get("conversation_id")
+    if not content:
+        return JsonResponse({"ok": False, "error": "message is empty"}, status=400)
+
+    key = idempotency.request_key(request)
+    if key is None:
+        return _chat_turn(request, content, conv_id)
+    try:
+        rec, replay = idempotency.claim(request.user.pk, key, idempotency.fingerprint(conv_id, content))
+    except IdempotencyConflict as e:
+        return _idempotency_conflict(e)
+    if replay is not None:
+        return _replayed(replay)
+    try:
+        resp = _chat_turn(request, content, conv_id)
+    except BaseException:
+        idempotency.release(rec)
+        raise
+    idempotency.finish(rec, resp.status_code, json.loads(resp.content), getattr(resp, "llm_outcome", "ok"))
+    return resp
+
+
+def _chat_turn(request: HttpRequest, content: str, conv_id) -> JsonResponse:
+    session_key = _ensure_session_key(request)
+    unavailable = _upstream_unavailable()
+    if unavailable is not None:
+        return unavailable
+
+    conv = _resolve_conversation(request, conv_id, session_key)
+    if conv is None:
+        return JsonResponse({"ok": False, "error": "conversation not found"}, status=404)
+
+    # GPU 호출 동시 실행 제한(전역 + 사용자별). LLM 응답을 받을 때까지 슬롯을 잡고 있는다
+    stack = ExitStack()
+    try:
+        ticket = stack.enter_context(get_admission().admit(request.user.pk))
+    except AdmissionRejected as e:
+        return _too_many_requests(e)
+
+    with stack:
+        _log_queue(conv, ticket)
+        history = _start_turn(conv, content)
+
+        start = time.time()
+        messages, attachments, ctx = _build_context(conv, history)
+        params = _llm_params(request.user, conv, attachments)
+        cache_key, reply = _cache_lookup(request.user, conv, messages, params, ctx)
+
+        outcome = "cache"
+        if reply is None:
+            try:
+                result = LLMClient().chat(messages=messages, **params)
+                reply = extract_answer(result)
+                outcome = "ok"
+                response_cache.store(cache_key, reply, time.time() - start)
+            except Exception as e:
+                reply = f"LLM error: {e}"
+                outcome = "error"
+        elapsed_ms = int((time.time() - start) * 1000)
+        metrics.observe_llm("sync", outcome, elapsed_ms / 1000)
+
+    msg = _finish_turn(conv, reply, bool(attachments) and not ctx["document_truncated"])
+
+    resp = JsonResponse({
         "ok": True,
         "conversation_id": conv.id,
-        "title": conv.title,
-        "uploaded_pdf_url": presigned,
-        "items": items
+        "item": {**_message_item(msg), "elapsed_ms": elapsed_ms, "queue_ms": ticket.queue_ms},
+        "context": ctx,
     })
+    resp.llm_outcome = outcome  # 멱등 키: "error" 로 끝난 턴은 저장하지 않는다
+    return resp
 
 
 @require_POST
 @login_required
-@transaction.atomic
-def chat_send(request: HttpRequest):
-    session_key = _ensure_session_key(request)
-    content = (request.POST.get("message") or "").trim() if hasattr(str, "trim") else (request.POST.get("message") or "").strip()
+def chat_send_stream(request: HttpRequest):
+    """
+    chat_send의 스트리밍(SSE) 버전.
+    - event: meta  → conversation_id / 유저 메시지 저장 완료
+    - event: token → 업스트림에서 받은 텍스트 조각
+    - event: done  → 저장된 assistant 메시지 + ttft_ms / elapsed_ms
+    Idempotency-Key 는 chat_send 와 같다. 끝난 키는 저장된 done 을 meta/token/done 으로 다시 흘려 보낸다.
+    """
+    content = (request.POST.get("message") or "").strip()
     conv_id = request.POST.get("conversation_id")
+    if not content:
+        return JsonResponse({"ok": False, "error": "message is empty"}, status=400)
+
+    key = idempotency.request_key(request)
+    if key is None:
+        return _chat_stream_turn(request, content, conv_id)
+    try:
+        rec, replay = idempotency.claim(request.user.pk, key, idempotency.fingerprint(conv_id, content))
+    except IdempotencyConflict as e:
+        return _idempotency_conflict(e)
+    if replay is not None:
+        return _replayed_stream(replay)
+    try:
+        resp = _chat_stream_turn(request, content, conv_id, rec)
+    except BaseException:
+        idempotency.release(rec)
+        raise
+    if not resp.streaming:
+        idempotency.release(rec)  # 429/503/404: 스트림을 시작하지 못함
+    return resp
+
+
+def _replayed_stream(body: dict, is_async: bool = False) -> StreamingHttpResponse:
+    """먼저 끝난 같은 키 요청의 결과를 스트림 모양 그대로 (토큰 하나 + done, LLM 호출 없이)."""
+    events = [
+        _sse("meta", {"conversation_id": body.get("conversation_id"), "queue_ms": 0}),
+        _sse("token", {"t": (body.get("item") or {}).get("content", "")}),
+        _sse("done", body),
+    ]
+
+    async def aevents():
+        for event in events:
+            yield event
+
+    resp = StreamingHttpResponse(aevents() if is_async else events, content_type="text/event-stream; charset=utf-8")
+    resp["Cache-Control"] = "no-cache"
+    resp["Idempotent-Replayed"] = "true"
+    return resp
+
+
+def _chat_stream_turn(request: HttpRequest, content: str, conv_id, rec=None):
+    session_key = _ensure_session_key(request)
+    unavailable = _upstream_unavailable()
+    if unavailable is not None:
+        return unavailable
+
+    conv = _resolve_conversation(request, conv_id, session_key)
+    if conv is None:
+        return JsonResponse({"ok": False, "error": "conversation not found"}, status=404)
+
+    # 슬롯은 스트림이 끝나거나 클라이언트가 끊을 때(_ClosingStream.close) 놓는다
+    stack = ExitStack()
+    try:
+        ticket = stack.enter_context(get_admission().admit(request.user.pk))
+    except AdmissionRejected as e:
+        return _too_many_requests(e)
+    _log_queue(conv, ticket)
+    try:
+        history = _start_turn(conv, content)
+        messages, attachments, ctx = _build_context(conv, history)
+        params = _llm_params(request.user, conv, attachments)
+        cache_key, cached = _cache_lookup(request.user, conv, messages, params, ctx)
+    except BaseException:
+        stack.close()
+        raise
 
+    def chunks():
+        # 캐시 적중이면 업스트림 호출 없이 응답 전체를 토큰 하나로
+        if cached is not None:
+            yield cached
+            return
+        yield from LLMClient().chat_stream(messages=messages, **params)
+
+    def events():
+        yield _sse("meta", {"conversation_id": conv.id, "queue_ms": ticket.queue_ms})
+        start = time.time()
+        ttft_ms = None
+        parts = []
+        try:
+            for piece in chunks():
+                if ttft_ms is None:
+                    ttft_ms = int((time.time() - start) * 1000)
+                parts.append(piece)
+                yield _sse("token", {"t": piece})
+            reply = "".join(parts)
+            outcome = "cache" if cached is not None else "ok"
+            if cached is None:
+                response_cache.store(cache_key, reply, time.time() - start)
+        except Exception as e:
+            # 일부만 받았더라도 에러를 붙여 저장(새로고침 시 동일하게 보이도록)
+            reply = "".join(parts) + f"\n\nLLM error: {e}" if parts else f"LLM error: {e}"
+            outcome = "error"
+            yield _sse("error", {"error": str(e)})
+        elapsed_ms = int((time.time() - start) * 1000)
+        metrics.observe_llm("stream", outcome, elapsed_ms / 1000, ttft_ms / 1000 if ttft_ms is not None else None)
+        stack.close()
+
+        msg = _finish_turn(conv, reply, bool(attachments) and not ctx["document_truncated"])
+        done = {
+            "ok": True,
+            "conversation_id": conv.id,
+            "item": {**_message_item(msg), "elapsed_ms": elapsed_ms, "ttft_ms": ttft_ms, "queue_ms": ticket.queue_ms},
+            "context": ctx,
+        }
+        idempotency.finish(rec, 200, done, outcome)
+        yield _sse("done", done)
+
+    # done 전에 끊기면(클라이언트 종료 등) 멱등 키를 놓는다. finish 뒤에는 release 가 아무 일도 하지 않는다
+    closing = ExitStack()
+    closing.callback(idempotency.release, rec)
+    closing.push(stack)
+    resp = StreamingHttpResponse(_ClosingStream(events(), closing), content_type="text/event-stream; charset=utf-8")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"  # nginx 버퍼링 해제
+    return resp
+
+
+@require_POST
+@login_required
+async def chat_send_stream_async(request: HttpRequest):
+    """
+    chat_send_stream 의 ASGI 버전 (이벤트/멱등 키 처리는 같다).
+    sync 제너레이터를 ASGI 로 내보내면 Django 가 답변 전체를 모은 뒤에야 보내고(토큰 스트리밍 없음)
+    스레드 하나를 생성 내내 붙잡으므로, async 제너레이터 + AsyncLLMClient.chat_stream 으로 흘려 보낸다.
+    """
+    user = await request.auser()
+    content = (request.POST.get("message") or "").strip()
+    conv_id = request.POST.get("conversation_id")
     if not content:
         return JsonResponse({"ok": False, "error": "message is empty"}, status=400)
 
-    # resolve conversation
-    if conv_id:
+    rec = None
+    key = idempotency.request_key(request)
+    if key is not None:
         try:
-            conv = Conversation.objects.get(pk=conv_id, user=request.user)
-        except Conversation.DoesNotExist:
-            return JsonResponse({"ok": False, "error": "conversation not found"}, status=404)
-    else:
-        conv = Conversation.objects.filter(user=request.user).order_by("-updated_at", "-id").first()
-        if not conv:
-            conv = Conversation.objects.create(user=request.user, session_key=session_key, title="New Chat")
+            rec, replay = await idempotency.aclaim(user.pk, key, idempotency.fingerprint(conv_id, content))
+        except IdempotencyConflict as e:
+            return _idempotency_conflict(e)
+        if replay is not None:
+            return _replayed_stream(replay, is_async=True)
+    try:
+        resp = await _achat_stream_turn(request, user, content, conv_id, rec)
+    except BaseException:
+        await sync_to_async(idempotency.release)(rec)
+        raise
+    if not resp.streaming:
+        await sync_to_async(idempotency.release)(rec)  # 429/503/404: 스트림을 시작하지 못함
+    return resp
 
-    # save user message
-    Message.objects.create(conversation=conv, role="user", content=content)
-    # set title from first question if empty
-    if not conv.title:
-        conv.title = content[:10]
-        conv.save(update_fields=["title", "updated_at"])
-
-    # collect last few messages for context
-    history = [
-        {"role": m.role, "content": m.content}
-        for m in conv.messages.all().order_by("-id")[:10][::-1]
-    ]
 
-    client = LLMClient()
-    import time
-    start = time.time()
-    attachments = None
-    # RunPod는 내부 인덱스를 쓰지만, 처음 1회 업로드한 PDF의 MD를 system message로 보낼 수 있음
-    if conv.uploaded_pdf_url and (not conv.pdf_context_attached) and conv.pdf_context_md:
-        attachments = [{"type": "markdown", "content": conv.pdf_context_md, "name": "uploaded.pdf.md"}]
+async def _achat_stream_turn(request: HttpRequest, user, content: str, conv_id, rec=None):
+    session_key = await sync_to_async(_ensure_session_key)(request)
+    unavailable = _upstream_unavailable()
+    if unavailable is not None:
+        return unavailable
+
+    conv = await _aresolve_conversation(user, conv_id, session_key)
+    if conv is None:
+        return JsonResponse({"ok": False, "error": "conversation not found"}, status=404)
 
     try:
-        result = client.chat(
-            messages=history,
-            user_id=str(request.user.email or request.user.username),
-            session_id=str(conv.id),
-            max_tokens=1024,
-            temperature=0.7,
-            top_p=0.9,
-            repetition_penalty=1.05,
-            k_internal=6,
-            k_external=0,
-            attachments=attachments,
+        ticket = await get_admission().aenter(user.pk)
+    except AdmissionRejected as e:
+        return _too_many_requests(e)
+    # 스트림이 끝나거나 끊기면(응답 close) 슬롯 → 멱등 키 순으로 놓는다. finish 뒤의 release 는 아무 일도 안 함
+    closing = ExitStack()
+    closing.callback(idempotency.release, rec)
+    closing.callback(ticket.release)
+    _log_queue(conv, ticket)
+    try:
+        history = await sync_to_async(_start_turn)(conv, content)
+        messages, attachments, ctx = await sync_to_async(_build_context)(conv, history)
+        params = _llm_params(user, conv, attachments)
+        cache_key, cached = await sync_to_async(_cache_lookup)(user, conv, messages, params, ctx)
+    except BaseException:
+        await sync_to_async(closing.close)()
+        raise
+
+    async def cached_chunks():
+        yield cached
+
+    async def events():
+        try:
+            yield _sse("meta", {"conversation_id": conv.id, "queue_ms": ticket.queue_ms})
+            start = time.time()
+            ttft_ms = None
+            parts = []
+            try:
+                # 캐시 적중이면 업스트림 호출 없이 응답 전체를 토큰 하나로
+                stream = cached_chunks() if cached is not None else AsyncLLMClient().chat_stream(messages=messages, **params)
+                async with aclosing(stream):  # 중간에 끊겨도 업스트림 연결을 바로 닫는다
+                    async for piece in stream:
+                        if ttft_ms is None:
+                            ttft_ms = int((time.time() - start) * 1000)
+                        parts.append(piece)
+                        yield _sse("token", {"t": piece})
+                reply = "".join(parts)
+                outcome = "cache" if cached is not None else "ok"
+                if cached is None:
+                    await sync_to_async(response_cache.store)(cache_key, reply, time.time() - start)
+            except Exception as e:
+                reply = "".join(parts) + f"\n\nLLM error: {e}" if parts else f"LLM error: {e}"
+                outcome = "error"
+                yield _sse("error", {"error": str(e)})
+            elapsed_ms = int((time.time() - start) * 1000)
+            metrics.observe_llm("stream", outcome, elapsed_ms / 1000, ttft_ms / 1000 if ttft_ms is not None else None)
+            ticket.release()
+
+            msg = await sync_to_async(_finish_turn)(conv, reply, bool(attachments) and not ctx["document_truncated"])
+            done = {
+                "ok": True,
+                "conversation_id": conv.id,
+                "item": {**_message_item(msg), "elapsed_ms": elapsed_ms, "ttft_ms": ttft_ms, "queue_ms": ticket.queue_ms},
+                "context": ctx,
+            }
+            await sync_to_async(idempotency.finish)(rec, 200, done, outcome)
+            yield _sse("done", done)
+        finally:
+            # 클라이언트가 끊겨 취소돼도 여기서 놓는다 (시작도 안 한 스트림은 응답 close 가)
+            await sync_to_async(closing.close)()
+
+    resp = StreamingHttpResponse(_AsyncClosingStream(events(), closing), content_type="text/event-stream; charset=utf-8")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"
+    return resp
+
+
+@require_POST
+@login_required
+async def chat_send_async(request: HttpRequest):
+    """
+    chat_send의 ASGI 버전. GPU를 기다리는 동안 이벤트 루프만 양보하므로
+    한 워커 프로세스가 수백 개의 LLM 호출을 동시에 대기할 수 있다.
+    DB 단계는 chat_send와 같은 짧은 트랜잭션을 sync_to_async로 감싼다.
+    """
+    user = await request.auser()
+    content = (request.POST.get("message") or "").strip()
+    conv_id = request.POST.get("conversation_id")
+    if not content:
+        return JsonResponse({"ok": False, "error": "message is empty"}, status=400)
+
+    key = idempotency.request_key(request)
+    if key is None:
+        return await _achat_turn(request, user, content, conv_id)
+    try:
+        rec, replay = await idempotency.aclaim(user.pk, key, idempotency.fingerprint(conv_id, content))
+    except IdempotencyConflict as e:
+        return _idempotency_conflict(e)
+    if replay is not None:
+        return _replayed(replay)
+    try:
+        resp = await _achat_turn(request, user, content, conv_id)
+    except BaseException:
+        await sync_to_async(idempotency.release)(rec)
+        raise
+    await sync_to_async(idempotency.finish)(rec, resp.status_code, json.loads(resp.content),
+                                            getattr(resp, "llm_outcome", "ok"))
+    return resp
+
+
+async def _achat_turn(request: HttpRequest, user, content: str, conv_id) -> JsonResponse:
+    session_key = await sync_to_async(_ensure_session_key)(request)
+    unavailable = _upstream_unavailable()
+    if unavailable is not None:
+        return unavailable
+
+    conv = await _aresolve_conversation(user, conv_id, session_key)
+    if conv is None:
+        return JsonResponse({"ok": False, "error": "conversation not found"}, status=404)
+
+    stack = AsyncExitStack()
+    try:
+        ticket = await stack.enter_async_context(get_admission().aadmit(user.pk))
+    except AdmissionRejected as e:
+        return _too_many_requests(e)
+
+    async with stack:
+        _log_queue(conv, ticket)
+        history = await sync_to_async(_start_turn)(conv, content)
+
+        start = time.time()
+        messages, attachments, ctx = await sync_to_async(_build_context)(conv, history)
+        params = _llm_params(user, conv, attachments)
+        cache_key, reply = await sync_to_async(_cache_lookup)(user, conv, messages, params, ctx)
+
+        outcome = "cache"
+        if reply is None:
+            try:
+                result = await AsyncLLMClient().chat(messages=messages, **params)
+                reply = extract_answer(result)
+                outcome = "ok"
+                await sync_to_async(response_cache.store)(cache_key, reply, time.time() - start)
+            except Exception as e:
+                reply = f"LLM error: {e}"
+                outcome = "error"
+        elapsed_ms = int((time.time() - start) * 1000)
+        metrics.observe_llm("sync", outcome, elapsed_ms / 1000)
+
+    msg = await sync_to_async(_finish_turn)(conv, reply, bool(attachments) and not ctx["document_truncated"])
+
+    resp = JsonResponse({
+        "ok": True,
+        "conversation_id": conv.id,
+        "item": {**_message_item(msg), "elapsed_ms": elapsed_ms, "queue_ms": ticket.queue_ms},
+        "context": ctx,
+    })
+    resp.llm_outcome = outcome  # 멱등 키: "error" 로 끝난 턴은 저장하지 않는다
+    return resp
+
+
+def _hash_upload(f) -> str:
+    """Sha256UploadHandler 가 받으면서 계산한 값이 없을 때만(다른 핸들러 설정) 다시 읽어 해시."""
+    h = hashlib.sha256()
+    for chunk in f.chunks():
+        h.update(chunk)
+    if hasattr(f, "seek"):
+        f.seek(0)
+    return h.hexdigest()
+
+
+def _store_upload(user, conv: Conversation, f, digest: str = None) -> BackgroundJob:
+    """
+    요청 스레드에서는 S3 저장까지만 하고 바로 응답한다.
+    PDF→Markdown 추출과 RunPod 인덱싱은 BackgroundJob(pdf_upload)으로 워커가 처리.
+    같은 PDF(sha256)를 추출한 적이 있으면 추출 결과(와 허용되는 경우 S3 객체)를 재사용한다.
+    """
+    base_name = (f.name or "").rsplit("/", 1)[-1]
+    metrics.observe_upload(f.size)
+    digest = digest or _hash_upload(f)
+    cached = PdfExtraction.objects.filter(source_sha256=digest).first()
+    share_s3 = cached and cached.s3_key and (cached.owner_id == user.id or getattr(settings, "PDF_CACHE_SHARE_S3", False))
+
+    # 1) S3 업로드 (DB에는 비서명 URL 저장)
+    if share_s3:
+        conv.s3_key = cached.s3_key
+        conv.uploaded_pdf_url = object_url(cached.s3_key)
+    else:
+        conv.uploaded_pdf_url = upload_file(f, f.name, prefix=f"uploads/{user.id}/{conv.id}/")
+        conv.s3_key = s3_key_from_url(conv.uploaded_pdf_url) or ""
+    conv.title = base_name[:10] if base_name else "새 채팅"
+    # 인덱싱 성공 전까지는 system 첨부를 계속 쓰고 싶으므로 False 유지
+    conv.pdf_context_attached = False
+    if cached:
+        # 2) 추출 캐시 적중 → 워커는 인덱싱만 (RunPod 인덱스는 session 단위라 재사용 불가)
+        conv.document_id = cached.document_id
+        PdfExtraction.objects.filter(pk=cached.pk).update(
+            hits=F("hits") + 1,
+            bytes_saved=F("bytes_saved") + f.size * (2 if share_s3 else 1),
+            last_hit_at=timezone.now(),
         )
-        reply = (result.get("answer") or
-                 result.get("choices", [{}])[0].get("message", {}).get("content") or
-                 "")
-    except Exception as e:
-        reply = f"LLM error: {e}"
-    elapsed_ms = int((time.time() - start) * 1000)
 
-    msg = Message.objects.create(conversation=conv, role="assistant", content=reply)
-    if attachments:
-        conv.pdf_context_attached = True
-        conv.save(update_fields=["pdf_context_attached", "updated_at"])
+    with transaction.atomic():
+        conv.save(update_fields=["uploaded_pdf_url", "s3_key", "title", "document", "pdf_context_attached", "updated_at"])
+        # 2) 추출 + 3) RunPod 인덱싱 (동일한 user_id / session_id!) 은 워커에서
+        job = enqueue("pdf_upload", conv, {
+            "s3_key": conv.s3_key,
+            "file_name": base_name or "upload.pdf",
+            "user_id": str(user.email or user.username or user.id),
+            "source_sha256": digest,
+            "source_size": f.size,
+            "owner_id": user.id,
+        })
+    if getattr(settings, "JOBS_RUN_INLINE", False):
+        # 워커 없이 돌리는 로컬 개발용
+        job = run_inline(job)
+    return job
+
 
+def _upload_response(conv: Conversation, job: BackgroundJob) -> JsonResponse:
+    # 화면에는 presigned URL
     return JsonResponse({
         "ok": True,
+        "url": _presign_if_s3(conv.uploaded_pdf_url),
         "conversation_id": conv.id,
-        "item": {
-            "id": msg.id,
-            "role": msg.role,
-            "content": msg.content,
-            "created_at": msg.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            "elapsed_ms": elapsed_ms,
-        },
+        "title": conv.title,
+        "job_id": job.id,
+        "status": job.status,
     })
 
 
@@ -227,57 +875,57 @@ def file_upload(request: HttpRequest):
     if conv.uploaded_pdf_url:
         return JsonResponse({"ok": False, "error": "이미 PDF가 업로드되었습니다."}, status=400)
 
-    # bytes 미리 읽고, 다시 포인터 복귀
-    data_bytes = None
-    try:
-        data_bytes = f.read()
-        if hasattr(f, "seek"):
-            f.seek(0)
-    except Exception:
-        data_bytes = None
+    job = _store_upload(request.user, conv, f, getattr(request, "upload_sha256", {}).get("file"))
+    return _upload_response(conv, job)
 
-    # 1) S3 업로드 (DB에는 비서명 URL 저장)
-    base_url = upload_file(f, f.name, prefix=f"uploads/{request.user.id}/{conv.id}/")
-    base_name = (f.name or "").rsplit("/", 1)[-1]
-    title_from_pdf = base_name[:10] if base_name else "새 채팅"
-    conv.uploaded_pdf_url = base_url
-    conv.title = title_from_pdf
 
-    # 2) PDF→Markdown 추출(있으면)
-    try:
-        if data_bytes:
-            conv.pdf_context_md = pdf_bytes_to_markdown(data_bytes)
-            # 인덱싱 성공 전까지는 system 첨부를 계속 쓰고 싶으므로 False 유지
-            conv.pdf_context_attached = False
-    except Exception:
-        pass
+@require_POST
+@login_required
+async def file_upload_async(request: HttpRequest):
+    """file_upload의 ASGI 버전. S3 업로드(boto3, 동기)만 스레드로 돌리고 나머지는 워커가 처리."""
+    f = request.FILES.get("file")
+    if not f:
+        return JsonResponse({"ok": False, "error": "no file"}, status=400)
+    if f.size > 10 * 1024 * 1024:
+        return JsonResponse({"ok": False, "error": "파일 크기 제한(10MB) 초과"}, status=400)
 
-    # 3) RunPod 인덱싱 호출 (동일한 user_id / session_id!)
-    ingest_ok = False
-    try:
-        rp_base = getattr(settings, "RUNPOD_API_BASE", "").rstrip("/")
-        if rp_base and data_bytes:
-            files = {"file": (base_name or "upload.pdf", data_bytes, "application/pdf")}
-            data = {
-                "user_id": str(request.user.email or request.user.username or request.user.id),
-                "session_id": str(conv.id),
-                "prefer_openai": "true",
-            }
-            rp = requests.post(f"{rp_base}/v1/ingest", files=files, data=data, timeout=int(getattr(settings, "RUNPOD_TIMEOUT", 120)))
-            if rp.ok:
-                j = rp.json()
-                ingest_ok = bool(j.get("ok"))
-    except Exception:
-        ingest_ok = False
+    user = await request.auser()
+    conv_id = request.POST.get("conversation_id")
+    if not conv_id:
+        session_key = await sync_to_async(_ensure_session_key)(request)
+        conv = await Conversation.objects.acreate(user=user, session_key=session_key, title="")
+    else:
+        try:
+            conv = await Conversation.objects.aget(pk=conv_id, user=user)
+        except Conversation.DoesNotExist:
+            return JsonResponse({"ok": False, "error": "conversation not found"}, status=404)
 
-    # 인덱싱이 성공했으면 system 첨부는 안 해도 되니 True로
-    if ingest_ok:
-        conv.pdf_context_attached = True
+    if conv.uploaded_pdf_url:
+        return JsonResponse({"ok": False, "error": "이미 PDF가 업로드되었습니다."}, status=400)
 
-    conv.save(update_fields=["uploaded_pdf_url", "title", "pdf_context_md", "pdf_context_attached", "updated_at"])
+    job = await sync_to_async(_store_upload)(user, conv, f, getattr(request, "upload_sha256", {}).get("file"))
+    return await sync_to_async(_upload_response, thread_sensitive=False)(conv, job)
 
-    # 화면에는 presigned URL
-    return JsonResponse({"ok": True, "url": _presign_if_s3(conv.uploaded_pdf_url), "conversation_id": conv.id, "title": conv.title})
+
+@login_required
+def file_status(request: HttpRequest):
+    """업로드 후처리(BackgroundJob) 상태 폴링용."""
+    try:
+        job = BackgroundJob.objects.select_related("conversation").get(
+            pk=int(request.GET.get("job_id") or 0), conversation__user=request.user
+        )
+    except (BackgroundJob.DoesNotExist, ValueError):
+        return JsonResponse({"ok": False, "error": "job not found"}, status=404)
+    return JsonResponse({
+        "ok": True,
+        "job_id": job.id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "document_ready": bool(job.conversation.document_id),
+        "ingest_ok": bool((job.result or {}).get("ingest_ok")),
+        "error": job.last_error.splitlines()[0] if job.status == "failed" and job.last_error else "",
+    })
 
 
 def _read_policy_file(filename: str) -> str:
@@ -299,15 +947,60 @@ def policy_privacy(request: HttpRequest):
     return JsonResponse({"ok": True, "html": _read_policy_file("개인정보동의.txt")})
 
 
+def _encode_conv_cursor(updated_at, pk) -> str:
+    return urlsafe_base64_encode(f"{updated_at.isoformat()}|{pk}".encode())
+
+
+def _decode_conv_cursor(cursor: str):
+    raw = urlsafe_base64_decode(cursor).decode()
+    ts, pk = raw.rsplit("|", 1)
+    return datetime.fromisoformat(ts), int(pk)
+
+
+def _conversations_etag(request: HttpRequest) -> str:
+    # (개수, 최신 updated_at) 이 같으면 목록이 같다: 이름변경/새 메시지는 updated_at, 삭제는 개수로 감지
+    # (user, updated_at, id) 인덱스만으로 계산되는 가벼운 집계
+    agg = Conversation.objects.filter(user=request.user).aggregate(n=Count("id"), last=Max("updated_at"))
+    last = agg["last"].isoformat() if agg["last"] else "-"
+    return f'{agg["n"]}-{last}-{request.GET.urlencode()}'
+
+
 @login_required
+@condition(etag_func=_conversations_etag)
 def conversations_list(request: HttpRequest):
+    """
+    사이드바 목록. id/title/updated_at 만 읽는다(업로드 URL 등 나머지 컬럼 제외).
+    - limit / cursor(다음 페이지 토큰)로 (updated_at, id) keyset 페이지네이션
+    - ETag: 목록이 바뀌지 않았으면 304
+    """
     _ensure_session_key(request)
-    qs = Conversation.objects.filter(user=request.user).order_by("-updated_at", "-id")
-    data = [
-        {"id": c.id, "title": c.title or "새 채팅", "updated_at": c.updated_at.strftime("%Y-%m-%d %H:%M:%S")}
-        for c in qs
-    ]
-    return JsonResponse({"ok": True, "items": data})
+    try:
+        limit = max(1, min(int(request.GET.get("limit") or CONVERSATIONS_PAGE_SIZE), CONVERSATIONS_PAGE_MAX))
+        cursor = _decode_conv_cursor(request.GET["cursor"]) if request.GET.get("cursor") else None
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({"ok": False, "error": "invalid cursor"}, status=400)
+
+    qs = Conversation.objects.filter(user=request.user)
+    if cursor:
+        ts, pk = cursor
+        qs = qs.filter(Q(updated_at__lt=ts) | Q(updated_at=ts, id__lt=pk))
+    rows = list(qs.order_by("-updated_at", "-id").values("id", "title", "updated_at")[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    with span("serialize"):
+        data = [
+            {"id": c["id"], "title": c["title"] or "새 채팅", "updated_at": c["updated_at"].strftime("%Y-%m-%d %H:%M:%S")}
+            for c in rows
+        ]
+        resp = JsonResponse({
+            "ok": True,
+            "items": data,
+            "next_cursor": _encode_conv_cursor(rows[-1]["updated_at"], rows[-1]["id"]) if has_more else None,
+        })
+    # 브라우저가 매번 If-None-Match로 재검증하도록
+    resp["Cache-Control"] = "private, no-cache"
+    return resp
 
 
 @require_POST
@@ -342,3 +1035,18 @@ def conversations_delete(request: HttpRequest):
         return JsonResponse({"ok": False, "error": "conversation not found"}, status=404)
     conv.delete()
     return JsonResponse({"ok": True})
+
+
+def metrics_view(request: HttpRequest):
+    """
+    Prometheus 스크레이프 (/metrics). 워커 간 합산은 utils/metrics.py 참고.
+    METRICS_TOKEN 이 있으면 Authorization: Bearer <token> 필요. nginx 는 /metrics 를 막는다(nginx/default.conf)
+    → Prometheus 는 내부망에서 web:8000 으로 직접.
+    """
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and request.headers.get("Authorization", "") != f"Bearer {token}":
+        return JsonResponse({"ok": False, "error": "forbidden"}, status=403)
+    if not metrics.enabled():
+        return JsonResponse({"ok": False, "error": "prometheus_client is not installed"}, status=503)
+    body, content_type = metrics.render()
+    return HttpResponse(body, content_type=content_type)
@@ -37,6 +37,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "llm_integration.llmproxy.middleware.ServerTimingMiddleware",  # 맨 바깥: 다른 미들웨어 시간까지 total 에 포함
+    "llm_integration.llmproxy.middleware.TrafficCaptureMiddleware",  # TRAFFIC_CAPTURE_PATH 없으면 빠진다
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -131,3 +133,126 @@ AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY", "")
 # RunPod
 RUNPOD_API_BASE = os.getenv("RUNPOD_API_BASE", "").rstrip("/")
 RUNPOD_TIMEOUT = int(os.getenv("RUNPOD_TIMEOUT", "120"))
+# RunPod 커넥션 풀 (프로세스당 공유 세션)
+RUNPOD_POOL_CONNECTIONS = int(os.getenv("RUNPOD_POOL_CONNECTIONS", "4"))   # 호스트별 풀 개수
+RUNPOD_POOL_MAXSIZE = int(os.getenv("RUNPOD_POOL_MAXSIZE", "16"))          # 풀당 최대 keep-alive 연결
+RUNPOD_KEEPALIVE_IDLE = int(os.getenv("RUNPOD_KEEPALIVE_IDLE", "60"))      # TCP keepalive 시작(초)
+
+# ASGI 모드 (gunicorn.conf.py 의 ASYNC_MODE 와 같은 값): chat_send / file_upload 를 async 뷰로 연결
+LLM_ASYNC_VIEWS = os.getenv("ASYNC_MODE", "0") == "1"
+RUNPOD_ASYNC_MAX_CONNECTIONS = int(os.getenv("RUNPOD_ASYNC_MAX_CONNECTIONS", str(RUNPOD_POOL_MAXSIZE * 8)))
+
+# presigned URL 캐시 (프로세스 메모리 LRU)
+S3_PRESIGN_CACHE_SIZE = int(os.getenv("S3_PRESIGN_CACHE_SIZE", "1024"))
+S3_PRESIGN_MIN_REMAINING = int(os.getenv("S3_PRESIGN_MIN_REMAINING", "300"))  # 남은 유효시간이 이보다 짧으면 재서명
+
+# 백그라운드 작업 큐 (python manage.py run_jobs)
+JOBS_RUN_INLINE = os.getenv("JOBS_RUN_INLINE", "0") == "1"   # 워커 없이 요청 안에서 바로 실행(로컬 개발용)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_LOCK_TIMEOUT = int(os.getenv("JOB_LOCK_TIMEOUT", "600"))      # running 상태로 이보다 오래 멈춘 작업은 회수
+JOB_PURGE_INTERVAL = float(os.getenv("JOB_PURGE_INTERVAL", "600"))  # run_jobs 가 만료된 멱등 키/응답 캐시를 지우는 주기(초)
+
+# PDF 추출 엔진 (페이지 청크 단위 병렬 추출 + 문서당 예산)
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_EXTRACT_CHUNK_PAGES = int(os.getenv("PDF_EXTRACT_CHUNK_PAGES", "16"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "500"))
+PDF_EXTRACT_TIME_BUDGET = float(os.getenv("PDF_EXTRACT_TIME_BUDGET", "60"))  # 초
+PDF_EXTRACT_KILL_GRACE = float(os.getenv("PDF_EXTRACT_KILL_GRACE", "5"))     # 예산 뒤에도 안 끝난 청크를 기다리는 초 → 넘으면 풀 재시작
+
+# 추출 캐시: 같은 PDF를 다른 사용자가 올렸을 때 최초 업로더의 S3 객체까지 재사용할지
+PDF_CACHE_SHARE_S3 = os.getenv("PDF_CACHE_SHARE_S3", "0") == "1"
+
+# 업로드: 받는 동안 sha256 계산 → 2.5MB 넘으면 임시 파일로 스풀(메모리에 전체 사본 X)
+FILE_UPLOAD_HANDLERS = [
+    "llm_integration.llmproxy.utils.upload_handlers.Sha256UploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv("FILE_UPLOAD_MAX_MEMORY_SIZE", str(2621440)))
+# S3 전송: 이 크기부터 multipart, 파트 단위로 스트리밍 (업/다운로드 공통)
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024)))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "4"))
+
+# LLM 컨텍스트 토큰 예산 (utils/context.py, 근사 토큰 수 기준)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))            # history + 문서 (max_tokens 별도)
+CONTEXT_HISTORY_SHARE = float(os.getenv("CONTEXT_HISTORY_SHARE", "0.4"))         # 문서가 있을 때 history 몫
+CONTEXT_HISTORY_MAX_MESSAGES = int(os.getenv("CONTEXT_HISTORY_MAX_MESSAGES", "20"))
+CONTEXT_CHUNK_TOKENS = int(os.getenv("CONTEXT_CHUNK_TOKENS", "400"))             # 문서 청크 최대 크기
+
+# llmproxy 로그 (컨텍스트 토큰 통계 등)
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        # 요청/턴마다 한 줄씩 남는 INFO 로그(request timing, llm context, llm admission)는 기본 끔(WARNING)
+        # → 배포 이미지(Dockerfile ENV)에서만 INFO. 테스트/로컬 실행 출력이 묻히지 않게
+        "llm_integration.llmproxy": {"handlers": ["console"], "level": os.getenv("LLMPROXY_LOG_LEVEL", "WARNING")},
+        "llm_integration.llmproxy.timing": {"level": os.getenv("LLMPROXY_TIMING_LOG_LEVEL", "WARNING")},
+    },
+}
+
+# 로컬 BM25 검색: 질문당 첨부할 문서 청크 수 (토큰 예산 안에서)
+CONTEXT_TOP_K = int(os.getenv("CONTEXT_TOP_K", "6"))
+
+# 대화 요약: 요약 이후 메시지가 KEEP + EVERY 개가 되면 summarize 작업으로 최근 KEEP 개만 남기고 접는다
+CONVERSATION_SUMMARY_EVERY = int(os.getenv("CONVERSATION_SUMMARY_EVERY", "6"))    # 0이면 끔
+CONVERSATION_SUMMARY_KEEP = int(os.getenv("CONVERSATION_SUMMARY_KEEP", "6"))
+CONVERSATION_SUMMARY_MAX_MESSAGES = int(os.getenv("CONVERSATION_SUMMARY_MAX_MESSAGES", "40"))  # 작업 1회당
+CONVERSATION_SUMMARY_MAX_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_MAX_TOKENS", "400"))
+
+# RunPod 호출 보호 (utils/resilience.py). RUNPOD_TIMEOUT 은 읽기 타임아웃
+RUNPOD_CONNECT_TIMEOUT = float(os.getenv("RUNPOD_CONNECT_TIMEOUT", "5"))
+RUNPOD_RETRIES = int(os.getenv("RUNPOD_RETRIES", "2"))                   # 연결 실패/502·503·504 만 재시도
+RUNPOD_RETRY_BASE = float(os.getenv("RUNPOD_RETRY_BASE", "0.5"))
+RUNPOD_RETRY_MAX_DELAY = float(os.getenv("RUNPOD_RETRY_MAX_DELAY", "4"))
+RUNPOD_BREAKER_FAILURES = int(os.getenv("RUNPOD_BREAKER_FAILURES", "5"))  # 연속 실패 → open
+RUNPOD_BREAKER_RESET = float(os.getenv("RUNPOD_BREAKER_RESET", "30"))     # open 유지(초) 후 시험 요청 1개
+RUNPOD_HEDGE_PERCENTILE = float(os.getenv("RUNPOD_HEDGE_PERCENTILE", "0"))  # 예: 95 → p95 지나면 두 번째 요청 (0=끔)
+RUNPOD_HEDGE_MIN_DELAY = float(os.getenv("RUNPOD_HEDGE_MIN_DELAY", "1"))
+RUNPOD_HEDGE_THREADS = int(os.getenv("RUNPOD_HEDGE_THREADS", "8"))
+
+# RunPod 엔드포인트 여러 개 (쉼표 구분, 비우면 RUNPOD_API_BASE 하나)
+RUNPOD_API_BASES = [b.strip().rstrip("/") for b in os.getenv("RUNPOD_API_BASES", "").split(",") if b.strip()]
+RUNPOD_LB_STRATEGY = os.getenv("RUNPOD_LB_STRATEGY", "least_outstanding")    # least_outstanding | latency
+RUNPOD_SESSION_AFFINITY = os.getenv("RUNPOD_SESSION_AFFINITY", "1") == "1"   # session_id → 같은 pod (ingest 인덱스)
+RUNPOD_HEALTH_INTERVAL = float(os.getenv("RUNPOD_HEALTH_INTERVAL", "10"))    # GET /healthz 주기(초), 0=끔
+RUNPOD_HEALTH_TIMEOUT = float(os.getenv("RUNPOD_HEALTH_TIMEOUT", "3"))
+
+# GPU 호출 동시 실행 제한 (utils/admission.py, 워커 간 파일 락 공유)
+ADMISSION_DIR = os.getenv("ADMISSION_DIR", "/tmp/llmproxy-admission")     # 모든 워커가 같은 경로를 봐야 함
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "8"))      # 전역 동시 LLM 호출 수
+ADMISSION_PER_USER = int(os.getenv("ADMISSION_PER_USER", "2"))              # 사용자당 동시 호출 수
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))           # 전역 대기열 (넘치면 429)
+ADMISSION_PER_USER_QUEUE = int(os.getenv("ADMISSION_PER_USER_QUEUE", "2"))  # 사용자당 대기 요청 수
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "30"))           # 대기열에서 기다리는 최대 시간(초)
+JOB_ADMISSION_KEY = os.getenv("JOB_ADMISSION_KEY", "jobs")                   # 백그라운드 LLM 작업(요약)이 함께 쓰는 사용자 키
+
+# LLM 응답 캐시 (response_cache.py). 같은 문서/대화 맥락/파라미터의 반복 질문은 GPU 호출 없이 응답
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "0") == "1"
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))      # 초
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))  # 넘치면 LRU 삭제
+RESPONSE_CACHE_SHARED = os.getenv("RESPONSE_CACHE_SHARED", "0") == "1"          # 1이면 사용자 간 공유
+RESPONSE_CACHE_NEAR_DUP = os.getenv("RESPONSE_CACHE_NEAR_DUP", "0") == "1"      # 유사 질문도 적중
+RESPONSE_CACHE_NEAR_DUP_THRESHOLD = float(os.getenv("RESPONSE_CACHE_NEAR_DUP_THRESHOLD", "0.85"))
+
+# chat_send / chat_send_stream 멱등 키 (idempotency.py, Idempotency-Key 헤더)
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))                  # 끝난 응답을 재전송하는 기간(초)
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "150"))                        # 진행 중인 중복 요청이 기다리는 최대 시간
+IDEMPOTENCY_PENDING_TIMEOUT = float(os.getenv("IDEMPOTENCY_PENDING_TIMEOUT", "300"))  # 이보다 오래된 pending 은 죽은 요청으로 보고 넘겨받음
+
+# 요청별 구간 시간 (llmproxy/middleware.py): Server-Timing 헤더 + "request timing" 로그
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "1") == "1"
+
+# /metrics (Prometheus). 워커 간 합산은 gunicorn.conf.py 의 PROMETHEUS_MULTIPROC_DIR
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")   # 있으면 Authorization: Bearer <token> 필요
+# 다른 프로세스(run_jobs 컨테이너 등)의 multiprocess 디렉터리도 함께 합산 (쉼표 구분)
+METRICS_EXTRA_DIRS = [d.strip() for d in os.getenv("METRICS_EXTRA_DIRS", "").split(",") if d.strip()]
+
+# 트래픽 캡처 (TrafficCaptureMiddleware → replay_traffic 로 재생). 워커가 모두 같은 파일에 append
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH", "")                     # 비우면 캡처 안 함
+TRAFFIC_CAPTURE_PREFIX = os.getenv("TRAFFIC_CAPTURE_PREFIX", "/llm/api/")
+TRAFFIC_CAPTURE_SAMPLE = float(os.getenv("TRAFFIC_CAPTURE_SAMPLE", "1"))        # 0~1, 남길 요청 비율
+TRAFFIC_CAPTURE_BODIES = os.getenv("TRAFFIC_CAPTURE_BODIES", "0") == "1"        # 1이면 메시지 원문 저장 (개인정보 주의)
@@ -20,11 +20,14 @@ from django.views.generic import RedirectView
 from django.conf import settings
 from django.conf.urls.static import static
 
+from llm_integration.llmproxy.views import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path('', RedirectView.as_view(url='llm/')),
     path('uauth/', include('uauth.urls')),
     path('llm/', include('llm_integration.llmproxy.urls')),
+    path("metrics", metrics_view, name="metrics"),
     # path('chat/', include('chat.urls')),
     # path('files/', include('files.urls')),
 ]